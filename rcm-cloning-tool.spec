@@ -41,14 +41,54 @@ rm -rf $RPM_BUILD_ROOT
 /usr/local/bin/cloner/cloner.py
 /usr/local/bin/cloner/jira_clone_template_rcm.py
 /usr/local/bin/cloner/pav_update.py
+/usr/local/bin/cloner/session.py
 /usr/local/bin/cloner/ticket.py
 /usr/local/bin/cloner/utils.py
+/usr/local/bin/cloner/workers.py
+/usr/local/bin/cloner/scheduler.py
+/usr/local/bin/cloner/async_cloner.py
+/usr/local/bin/cloner/client.py
+/usr/local/bin/cloner/resolver.py
+/usr/local/bin/cloner/cache.py
+/usr/local/bin/cloner/traversal.py
+/usr/local/bin/cloner/compiled.py
+/usr/local/bin/cloner/fanout.py
+/usr/local/bin/cloner/journal.py
+/usr/local/bin/cloner/existing.py
+/usr/local/bin/cloner/governor.py
+/usr/local/bin/cloner/retry.py
+/usr/local/bin/cloner/listing.py
+/usr/local/bin/cloner/stats.py
+/usr/local/bin/cloner/snapshot.py
+/usr/local/bin/cloner/planner.py
 /usr/local/bin/tests/test_cloner.py
 /usr/local/bin/tests/fake_task_content.json
 /usr/local/bin/tests/fake_subtask_content.json
 /usr/local/bin/tests/test_utils.py
 /usr/local/bin/tests/test_ticket.py
 /usr/local/bin/tests/test_jira_clone_template_rcm.py
+/usr/local/bin/tests/test_session.py
+/usr/local/bin/tests/test_workers.py
+/usr/local/bin/tests/test_scheduler.py
+/usr/local/bin/tests/test_async_cloner.py
+/usr/local/bin/tests/fake_jira.py
+/usr/local/bin/tests/test_resolver.py
+/usr/local/bin/tests/test_cache.py
+/usr/local/bin/tests/test_traversal.py
+/usr/local/bin/tests/test_compiled.py
+/usr/local/bin/tests/test_fanout.py
+/usr/local/bin/tests/test_journal.py
+/usr/local/bin/tests/test_existing.py
+/usr/local/bin/tests/test_governor.py
+/usr/local/bin/tests/test_retry.py
+/usr/local/bin/tests/test_pav_update.py
+/usr/local/bin/tests/test_listing.py
+/usr/local/bin/tests/test_stats.py
+/usr/local/bin/tests/test_benchmark.py
+/usr/local/bin/tests/test_snapshot.py
+/usr/local/bin/tests/test_planner.py
+/usr/local/bin/benchmarks/__init__.py
+/usr/local/bin/benchmarks/benchmark.py
 %doc LICENSE
 %changelog
 * Wed Jan 03 2018 Raksha Rajashekar <rrajashe@redhat.com> 0.8.1-1
@@ -0,0 +1,327 @@
+#!/usr/bin/env python2
+"""Benchmarks of the cloner against local stand-in JIRA server.
+
+Every scenario runs an entry point of the tool against a fresh FakeJira
+(see tests/fake_jira.py) seeded with a synthetic graph of RCMTEMPL
+templates and reports processed tickets per second and requests sent per
+operation. Latency and errors of the server can be injected, so behaviour
+of retries and concurrency can be measured too.
+
+Run from the src directory, e.g.:
+
+    $ python2 benchmarks/benchmark.py --templates 200 --latency 20
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import time
+
+from collections import OrderedDict
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (SRC_DIR, os.path.join(SRC_DIR, 'tests')):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from cloner import client, session, ticket  # noqa: E402
+from cloner.governor import configure_governors  # noqa: E402
+from cloner.jira_clone_template_rcm import (  # noqa: E402
+    search_and_clone_specific_tickets, search_tickets)
+from cloner.pav_update import append_pav_to_tickets  # noqa: E402
+from cloner.retry import configure_retries  # noqa: E402
+from cloner.stats import disable_stats, enable_stats  # noqa: E402
+from cloner.utils import prepare_inject  # noqa: E402
+from fake_jira import FakeJira, make_issue  # noqa: E402
+
+TEMPLATE_PAV = '1.0'
+TARGET_PAV = '2.0'
+LINK_TYPES = ('Blocks', 'Relates')
+# backoff of retries in seconds, shorter than default so injected errors
+# don't dominate the results
+BENCHMARK_BACKOFF = 0.05
+# allowed relative drop of throughput or growth of requests against baseline
+DEFAULT_TOLERANCE = 0.2
+
+log = logging.getLogger('benchmark')
+
+
+def make_template_graph(templates, subtasks=2, link_density=0.1,
+                        remote_links=0.2, seed=0):
+    """Create synthetic RCMTEMPL templates.
+
+    Args:
+        templates: Number of tasks
+        subtasks: Number of subtasks of every task, default 2
+        link_density: Probability that a task is linked to another task,
+                      every task is tried against every later one, default
+                      0.1
+        remote_links: Share of tasks with a remote link, default 0.2
+        seed: Seed of random links, default 0
+
+    Returns:
+        Tuple (list of issue contents, dictionary key: list of remote links)
+    """
+    rng = random.Random(seed)
+    task_keys = ['RCMTEMPL-{0}'.format(i + 1) for i in range(templates)]
+    links = dict((key, []) for key in task_keys)
+    for i, key in enumerate(task_keys):
+        for other in task_keys[i + 1:]:
+            if rng.random() < link_density:
+                link_type = rng.choice(LINK_TYPES)
+                links[key].append((other, link_type, 'outwardIssue'))
+                links[other].append((key, link_type, 'inwardIssue'))
+    issues = []
+    remote = {}
+    number = templates
+    for i, key in enumerate(task_keys):
+        subtask_keys = []
+        for position in range(subtasks):
+            number += 1
+            subtask_keys.append('RCMTEMPL-{0}'.format(number))
+            issues.append(make_issue(
+                subtask_keys[-1], summary='<PAV> subtask {0} of {1}'.format(
+                    position + 1, key),
+                issuetype='Sub-task', parent=key, pav=[TEMPLATE_PAV]))
+        issues.append(make_issue(key, summary='<PAV> task {0}'.format(i + 1),
+                                 subtasks=subtask_keys, links=links[key],
+                                 pav=[TEMPLATE_PAV]))
+        if remote_links and rng.random() < remote_links:
+            remote[key] = [{'object': {'url': 'http://doc/{0}'.format(key),
+                                       'title': 'Doc'}}]
+    return issues, remote
+
+
+def clone(bulk=False, async_requests=False):
+    """Return scenario cloning all templates into RCM."""
+    def scenario(jira, workers):
+        search_and_clone_specific_tickets(
+            TEMPLATE_PAV, None, 'RCM', prepare_inject({'PAV': TARGET_PAV}),
+            bulk=bulk, workers=workers, async_requests=async_requests)
+        return len(jira.created)
+    return scenario
+
+
+def pav_update(jira, workers):
+    """Append PAV to all templates."""
+    append_pav_to_tickets(TEMPLATE_PAV, TARGET_PAV, workers=workers)
+    return len([issue for issue in jira.issues.values()
+                if {'value': TARGET_PAV} in
+                issue['fields']['customfield_11911']])
+
+
+def search(jira, workers):
+    """Search keys of all templates."""
+    query = 'project=RCMTEMPL and "Product Affects Version"="{0}"'.format(
+        TEMPLATE_PAV)
+    return len(ticket.Ticket().search(query))
+
+
+def search_listing(jira, workers):
+    """List all templates as with --type search --format ndjson."""
+    with open(os.devnull, 'w') as out:
+        return search_tickets(log, TEMPLATE_PAV, None, output_format='ndjson',
+                              out=out)
+
+
+SCENARIOS = OrderedDict([
+    ('clone', clone()),
+    ('clone-bulk', clone(bulk=True)),
+    ('clone-async', clone(async_requests=True)),
+    ('pav-update', pav_update),
+    ('search', search),
+    ('search-listing', search_listing),
+])
+
+
+def run_scenario(name, graph, workers=8, latency=0, error_rate=0, seed=0):
+    """Run scenario against fresh local JIRA.
+
+    Args:
+        name: Key of SCENARIOS
+        graph: Tuple returned by make_template_graph()
+        workers: Number of workers passed to the entry point, default 8
+        latency: Average latency of the server in seconds, default 0
+        error_rate: Probability of failed request, default 0
+        seed: Seed of injected latencies and errors, default 0
+
+    Returns:
+        OrderedDict with number of processed tickets, seconds, tickets per
+        second, number of requests, failed requests and requests per
+        operation
+    """
+    issues, remote_links = graph
+    jira = FakeJira(issues=json.loads(json.dumps(issues)),
+                    remote_links=json.loads(json.dumps(remote_links)),
+                    latency=latency, error_rate=error_rate, seed=seed)
+    jira.start()
+    urls = ticket.STAGE_URL, client.STAGE_URL
+    ticket.STAGE_URL = client.STAGE_URL = jira.url
+    session.close_sessions()
+    configure_governors(rate=None)
+    stats = enable_stats()
+    try:
+        start = time.time()
+        tickets = SCENARIOS[name](jira, workers)
+        elapsed = time.time() - start
+    finally:
+        disable_stats()
+        session.close_sessions()
+        ticket.STAGE_URL, client.STAGE_URL = urls
+        jira.stop()
+    operations = stats.summary()
+    return OrderedDict([
+        ('scenario', name),
+        ('tickets', tickets),
+        ('seconds', round(elapsed, 3)),
+        ('tickets_per_second', round(tickets / elapsed, 1) if elapsed
+         else None),
+        ('requests', len(jira.requests)),
+        ('errors', sum(op['errors'] for op in operations.values())),
+        ('operations', OrderedDict((operation, op['count'])
+                                   for operation, op in operations.items())),
+    ])
+
+
+def format_report(results):
+    """Return results as lines of text table."""
+    header = ('scenario', 'tickets', 'seconds', 'tickets/s', 'requests',
+              'errors')
+    rows = [header] + [
+        (r['scenario'], str(r['tickets']), '{0:.2f}'.format(r['seconds']),
+         str(r['tickets_per_second']), str(r['requests']), str(r['errors']))
+        for r in results]
+    widths = [max(len(row[i]) for row in rows) for i in range(len(header))]
+    lines = ['  '.join(cell.ljust(width) if i == 0 else cell.rjust(width)
+                       for i, (cell, width) in enumerate(zip(row, widths)))
+             for row in rows]
+    for result in results:
+        lines.append('{0}: {1}'.format(result['scenario'], ', '.join(
+            '{0} {1}'.format(operation, count)
+            for operation, count in result['operations'].items())))
+    return lines
+
+
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """Compare results with results of previous run.
+
+    Args:
+        results: List of results returned by run_scenario()
+        baseline: List of results of previous run
+        tolerance: Allowed relative drop of tickets per second or growth of
+                   number of requests, default DEFAULT_TOLERANCE
+
+    Returns:
+        List of messages describing regressions, empty if there are none
+    """
+    previous = dict((r['scenario'], r) for r in baseline)
+    regressions = []
+    for result in results:
+        old = previous.get(result['scenario'])
+        if old is None:
+            continue
+        if old['tickets_per_second'] and result['tickets_per_second'] < \
+                old['tickets_per_second'] * (1 - tolerance):
+            regressions.append('{0}: {1} tickets/s, was {2}'.format(
+                result['scenario'], result['tickets_per_second'],
+                old['tickets_per_second']))
+        if result['requests'] > old['requests'] * (1 + tolerance):
+            regressions.append('{0}: {1} requests, was {2}'.format(
+                result['scenario'], result['requests'], old['requests']))
+    return regressions
+
+
+def create_parser():
+    """Create parser with all required arguments.
+
+    Returns:
+        argparse.ArgumentParser object with all args
+    """
+    parser = argparse.ArgumentParser(
+        description="Benchmark the cloner against local stand-in JIRA")
+    parser.add_argument("--scenario", action="append",
+                        choices=list(SCENARIOS),
+                        help="Scenario to run, can be used multiple times, "
+                             "default all")
+    parser.add_argument("--templates", type=int, default=50,
+                        help="Number of template tasks, default 50")
+    parser.add_argument("--subtasks", type=int, default=2,
+                        help="Number of subtasks of every task, default 2")
+    parser.add_argument("--link-density", type=float, default=0.05,
+                        help="Probability that two tasks are linked, "
+                             "default 0.05")
+    parser.add_argument("--remote-links", type=float, default=0.2,
+                        help="Share of tasks with a remote link, default 0.2")
+    parser.add_argument("--latency", type=float, default=0,
+                        help="Average latency of the server in milliseconds, "
+                             "default 0")
+    parser.add_argument("--error-rate", type=float, default=0,
+                        help="Probability that request fails with 502, "
+                             "default 0")
+    parser.add_argument("--workers", type=int, default=8,
+                        help="Number of workers of the entry points, "
+                             "default 8")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="Seed of the graph, latencies and errors, "
+                             "default 0")
+    parser.add_argument("--json", metavar="PATH",
+                        help="Write results also as JSON to PATH")
+    parser.add_argument("--baseline", metavar="PATH",
+                        help="JSON results of previous run, exit with status "
+                             "1 if throughput or number of requests of a "
+                             "scenario got worse")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="Allowed relative change against --baseline, "
+                             "default {0}".format(DEFAULT_TOLERANCE))
+    parser.add_argument("--debug", action="store_true",
+                        help="Print debug messages of the cloner.")
+    return parser
+
+
+def main():
+    args = create_parser().parse_args()
+    # ticketutil configures root logger on import, messages of the cloner
+    # are shown only with --debug
+    logging.getLogger().setLevel(logging.DEBUG if args.debug else
+                                 logging.WARNING)
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    log.addHandler(handler)
+    log.setLevel(logging.INFO)
+    log.propagate = False
+    configure_retries(backoff=BENCHMARK_BACKOFF)
+    graph = make_template_graph(args.templates, subtasks=args.subtasks,
+                                link_density=args.link_density,
+                                remote_links=args.remote_links,
+                                seed=args.seed)
+    log.info('{0} templates, {1} links, latency {2} ms, error rate '
+             '{3}'.format(len(graph[0]), sum(
+                 len(issue['fields']['issuelinks'])
+                 for issue in graph[0]) // 2, args.latency, args.error_rate))
+    results = []
+    for name in args.scenario or SCENARIOS:
+        results.append(run_scenario(name, graph, workers=args.workers,
+                                    latency=args.latency / 1000.0,
+                                    error_rate=args.error_rate,
+                                    seed=args.seed))
+    for line in format_report(results):
+        log.info(line)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+            f.write('\n')
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f),
+                                  tolerance=args.tolerance)
+        for regression in regressions:
+            log.error('Regression: {0}'.format(regression))
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+"""Module with Cloner variant that uses non-blocking JIRA client."""
+
+import threading
+
+from collections import defaultdict
+
+from client import Future, JiraClient, DEFAULT_MAX_IN_FLIGHT
+from cloner import Cloner
+from existing import ORIGIN_COMMENT
+from retry import error_detail
+
+
+class AsyncCloner(Cloner):
+    """Cloner that submits requests without waiting for each of them.
+
+    Public API is the same as the one of Cloner, clone_tickets() and
+    link_tickets() return once all submitted requests are finished. Tickets
+    are created as soon as their parent exists, subtasks of one parent are
+    created in their original order. Remote links are added as soon as
+    their ticket exists, comment with origin once all remote links were
+    added. Creating requests are sent again after
+    ambiguous failure only if idempotency check of Ticket shows that nothing
+    was written, failed requests are logged and stored in self._failed.
+
+    Args:
+        tickets: List of Ticket objects
+        project: String project key in JIRA in which new ticket is created
+        client: JiraClient instance, default client for server chosen by prod
+        max_in_flight: Maximal number of requests in flight at the same time
+                       if client is not passed, default DEFAULT_MAX_IN_FLIGHT
+        kwargs: Other keyword arguments of Cloner
+    """
+
+    def __init__(self, tickets, project, client=None,
+                 max_in_flight=DEFAULT_MAX_IN_FLIGHT, **kwargs):
+        Cloner.__init__(self, tickets, project, **kwargs)
+        self.max_in_flight = max_in_flight
+        self._client = client
+        self._checker = None
+
+    @property
+    def client(self):
+        """Return JiraClient, create it on first use."""
+        if self._client is None:
+            self._client = JiraClient.for_server(
+                prod=self.prod, max_in_flight=self.max_in_flight)
+        return self._client
+
+    @property
+    def checker(self):
+        """Return Ticket object in target project used for idempotency
+        checks of creating requests, create it on first use.
+        """
+        if self._checker is None:
+            self._checker = self._new_ticket()
+        return self._checker
+
+    def clone_tickets(self):
+        """Clone tickets in self.tickets submitting requests concurrently."""
+        if self.dry_run:
+            Cloner.clone_tickets(self)
+            return
+        creator = self._new_ticket()
+        top_level = []
+        subtasks = defaultdict(list)
+        for ticket, parent_id in self.collect_tickets():
+            self._log_cloning(ticket)
+            creator.prepare_clone(
+                ticket, inject=self.inject,
+                custom_substitutions=self.custom_substitutions)
+            if parent_id is None:
+                top_level.append((ticket, creator.content))
+            else:
+                subtasks[parent_id].append((ticket, creator.content))
+        for ticket, payload in top_level:
+            self._submit_create(ticket, payload, subtasks)
+        self.client.join()
+        for ticket_id, error_message in self._failed.items():
+            self.log.error('Failed to clone {0}: {1}'.format(
+                ticket_id, error_message))
+
+    def _submit_create(self, ticket, payload, subtasks, parent_key=None,
+                       on_done=None):
+        """Submit creation of ticket, its subtasks follow once it exists.
+
+        Args:
+            ticket: Template Ticket object
+            payload: Prepared json dictionary with data of the clone
+            subtasks: Dictionary parent's ID: list of tuples (Ticket,
+                      payload) of its subtasks
+            parent_key: ID of parent's clone for subtasks, default None
+            on_done: Function called after ticket is created or failed,
+                     default None
+        """
+        if parent_key is not None:
+            payload['fields']['parent'] = {'key': parent_key}
+
+        def created(future):
+            try:
+                error = future.exception()
+                if error is not None:
+                    self._failed[ticket.ticket_id] = str(error)
+                    for subtask, _ in subtasks.get(ticket.ticket_id, []):
+                        self._failed[subtask.ticket_id] = \
+                            'Parent {0} was not cloned'.format(
+                                ticket.ticket_id)
+                else:
+                    key = future.result()['key']
+                    if ticket.ticket_id not in self._existing:
+                        self._record_clone(ticket, key)
+                    self._cloned[ticket.ticket_id] = key
+                    self._when_succeeded(
+                        self._submit_remote_links(ticket, key),
+                        lambda: self._submit_comment(ticket, key))
+                    self._submit_subtasks(
+                        subtasks.get(ticket.ticket_id, []), subtasks, key)
+            finally:
+                # following siblings are submitted even if this one broke
+                if on_done is not None:
+                    on_done()
+
+        if ticket.ticket_id in self._existing:
+            # cloned by previous run
+            future = Future()
+            future.set_result({'key': self._existing[ticket.ticket_id]})
+        else:
+            future = self.client.create_issue(
+                payload, check=self.checker._find_created)
+        future.add_done_callback(created)
+
+    def _submit_subtasks(self, siblings, subtasks, parent_key):
+        """Submit creation of subtasks one after another to keep order.
+
+        Args:
+            siblings: List of tuples (Ticket, payload) of subtasks of one
+                      parent
+            subtasks: Dictionary parent's ID: list of tuples (Ticket,
+                      payload) of its subtasks
+            parent_key: ID of parent's clone
+        """
+        if not siblings:
+            return
+        ticket, payload = siblings[0]
+        self._submit_create(
+            ticket, payload, subtasks, parent_key=parent_key,
+            on_done=lambda: self._submit_subtasks(siblings[1:], subtasks,
+                                                  parent_key))
+
+    def _submit_remote_links(self, ticket, key):
+        """Submit copying remote links of template to its clone.
+
+        Remote links of templates are already prefetched when templates are
+        resolved.
+
+        Args:
+            ticket: Template Ticket object
+            key: ID of the clone
+
+        Returns:
+            List of Future objects of submitted requests
+        """
+        if self._is_done('remote_links', ticket):
+            return []
+        futures = [self.client.create_remote_link(
+            key, link, check=self.checker._find_remote_link)
+            for link in ticket.remote_links or []]
+        for future in futures:
+            future.add_done_callback(self._failure_logger(
+                ticket.ticket_id, 'Copying remote link to {0}'.format(key)))
+        self._record_when_done(futures, 'remote_links', ticket)
+        return futures
+
+    def _submit_comment(self, ticket, key):
+        """Submit adding comment with origin to the clone.
+
+        Args:
+            ticket: Template Ticket object
+            key: ID of the clone
+        """
+        if self._is_done('comment', ticket):
+            return
+        future = self.client.add_comment(
+            key, ORIGIN_COMMENT.format(ticket.ticket_id),
+            check=self.checker._find_comment)
+        future.add_done_callback(self._failure_logger(
+            ticket.ticket_id, 'Adding comment to {0}'.format(key)))
+        self._record_when_done([future], 'comment', ticket)
+
+    def _failure_logger(self, ticket_id, action):
+        """Return callback logging failed request and storing its error in
+        self._failed.
+
+        Args:
+            ticket_id: ID of the template the request belongs to
+            action: Description of the request used in the message
+        """
+        def log_failure(future):
+            error = future.exception()
+            if error is None:
+                return
+            error_message = '{0} failed: {1}'.format(action,
+                                                     error_detail(error))
+            self.log.error(error_message)
+            self._failed.setdefault(ticket_id, error_message)
+        return log_failure
+
+    def _record_when_done(self, futures, operation, ticket):
+        """Record operation on clone of ticket to journal once all its
+        requests succeeded.
+
+        Args:
+            futures: List of Future objects of the operation's requests
+            operation: Name of the operation
+            ticket: Template Ticket object
+        """
+        if self.journal is None:
+            return
+        self._when_succeeded(futures, lambda: self.journal.record(
+            operation, template=ticket.ticket_id))
+
+    @staticmethod
+    def _when_succeeded(futures, func):
+        """Call func once all futures succeeded, it is not called if any
+        of them failed.
+
+        Args:
+            futures: List of Future objects, func is called immediately if
+                     it is empty
+            func: Function without arguments
+        """
+        state = {'remaining': len(futures), 'failed': False}
+        lock = threading.Lock()
+
+        def done(future):
+            with lock:
+                state['failed'] |= future.exception() is not None
+                state['remaining'] -= 1
+                finished = state['remaining'] == 0 and not state['failed']
+            if finished:
+                func()
+
+        if not futures:
+            func()
+        for future in futures:
+            future.add_done_callback(done)
+
+    def link_tickets(self):
+        """Create links between tickets in self._links concurrently."""
+        if self.dry_run:
+            Cloner.link_tickets(self)
+            return
+        templates = dict((clone_id, template_id) for template_id, clone_id
+                         in self._cloned.items())
+        for link in self._links_to_create():
+            clone_id_1, clone_id_2, link_type, direction = link
+            self.log.debug('Linking {0} to {1}'.format(clone_id_1, clone_id_2))
+            inward = clone_id_1 if direction == 'outwardIssue' else clone_id_2
+            outward = clone_id_1 if direction == 'inwardIssue' else clone_id_2
+            future = self.client.create_link(link_type, inward, outward,
+                                             check=self.checker._find_link)
+            future.add_done_callback(self._failure_logger(
+                templates[clone_id_1],
+                'Linking {0} to {1}'.format(clone_id_1, clone_id_2)))
+            future.add_done_callback(self._link_recorder(clone_id_1,
+                                                         clone_id_2))
+        self.client.join()
+
+    def _link_recorder(self, clone_id_1, clone_id_2):
+        """Return callback storing created link in self._linked and
+        recording it to journal.
+        """
+        def record(future):
+            if future.exception() is None:
+                self._linked.add(frozenset((clone_id_1, clone_id_2)))
+                if self.journal is not None:
+                    self.journal.record('link',
+                                        clones=[clone_id_1, clone_id_2])
+        return record
@@ -0,0 +1,201 @@
+"""Module with persistent on-disk cache of template content."""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser('~'), '.cache',
+                                  'rcm-cloning-tool', 'templates.db')
+# maximal number of cached templates per file
+DEFAULT_MAX_ENTRIES = 10000
+# templates not used for this number of seconds are evicted
+DEFAULT_MAX_AGE = 30 * 24 * 60 * 60
+# overlap of incremental refreshes in minutes to tolerate clock skew
+REFRESH_MARGIN = 10
+# version of database layout, cache with other version is dropped
+SCHEMA_VERSION = 2
+
+
+class TemplateCache(object):
+    """SQLite cache of template content keyed by server and ticket ID.
+
+    Cached content is kept valid by incremental refresh which re-fetches
+    templates updated since the previous refresh, so cache can be used
+    without asking JIRA if the template changed.
+
+    Args:
+        path: Path to the database file, default DEFAULT_CACHE_PATH
+        max_entries: Maximal number of cached templates, least recently
+                     used are evicted, default DEFAULT_MAX_ENTRIES
+        max_age: Templates not used for this number of seconds are evicted,
+                 default DEFAULT_MAX_AGE
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH,
+                 max_entries=DEFAULT_MAX_ENTRIES, max_age=DEFAULT_MAX_AGE):
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._db:
+            version = self._db.execute('PRAGMA user_version').fetchone()[0]
+            if version != SCHEMA_VERSION:
+                self._db.execute('DROP TABLE IF EXISTS templates')
+                self._db.execute('DROP TABLE IF EXISTS syncs')
+                self._db.execute('PRAGMA user_version = {0}'.format(
+                    SCHEMA_VERSION))
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS templates ('
+                'server TEXT, key TEXT, updated TEXT, content TEXT, '
+                'accessed REAL, remote_links TEXT, '
+                'PRIMARY KEY (server, key))')
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS syncs ('
+                'server TEXT PRIMARY KEY, synced REAL)')
+
+    def get(self, server, key):
+        """Return cached content of a template.
+
+        Args:
+            server: Base URL of JIRA server
+            key: Ticket ID of the template
+
+        Returns:
+            Dictionary with content of the template or None if not cached
+        """
+        with self._lock:
+            row = self._db.execute(
+                'SELECT content FROM templates WHERE server=? AND key=?',
+                (server, key)).fetchone()
+            if row is None:
+                return None
+            with self._db:
+                self._db.execute(
+                    'UPDATE templates SET accessed=? WHERE server=? AND key=?',
+                    (time.time(), server, key))
+        return json.loads(row[0])
+
+    def put(self, server, content):
+        """Store content of a template, its cached remote links are dropped
+        as they may have changed with the template.
+
+        Args:
+            server: Base URL of JIRA server
+            content: Dictionary with content of the template, has to contain
+                     'key' and full 'fields'
+        """
+        updated = content['fields'].get('updated')
+        with self._lock, self._db:
+            self._db.execute(
+                'INSERT OR REPLACE INTO templates VALUES (?, ?, ?, ?, ?, ?)',
+                (server, content['key'], updated, json.dumps(content),
+                 time.time(), None))
+
+    def get_remote_links(self, server, key):
+        """Return cached remote links of a template.
+
+        Args:
+            server: Base URL of JIRA server
+            key: Ticket ID of the template
+
+        Returns:
+            List of remote links or None if not cached
+        """
+        with self._lock:
+            row = self._db.execute(
+                'SELECT remote_links FROM templates WHERE server=? AND key=?',
+                (server, key)).fetchone()
+        if row is None or row[0] is None:
+            return None
+        return json.loads(row[0])
+
+    def put_remote_links(self, server, key, remote_links):
+        """Store remote links of a cached template, links of templates that
+        are not cached are not stored.
+
+        Args:
+            server: Base URL of JIRA server
+            key: Ticket ID of the template
+            remote_links: List of remote links
+        """
+        with self._lock, self._db:
+            self._db.execute(
+                'UPDATE templates SET remote_links=? WHERE server=? AND key=?',
+                (json.dumps(remote_links), server, key))
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute(
+                'SELECT COUNT(*) FROM templates').fetchone()[0]
+
+    def refresh(self, searcher, project='RCMTEMPL'):
+        """Re-fetch templates updated since the last refresh.
+
+        If the cache was never refreshed for the server or the last refresh
+        is older than max_age, whole cache of the server is dropped, because
+        it cannot be refreshed incrementally.
+
+        Args:
+            searcher: Ticket object of the server used for searching
+            project: Project of templates, default RCMTEMPL
+
+        Returns:
+            Number of re-fetched templates
+        """
+        server = searcher.url
+        started = time.time()
+        with self._lock:
+            row = self._db.execute('SELECT synced FROM syncs WHERE server=?',
+                                   (server,)).fetchone()
+        synced = row[0] if row else None
+        refreshed = 0
+        if synced is None or started - synced > self.max_age:
+            with self._lock, self._db:
+                self._db.execute('DELETE FROM templates WHERE server=?',
+                                 (server,))
+        else:
+            minutes = int((started - synced) / 60) + REFRESH_MARGIN
+            query = 'project={0} and updated >= -{1}m'.format(
+                project, minutes)
+            issues = searcher.search_issues(query)
+            if hasattr(issues, 'status'):
+                # keep the old sync time, so next refresh covers this one
+                logging.warning('Refreshing template cache failed, it will '
+                                'not be used.')
+                with self._lock, self._db:
+                    self._db.execute('DELETE FROM templates WHERE server=?',
+                                     (server,))
+                return 0
+            for issue in issues:
+                self.put(server, issue)
+            refreshed = len(issues)
+        with self._lock, self._db:
+            self._db.execute('INSERT OR REPLACE INTO syncs VALUES (?, ?)',
+                             (server, started))
+        self.evict()
+        logging.debug('Refreshed {0} cached templates'.format(refreshed))
+        return refreshed
+
+    def evict(self):
+        """Remove templates not used for max_age seconds and least recently
+        used templates over max_entries.
+        """
+        with self._lock, self._db:
+            self._db.execute('DELETE FROM templates WHERE accessed < ?',
+                             (time.time() - self.max_age,))
+            self._db.execute(
+                'DELETE FROM templates WHERE rowid NOT IN (SELECT rowid FROM '
+                'templates ORDER BY accessed DESC LIMIT ?)',
+                (self.max_entries,))
+
+    def close(self):
+        """Close the database."""
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,262 @@
+"""Module with non-blocking JIRA client.
+
+Requests are submitted without waiting for their responses, every request
+returns a Future. Number of requests in flight at the same time is limited,
+requests over the limit wait in a queue, so thousands of them can be
+submitted at once. Creating requests can be given an idempotency check,
+they are then sent with post_with_check() like the ones of Ticket.
+"""
+
+import logging
+import threading
+
+from multiprocessing.pool import ThreadPool
+
+import requests
+
+from retry import post_with_check
+from session import get_session
+from ticket import PROD_URL, STAGE_URL
+
+# default maximal number of requests in flight at the same time
+DEFAULT_MAX_IN_FLIGHT = 16
+
+
+class Future(object):
+    """Result of a request that may not be finished yet."""
+
+    def __init__(self):
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+        self._result = None
+        self._error = None
+        self._callbacks = []
+
+    def done(self):
+        """Return True if result is available."""
+        return self._done.is_set()
+
+    def result(self, timeout=None):
+        """Wait for the result and return it.
+
+        Args:
+            timeout: Maximal number of seconds to wait, default no limit
+
+        Returns:
+            Result of the request
+
+        Raises:
+            Exception raised by the request
+        """
+        self._done.wait(timeout)
+        if self._error is not None:
+            raise self._error
+        return self._result
+
+    def exception(self, timeout=None):
+        """Wait for the result and return exception raised by request or
+        None.
+        """
+        self._done.wait(timeout)
+        return self._error
+
+    def add_done_callback(self, callback):
+        """Call callback with this future once it is done.
+
+        If the future is already done, callback is called immediately.
+        """
+        with self._lock:
+            if not self.done():
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def set_result(self, result):
+        """Set result of the future and call its callbacks."""
+        self._finish(result, None)
+
+    def set_exception(self, error):
+        """Set exception of the future and call its callbacks."""
+        self._finish(None, error)
+
+    def _finish(self, result, error):
+        with self._lock:
+            self._result = result
+            self._error = error
+            self._done.set()
+            callbacks = self._callbacks
+            self._callbacks = []
+        for callback in callbacks:
+            try:
+                callback(self)
+            except Exception:
+                logging.exception('Error in future callback')
+
+
+class JiraClient(object):
+    """Non-blocking client for JIRA REST API.
+
+    Client uses session shared with Ticket objects of the same server.
+
+    Args:
+        url: Base URL of JIRA server
+        auth_url: URL used for authentication, default <url>/step-auth-gss
+        auth: 'kerberos' or tuple (username, password), default 'kerberos'
+        max_in_flight: Maximal number of requests in flight at the same
+                       time, default DEFAULT_MAX_IN_FLIGHT
+    """
+
+    def __init__(self, url, auth_url=None, auth='kerberos',
+                 max_in_flight=DEFAULT_MAX_IN_FLIGHT):
+        self.url = url
+        self.rest_url = '{0}/rest/api/2/issue'.format(self.url)
+        if auth_url is None:
+            auth_url = url if isinstance(auth, tuple) else \
+                '{0}/step-auth-gss'.format(self.url)
+        self.s = get_session(url, auth_url, auth=auth)
+        if self.s is None:
+            raise requests.RequestException(
+                'Error authenticating to {0}'.format(auth_url))
+        self._pool = ThreadPool(max_in_flight)
+        self._pending = 0
+        self._idle = threading.Condition()
+
+    @classmethod
+    def for_server(cls, prod=False, max_in_flight=DEFAULT_MAX_IN_FLIGHT):
+        """Create client for production or stage JIRA.
+
+        Args:
+            prod: Bool value to choose if production JIRA is used, default
+                  False
+            max_in_flight: Maximal number of requests in flight at the same
+                           time, default DEFAULT_MAX_IN_FLIGHT
+        """
+        return cls(PROD_URL if prod else STAGE_URL,
+                   max_in_flight=max_in_flight)
+
+    def submit(self, method, url, **kwargs):
+        """Submit request without waiting for response.
+
+        Args:
+            method: HTTP method
+            url: Requested URL
+            kwargs: Keyword arguments passed to requests
+
+        Returns:
+            Future with json content of the response, exception is set for
+            unsuccessful responses
+        """
+        return self._submit(self._request, method, url, kwargs)
+
+    def submit_post(self, url, payload, check=None):
+        """Submit POST request without waiting for response.
+
+        Args:
+            url: Requested URL
+            payload: Json payload
+            check: Function without arguments returning content written by
+                   previous attempt or None, see post_with_check(), default
+                   None (request is not sent again after ambiguous failure)
+
+        Returns:
+            Future with json content of the response
+        """
+        if check is None:
+            return self.submit('POST', url, json=payload)
+        return self._submit(post_with_check, self.s, url, payload, check)
+
+    def _submit(self, func, *args):
+        """Submit call of func to the pool, return Future of its result."""
+        future = Future()
+        with self._idle:
+            self._pending += 1
+        self._pool.apply_async(self._resolve, (future, func, args))
+        return future
+
+    def _resolve(self, future, func, args):
+        """Call func and resolve future with its result."""
+        try:
+            result = func(*args)
+        except Exception as e:
+            # any error, e.g. of an idempotency check, must resolve future,
+            # otherwise its waiters and callbacks would never be released
+            future.set_exception(e)
+        else:
+            future.set_result(result)
+        finally:
+            with self._idle:
+                self._pending -= 1
+                self._idle.notify_all()
+
+    def _request(self, method, url, kwargs):
+        """Perform request and return its json content."""
+        r = self.s.request(method, url, **kwargs)
+        logging.debug('{0} {1}: Status code {2}'.format(
+            method, url, r.status_code))
+        r.raise_for_status()
+        return r.json() if r.content else None
+
+    def join(self):
+        """Wait until all submitted requests, including requests submitted
+        from callbacks, are finished.
+        """
+        with self._idle:
+            while self._pending:
+                self._idle.wait()
+
+    def close(self):
+        """Wait for submitted requests and stop worker threads."""
+        self.join()
+        self._pool.close()
+        self._pool.join()
+
+    def get_issue(self, ticket_id):
+        """Request content of a ticket."""
+        return self.submit('GET', '{0}/{1}'.format(self.rest_url, ticket_id))
+
+    def create_issue(self, payload, check=None):
+        """Create ticket, future result contains 'key' of new ticket.
+
+        check is called with the payload.
+        """
+        return self.submit_post(self.rest_url, payload,
+                                check and (lambda: check(payload)))
+
+    def get_remote_links(self, ticket_id):
+        """Request list of remote links of a ticket."""
+        return self.submit('GET', '{0}/{1}/remotelink'.format(self.rest_url,
+                                                              ticket_id))
+
+    def create_remote_link(self, ticket_id, link, check=None):
+        """Create remote link, fields 'id' and 'self' are not copied.
+
+        check is called with URL of remote links of the ticket and the link.
+        """
+        link = dict((key, val) for key, val in link.items()
+                    if key not in ('id', 'self'))
+        url = '{0}/{1}/remotelink'.format(self.rest_url, ticket_id)
+        return self.submit_post(url, link,
+                                check and (lambda: check(url, link)))
+
+    def add_comment(self, ticket_id, comment, check=None):
+        """Add comment to a ticket.
+
+        check is called with URL of comments of the ticket and the comment.
+        """
+        url = '{0}/{1}/comment'.format(self.rest_url, ticket_id)
+        return self.submit_post(url, {'body': comment},
+                                check and (lambda: check(url, comment)))
+
+    def create_link(self, link_type, inward, outward, check=None):
+        """Create issue link between two tickets.
+
+        check is called with inward, outward ticket and the link type.
+        """
+        payload = {
+            "type": {"name": link_type},
+            "inwardIssue": {"key": inward},
+            "outwardIssue": {"key": outward}
+        }
+        return self.submit_post(
+            '{0}Link'.format(self.rest_url), payload,
+            check and (lambda: check(inward, outward, link_type)))
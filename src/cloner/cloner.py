@@ -1,6 +1,17 @@
+import itertools
 import logging
 
+from ticketutil.ticket import TicketException
+
+from existing import find_clones, ORIGIN_COMMENT
+from resolver import fetch_tickets, prefetch_remote_links, resolve_closure
+from scheduler import Scheduler
 from ticket import Ticket
+from traversal import Traversal
+from workers import map_concurrently, DEFAULT_WORKERS
+
+# fields of existing parent needed to position cloned subtask
+PARENT_FIELDS = ('issuetype', 'subtasks')
 
 
 class Cloner():
@@ -21,11 +32,25 @@ class Cloner():
         prod: Bool value to choose if production JIRA is used, default False
         dry_run: If True action is not performed, just logged, default False
                                   replacement
+        bulk: Bool value to choose if tickets are created with JIRA bulk
+              create endpoint, default False
+        workers: Number of threads used for cloning, if more than 1 tickets
+                 are cloned concurrently, default 1
+        templates: Dictionary ticket ID: Ticket object of already resolved
+                   templates (see get_templates()), if passed templates are
+                   not fetched again, default None
+        journal: Journal object to which finished operations are recorded,
+                 clones and operations already in it are not created again,
+                 default None
+        find_existing: Bool value to choose if clones finished by previous
+                       runs are searched for in project (and PAV of inject)
+                       and used instead of creating new ones, default False
     """
 
     def __init__(self, tickets, project, inject=None,
                  custom_substitutions=None, only_matched=False, prod=False,
-                 dry_run=False):
+                 dry_run=False, bulk=False, workers=1, templates=None,
+                 journal=None, find_existing=False):
         self.tickets = tickets
         self.project = project
         self.inject = inject
@@ -33,96 +58,455 @@ class Cloner():
         self.only_matched = only_matched
         self.prod = prod
         self.dry_run = dry_run
+        self.bulk = bulk
+        self.workers = workers
+        self.journal = journal
+        self.find_existing = find_existing
         self.log = logging.getLogger()
         if self.only_matched:
             self._ticket_ids = [ticket.ticket_id for ticket in self.tickets]
+        self._templates = dict(templates or {})
+        self._resolved = templates is not None
         self._cloned = {}
+        self._failed = {}
         self._links = []
-        self._linked = []
+        self._linked = set()
+        # clones created by previous runs, template ID: clone ID
+        self._existing = {}
+        if journal is not None:
+            self._existing.update(journal.cloned)
+            self._linked.update(journal.linked)
+        # templates whose clones were finished by previous runs
+        self._finished = set()
+        self._searched_existing = False
+        self._traversal = None
+        # IDs of templates already searched for by _get_template()
+        self._fetched = set()
+        # numbers of placeholder IDs of clones in dry run
+        self._placeholders = itertools.count(1)
+
+    def resolve_templates(self):
+        """Fetch all templates that can be cloned together with
+        self.tickets (parents, subtasks and links) before cloning starts.
+
+        Templates are fetched level by level with batched searches. When
+        cloning only matched tickets all of them are already in self.tickets,
+        so nothing is fetched. With find_existing, clones finished by
+        previous runs are then looked up. Remote links of templates that are
+        not finished are requested concurrently.
+        """
+        if not self._resolved:
+            self._templates.update((ticket.ticket_id, ticket)
+                                   for ticket in self.tickets)
+            if not self.only_matched:
+                self._templates = resolve_closure(
+                    self.tickets, prod=self.prod,
+                    custom_substitutions=self.custom_substitutions,
+                    known=self._templates)
+        if self.find_existing and not self.dry_run and \
+                not self._searched_existing:
+            self.find_existing_clones()
+        if not self._resolved:
+            if not self.dry_run:
+                prefetch_remote_links(
+                    [ticket for ticket_id, ticket in self._templates.items()
+                     if ticket_id not in self._finished])
+            self._resolved = True
+
+    def find_existing_clones(self):
+        """Look up clones of resolved templates finished by previous runs.
+
+        Found clones are used instead of creating new ones, their remote
+        links and comments are not added again and links already between
+        them are not created again. Only clones with injected PAV and
+        milestone are looked up.
+
+        Raises:
+            TicketException if clones could not be searched
+        """
+        inject = self.inject or {}
+        pav = milestone = None
+        if inject.get('customfield_11911'):
+            pav = inject['customfield_11911'][0]['value']
+        if inject.get('customfield_12000'):
+            milestone = inject['customfield_12000'][0]['value']
+        clones, linked = find_clones(self._templates, self.project, pav=pav,
+                                     milestone=milestone, prod=self.prod)
+        self._searched_existing = True
+        for template_id, clone_id in clones.items():
+            # journal of the resumed run is more up to date
+            if template_id not in self._existing:
+                self._existing[template_id] = clone_id
+                self._finished.add(template_id)
+        self._linked.update(linked)
+
+    def get_templates(self):
+        """Return resolved templates.
+
+        Returns:
+            Dictionary ticket ID: Ticket object
+        """
+        self.resolve_templates()
+        return self._templates
 
     def clone_tickets(self):
         """Clone tickets in self.tickets."""
+        self.resolve_templates()
+        if self.bulk:
+            self.clone_tickets_bulk()
+            return
+        if self.workers > 1:
+            self.clone_tickets_concurrently()
+            return
         for ticket in self.tickets:
             self.clone_ticket(ticket, only_matched=self.only_matched)
 
-    def clone_ticket(self, ticket, parent=None, only_matched=False):
-        """Clone one ticket with its parents, subtasks and links.
+    def clone_tickets_concurrently(self):
+        """Clone tickets in self.tickets on a pool of self.workers threads.
+
+        Dependency graph of all operations is built first: parent is created
+        before its subtasks, subtasks of one parent are created in their
+        original order, remote links are added after their ticket is created
+        and comment with origin after the remote links. Tickets that failed
+        to be created are stored in self._failed, their subtasks are not
+        cloned. Failed subtask doesn't stop creating of its later siblings.
+        """
+        scheduler = Scheduler(workers=self.workers)
+        last_subtask = {}
+        for ticket, parent_id in self.collect_tickets():
+            ticket_id = ticket.ticket_id
+            depends_on = []
+            after = []
+            if parent_id is not None:
+                depends_on.append(('create', parent_id))
+                if parent_id in last_subtask:
+                    after.append(('create', last_subtask[parent_id]))
+                last_subtask[parent_id] = ticket_id
+            scheduler.add(('create', ticket_id),
+                          self._create_task(ticket, parent_id), depends_on,
+                          after)
+            if self.dry_run:
+                continue
+            scheduler.add(('remote_links', ticket_id),
+                          self._remote_links_task(ticket),
+                          [('create', ticket_id)])
+            scheduler.add(('comment', ticket_id),
+                          self._comment_task(ticket),
+                          [('create', ticket_id),
+                           ('remote_links', ticket_id)])
+        scheduler.run()
+        for (operation, ticket_id), error in scheduler.failed.items():
+            self._failed.setdefault(ticket_id, str(error))
+        for operation, ticket_id in scheduler.skipped:
+            self._failed.setdefault(ticket_id, 'Parent was not cloned')
+        for ticket_id, error_message in self._failed.items():
+            self.log.error('Failed to clone {0}: {1}'.format(
+                ticket_id, error_message))
+
+    def _create_task(self, ticket, parent_id):
+        """Return function creating clone of ticket.
 
         Args:
             ticket: Ticket object to clone
-            parent: Parent's id in case we know parent ticket, default None
-            only_matched: Bool value to choose if only tickets that matched
-                          previous query (i.e. tickets in self.tickets) should
-                          be cloned, default False
+            parent_id: Parent's ticket ID or None
         """
-        if ticket.ticket_id in self._cloned:
-            return
-        if only_matched and ticket.ticket_id not in self._ticket_ids:
-            # cloning only matched tickets and this doesn't match
-            return
-        if ticket.status == 'Deprecated':
-            self.log.info('Skipped {0} as it is in deprecated state.'.format(
-                ticket.ticket_id))
+        def create():
+            self._log_cloning(ticket)
+            if self.dry_run:
+                self._cloned[ticket.ticket_id] = self._placeholder_id()
+                return
+            parent = self._cloned.get(parent_id) if parent_id else None
+            clone_id, result = self._create_clone(ticket, parent)
+            if not clone_id:
+                raise TicketException(getattr(result, 'error_message', None)
+                                      or 'Error creating ticket')
+        return create
+
+    def _create_clone(self, ticket, parent=None):
+        """Create clone of ticket unless it was cloned by previous run.
+
+        Clone is stored in self._cloned and recorded to journal.
+
+        Args:
+            ticket: Ticket object to clone
+            parent: ID of parent's clone, default None
+
+        Returns:
+            Tuple (ID of the clone or None, result of create request or None)
+        """
+        clone_id = self._existing.get(ticket.ticket_id)
+        if clone_id is not None:
+            self.log.info('Using {0} cloned from {1} before'.format(
+                clone_id, ticket.ticket_id))
+            self._cloned[ticket.ticket_id] = clone_id
+            return clone_id, None
+        new = self._new_ticket()
+        new.prepare_clone(ticket, inject=self.inject, parent=parent,
+                          custom_substitutions=self.custom_substitutions)
+        result = new.create_from_json(new.content)
+        if new.ticket_id:
+            self._cloned[ticket.ticket_id] = new.ticket_id
+            self._record_clone(ticket, new.ticket_id)
+        return new.ticket_id, result
+
+    def _record_clone(self, ticket, clone_id):
+        """Record created clone of ticket to journal."""
+        if self.journal is not None:
+            self.journal.record('create', template=ticket.ticket_id,
+                                clone=clone_id)
+
+    def _is_done(self, operation, ticket):
+        """Return True if operation on clone of ticket is in journal or the
+        clone was finished by previous run.
+        """
+        if ticket.ticket_id in self._finished:
+            return True
+        return (self.journal is not None and
+                self.journal.is_done(operation, ticket.ticket_id))
+
+    def _copy_remote_links(self, ticket):
+        """Copy remote links of ticket to its clone unless they were copied
+        by previous run.
+        """
+        if self._is_done('remote_links', ticket):
             return
-        if ticket.parent_id and ticket.parent_id not in self._cloned:
-            # if it's subtask we first need to create its parent and then
-            # subtasks are added when cloning parent task to preserve order
-            self.clone_ticket(
-                Ticket(
-                    prod=self.prod,
-                    project=self.project,
-                    ticket_id=ticket.parent_id,
-                    custom_substitutions=self.custom_substitutions
-                ),
-                only_matched=only_matched
-            )
+        remote_links = ticket.remote_links
+        if remote_links:
+            result = self._clone_of(ticket).create_remote_link(remote_links)
+            if result is not None:
+                raise TicketException(result.error_message)
+        if self.journal is not None:
+            self.journal.record('remote_links', template=ticket.ticket_id)
+
+    def _add_origin_comment(self, ticket):
+        """Add comment with origin to clone of ticket unless it was added by
+        previous run.
+        """
+        if self._is_done('comment', ticket):
             return
-        new = Ticket(
-            prod=self.prod,
-            project=self.project,
-            custom_substitutions=self.custom_substitutions
-            )
+        result = self._clone_of(ticket).add_comment(
+            ORIGIN_COMMENT.format(ticket.ticket_id))
+        if result.status == 'Failure':
+            raise TicketException(result.error_message)
+        if self.journal is not None:
+            self.journal.record('comment', template=ticket.ticket_id)
+
+    def _remote_links_task(self, ticket):
+        """Return function copying remote links of ticket to its clone."""
+        def copy_remote_links():
+            self._copy_remote_links(ticket)
+        return copy_remote_links
+
+    def _comment_task(self, ticket):
+        """Return function adding comment with origin to clone of ticket."""
+        def comment():
+            self._add_origin_comment(ticket)
+        return comment
+
+    def _clone_of(self, ticket):
+        """Return Ticket object of already created clone without content.
+
+        Args:
+            ticket: Ticket object of cloned template
+        """
+        return self._existing_ticket(self._cloned[ticket.ticket_id])
+
+    def _existing_ticket(self, ticket_id):
+        """Return Ticket object of existing ticket without requesting its
+        content.
+
+        Args:
+            ticket_id: String ID of the ticket
+        """
+        existing = self._new_ticket()
+        existing.ticket_id = ticket_id
+        existing.ticket_url = existing._generate_ticket_url()
+        return existing
+
+    def clone_tickets_bulk(self):
+        """Clone tickets in self.tickets using bulk create requests.
+
+        All tickets that are not subtasks are created in the first wave,
+        subtasks with their parents filled in from the first wave in the
+        second one. Tickets that failed to be created are stored in
+        self._failed with error message.
+        """
+        templates = self.collect_tickets()
+        top_level = [(t, p) for t, p in templates if p is None]
+        subtasks = [(t, p) for t, p in templates if p is not None]
+        self._create_wave(top_level)
+        self._create_wave(subtasks)
+        for ticket_id, error_message in self._failed.items():
+            self.log.error('Failed to clone {0}: {1}'.format(
+                ticket_id, error_message))
+
+    def _create_wave(self, templates):
+        """Create clones of templates with one bulk request per batch.
+
+        Args:
+            templates: List of tuples (Ticket, parent's ticket ID or None)
+        """
+        new = self._new_ticket()
+        payloads = []
+        prepared = []
+        created = []
+        for ticket, parent_id in templates:
+            self._log_cloning(ticket)
+            parent = None
+            if parent_id is not None:
+                parent = self._cloned.get(parent_id)
+                if parent is None:
+                    self._failed[ticket.ticket_id] = \
+                        'Parent {0} was not cloned'.format(parent_id)
+                    continue
+            if self.dry_run:
+                self._cloned[ticket.ticket_id] = self._placeholder_id()
+                continue
+            if ticket.ticket_id in self._existing:
+                self._cloned[ticket.ticket_id] = \
+                    self._existing[ticket.ticket_id]
+                created.append(ticket)
+                continue
+            new.prepare_clone(ticket, inject=self.inject, parent=parent,
+                              custom_substitutions=self.custom_substitutions)
+            payloads.append(new.content)
+            prepared.append(ticket)
+        results = new.create_bulk(payloads) if payloads else []
+        for ticket, result in zip(prepared, results):
+            if hasattr(result, 'status'):
+                self._failed[ticket.ticket_id] = result.error_message
+                continue
+            self._cloned[ticket.ticket_id] = result
+            self._record_clone(ticket, result)
+            created.append(ticket)
+        for ticket in created:
+            try:
+                self._copy_remote_links(ticket)
+                self._add_origin_comment(ticket)
+            except TicketException as e:
+                self._failed[ticket.ticket_id] = str(e)
+
+    def collect_tickets(self):
+        """Collect tickets in self.tickets with their parents, subtasks and
+        links in the order in which they would be cloned.
+
+        Links between collected tickets are stored in self._links.
+
+        Returns:
+            List of tuples (Ticket, parent's ticket ID or None)
+        """
+        self.resolve_templates()
+        return list(self.traverse(self.tickets,
+                                  only_matched=self.only_matched))
+
+    def traverse(self, tickets, seen=None, only_matched=False):
+        """Create iterative walk over tickets with their parents, subtasks
+        and links in the order in which they are cloned.
+
+        Links between visited tickets are stored in self._links. Templates
+        missing in self._templates are fetched together with all other
+        missing templates in the traversal's frontier.
+
+        Args:
+            tickets: List of Ticket objects to start from
+            seen: Set of IDs of tickets that are not visited again, default
+                  empty set
+            only_matched: Bool value to choose if only tickets that matched
+                          previous query should be visited, default False
+
+        Returns:
+            Traversal object yielding tuples (Ticket, parent's ticket ID or
+            None)
+        """
+        matched = set(self._ticket_ids) if only_matched else None
+        self._traversal = Traversal(
+            tickets, lambda ticket_id: self._get_template(ticket_id),
+            seen=seen, matched=matched, links=self._links)
+        return self._traversal
+
+    def _get_template(self, ticket_id):
+        """Return Ticket object of template with given ID.
+
+        Args:
+            ticket_id: String ID of the template
+
+        Returns:
+            Ticket object
+        """
+        if ticket_id not in self._templates and self._traversal is not None:
+            # fetch all pending templates at once instead of one by one,
+            # templates that could not be fetched are not searched again
+            missing = [ticket_id] + [
+                pending for pending in self._traversal.frontier
+                if pending not in self._templates and
+                pending not in self._fetched and pending != ticket_id]
+            self._fetched.update(missing)
+            self._templates.update(fetch_tickets(
+                missing, prod=self.prod,
+                custom_substitutions=self.custom_substitutions))
+        ticket = self._templates.get(ticket_id)
+        if ticket is None:
+            ticket = Ticket(prod=self.prod, project=self.project,
+                            ticket_id=ticket_id,
+                            custom_substitutions=self.custom_substitutions)
+            self._templates[ticket_id] = ticket
+        return ticket
+
+    def _placeholder_id(self):
+        """Return unique ID standing in for a clone in dry run."""
+        return '{0}-NEW-{1}'.format(self.project, next(self._placeholders))
+
+    def _new_ticket(self):
+        """Return empty Ticket object in target project."""
+        return Ticket(prod=self.prod, project=self.project,
+                      custom_substitutions=self.custom_substitutions)
+
+    def _log_cloning(self, ticket):
+        """Log that ticket is being cloned."""
         if ticket.issuetype == 'Sub-task':
             self.log.info('Cloning SubTask {0} - {1}'.format(ticket.ticket_id,
                                                              ticket.summary))
         else:
             self.log.info('Cloning Parent {0} - {1}'.format(ticket.ticket_id,
                                                             ticket.summary))
-        if not self.dry_run:
-            new.clone(ticket, inject=self.inject, parent=parent,
-                      custom_substitutions=self.custom_substitutions)
-            new.add_comment('This issue was cloned from {0}'.format(
-                ticket.ticket_id))
-        else:
-            # we need generic ticket_id for dry-run
-            new.ticket_id = 'ID'
-        self._cloned[ticket.ticket_id] = new.ticket_id
-        if ticket.subtask_ids:
-            for subtask_id in ticket.subtask_ids:
-                if subtask_id not in self._cloned:
-                    self.clone_ticket(
-                        Ticket(
-                            prod=self.prod,
-                            project=self.project,
-                            ticket_id=subtask_id,
-                            custom_substitutions=self.custom_substitutions
-                        ),
-                        parent=new.ticket_id,
-                        only_matched=only_matched)
-        if ticket.links:
-            for link in ticket.links:
-                linked_ticket_id, link_type, direction = link
-                if linked_ticket_id not in self._cloned:
-                    self.clone_ticket(
-                        Ticket(
-                            prod=self.prod,
-                            project=self.project,
-                            ticket_id=linked_ticket_id,
-                            custom_substitutions=self.custom_substitutions
-                        ),
-                        only_matched=only_matched)
-                self._links.append((ticket.ticket_id, linked_ticket_id,
-                                    link_type, direction))
+
+    def clone_ticket(self, ticket, parent=None, only_matched=False):
+        """Clone one ticket with its parents, subtasks and links.
+
+        Args:
+            ticket: Ticket object to clone
+            parent: Parent's id in case we know parent ticket, default None
+            only_matched: Bool value to choose if only tickets that matched
+                          previous query (i.e. tickets in self.tickets) should
+                          be cloned, default False
+        """
+        self._templates.setdefault(ticket.ticket_id, ticket)
+        seen = set(self._cloned) | set(self._failed)
+        for template, parent_id in self.traverse([ticket], seen=seen,
+                                                 only_matched=only_matched):
+            if parent_id is not None:
+                new_parent = self._cloned.get(parent_id)
+                if new_parent is None:
+                    self._failed[template.ticket_id] = \
+                        'Parent {0} was not cloned'.format(parent_id)
+                    continue
+            else:
+                new_parent = parent if template is ticket else None
+            self._log_cloning(template)
+            if self.dry_run:
+                self._cloned[template.ticket_id] = self._placeholder_id()
+                continue
+            clone_id, result = self._create_clone(template, new_parent)
+            if not clone_id:
+                self._failed[template.ticket_id] = getattr(
+                    result, 'error_message', None) or 'Error creating ticket'
+                continue
+            try:
+                # clone without origin comment is not taken as finished
+                self._copy_remote_links(template)
+                self._add_origin_comment(template)
+            except TicketException as e:
+                self._failed[template.ticket_id] = str(e)
 
     def clone_subtask_to_existing_parent(self, ticket, parent_id,
                                          position=None):
@@ -138,39 +522,71 @@ class Cloner():
                 ticket.ticket_id))
             return
         parent = Ticket(prod=self.prod, project=self.project,
-                        ticket_id=parent_id)
+                        ticket_id=parent_id, fields=PARENT_FIELDS)
         parent.verify_position(position)
         self.log.info('Cloning SubTask {0} - {1}'.format(ticket.ticket_id,
                                                          ticket.summary))
-        new = Ticket(prod=self.prod, project=self.project,
-                     custom_substitutions=self.custom_substitutions)
+        new = self._new_ticket()
         if not self.dry_run:
             new.clone(ticket, inject=self.inject,
                       custom_substitutions=self.custom_substitutions,
                       parent=parent_id)
         else:
-            # we need generic ticket_id for dry-run
-            new.ticket_id = 'ID'
+            new.ticket_id = self._placeholder_id()
         self._cloned[ticket.ticket_id] = new.ticket_id
         if not self.dry_run:
-            parent.content = parent._get_content()
+            parent.load_content(PARENT_FIELDS)
             parent.change_subtask_position(position)
 
     def link_tickets(self):
-        """Create links between tickets in self._links."""
+        """Create links between tickets in self._links.
+
+        Links are created concurrently on self.workers threads, at least
+        DEFAULT_WORKERS. In dry run links are only logged.
+        """
         if self.dry_run:
+            for clone_id_1, clone_id_2, link_type, direction in \
+                    self._links_to_create():
+                self.log.info('Linking {0} to {1} ({2})'.format(
+                    clone_id_1, clone_id_2, link_type))
             return
+
+        def create(link):
+            clone_id_1, clone_id_2, link_type, direction = link
+            self.log.debug('Linking {0} to {1}'.format(clone_id_1, clone_id_2))
+            result = self._existing_ticket(clone_id_1).create_link(
+                (clone_id_2, link_type, direction))
+            if result is None:
+                self._linked.add(frozenset((clone_id_1, clone_id_2)))
+                if self.journal is not None:
+                    self.journal.record('link',
+                                        clones=[clone_id_1, clone_id_2])
+            return result
+
+        map_concurrently(create, self._links_to_create(),
+                         workers=max(self.workers, DEFAULT_WORKERS))
+
+    def _links_to_create(self):
+        """Return links between clones that were not created yet.
+
+        Link between the same pair of clones is created only once regardless
+        of its direction. Pairs are stored in self._linked once their link is
+        created, so a failed link is tried again by next call.
+
+        Returns:
+            List of tuples (clone ID, linked clone ID, type, direction)
+        """
+        links = []
+        pairs = set(self._linked)
         for link in self._links:
             ticket_id_1, ticket_id_2, link_type, direction = link
             clone_id_1 = self._cloned.get(ticket_id_1)
             clone_id_2 = self._cloned.get(ticket_id_2)
             if not clone_id_1 or not clone_id_2:
                 continue
-            if ([clone_id_2, clone_id_1] in self._linked or
-                    [clone_id_1, clone_id_2] in self._linked):
+            pair = frozenset((clone_id_1, clone_id_2))
+            if pair in pairs:
                 continue
-            self.log.debug('Linking {0} to {1}'.format(clone_id_1, clone_id_2))
-            t = Ticket(prod=self.prod, project=self.project,
-                       ticket_id=clone_id_1)
-            t.create_link((clone_id_2, link_type, direction))
-            self._linked.append([clone_id_1, clone_id_2])
+            pairs.add(pair)
+            links.append((clone_id_1, clone_id_2, link_type, direction))
+        return links
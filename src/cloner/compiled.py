@@ -0,0 +1,109 @@
+"""Module with templates compiled for repeated cloning.
+
+Compiled template keeps cleaned create payload of a template and its
+summary and description split into literal text and substitution slots, so
+cloning the same template again only fills the slots.
+"""
+
+import threading
+
+from collections import OrderedDict
+
+# maximal number of compiled templates kept in memory
+MAX_COMPILED_TEMPLATES = 5000
+
+_compiled = OrderedDict()
+_lock = threading.Lock()
+
+
+class CompiledTemplate(object):
+    """Cleaned create payload of a template with parsed substitution slots.
+
+    Args:
+        fields: Dictionary with cleaned fields of the template
+        pattern: Compiled regex matching supported variables
+        groups: Dictionary group name of pattern: regex of the variable
+    """
+
+    SLOT_FIELDS = ('summary', 'description')
+
+    def __init__(self, fields, pattern, groups):
+        self.fields = fields
+        self.pattern = pattern
+        self.slots = dict((field, self._parse(fields[field], pattern, groups))
+                          for field in self.SLOT_FIELDS if fields.get(field))
+
+    @staticmethod
+    def _parse(text, pattern, groups):
+        """Split text into literal strings and tuples (regex of variable,
+        matched text).
+        """
+        parts = []
+        position = 0
+        for match in pattern.finditer(text):
+            parts.append(text[position:match.start()])
+            parts.append((groups[match.lastgroup], match.group(0)))
+            position = match.end()
+        parts.append(text[position:])
+        return parts
+
+    def payload_fields(self):
+        """Return new dictionary with cleaned fields of the template."""
+        return self.fields.copy()
+
+    def fill(self, field, value_of):
+        """Return value of field with its slots filled.
+
+        Args:
+            field: Name of the field, e.g. 'summary'
+            value_of: Function returning value of variable for its regex or
+                      None if value is not set, then the variable is kept
+
+        Returns:
+            String value of the field
+        """
+        if field not in self.slots:
+            return self.fields.get(field)
+        result = []
+        for part in self.slots[field]:
+            if isinstance(part, tuple):
+                value = value_of(part[0])
+                result.append(part[1] if value is None else value)
+            else:
+                result.append(part)
+        return ''.join(result)
+
+
+def get_compiled(key):
+    """Return compiled template stored under key or None.
+
+    Args:
+        key: Tuple (server URL, ticket ID, 'updated' field of the template)
+    """
+    with _lock:
+        compiled = _compiled.pop(key, None)
+        if compiled is not None:
+            # keep recently used templates at the end
+            _compiled[key] = compiled
+        return compiled
+
+
+def store_compiled(key, compiled):
+    """Store compiled template, least recently used templates over
+    MAX_COMPILED_TEMPLATES are dropped.
+
+    Args:
+        key: Tuple (server URL, ticket ID, 'updated' field of the template)
+        compiled: CompiledTemplate object
+    """
+    with _lock:
+        _compiled.pop(key, None)
+        _compiled[key] = compiled
+        while len(_compiled) > MAX_COMPILED_TEMPLATES:
+            _compiled.popitem(last=False)
+
+
+def clear_compiled():
+    """Drop all compiled templates."""
+    with _lock:
+        _compiled.clear()
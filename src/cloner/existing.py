@@ -0,0 +1,126 @@
+"""Module for finding clones created by previous runs.
+
+Every clone gets comment 'This issue was cloned from <template>' after its
+remote links are copied, so a ticket with the comment is a finished clone.
+Clones are looked up with batched comment searches instead of one search per
+template.
+"""
+
+import logging
+import re
+
+from ticketutil.ticket import TicketException
+
+from ticket import Ticket
+from workers import map_concurrently, DEFAULT_WORKERS
+
+# maximal number of templates in one comment search, text searches are more
+# expensive than 'key in (...)' ones
+COMMENT_CHUNK_SIZE = 50
+ORIGIN_COMMENT = 'This issue was cloned from {0}'
+ORIGIN_PATTERN = re.compile(r'^This issue was cloned from ([A-Z]\w*-\d+)$')
+
+
+def origin_query(template_ids):
+    """Return JQL condition matching tickets cloned from any of templates.
+
+    Args:
+        template_ids: List of string ticket IDs of templates
+
+    Returns:
+        String JQL condition
+    """
+    return '({0})'.format(' or '.join(
+        'comment ~ "\\"{0}\\""'.format(ORIGIN_COMMENT.format(template_id))
+        for template_id in template_ids))
+
+
+def find_clones(template_ids, project, pav=None, milestone=None,
+                prod=False, workers=DEFAULT_WORKERS):
+    """Find finished clones of templates in project.
+
+    Text search in JIRA is not exact, so comments of found tickets are
+    checked again. If a template was cloned more times, the latest clone is
+    used. Custom text is not stored in any field, so clones that differ only
+    in it are not told apart.
+
+    Args:
+        template_ids: List of string ticket IDs of templates
+        project: String project key in JIRA in which clones are searched
+        pav: String Product Affects Version clones have to have, default None
+             (any)
+        milestone: String milestone clones have to have, default None (any)
+        prod: Bool value to choose if production JIRA is used, default False
+        workers: Maximal number of concurrent searches, default
+                 DEFAULT_WORKERS
+
+    Returns:
+        Tuple (dictionary template ID: clone ID, set of frozensets of IDs of
+        clones that are already linked to each other)
+
+    Raises:
+        TicketException if any of the searches failed, as missed clones
+        would be created again
+    """
+    template_ids = sorted(set(template_ids))
+    if not template_ids:
+        return {}, set()
+    # create dummy ticket to search with
+    searcher = Ticket(prod=prod)
+    restriction = 'project = {0}'.format(project)
+    if pav:
+        restriction += ' and "Product Affects Version" = "{0}"'.format(pav)
+    if milestone:
+        restriction += ' and cf[12000] = "{0}"'.format(milestone)
+    chunks = [template_ids[i:i + COMMENT_CHUNK_SIZE]
+              for i in range(0, len(template_ids), COMMENT_CHUNK_SIZE)]
+
+    def search_chunk(chunk):
+        return searcher.search_issues(
+            '{0} and {1}'.format(restriction, origin_query(chunk)),
+            fields='comment,issuelinks')
+
+    wanted = set(template_ids)
+    clones = {}
+    issues = {}
+    for chunk, found in zip(chunks, map_concurrently(search_chunk, chunks,
+                                                     workers=workers)):
+        if hasattr(found, 'status'):
+            raise TicketException('Failed to search clones of {0}: {1}'.format(
+                ', '.join(chunk), found.error_message))
+        for issue in found:
+            issues[issue['key']] = issue
+            for template_id in _origins(issue):
+                if template_id not in wanted:
+                    continue
+                clone_id = clones.get(template_id)
+                if clone_id is None or _key_number(issue['key']) > \
+                        _key_number(clone_id):
+                    clones[template_id] = issue['key']
+    linked = set()
+    clone_ids = set(clones.values())
+    for clone_id in clone_ids:
+        for link in issues[clone_id]['fields'].get('issuelinks') or []:
+            other = (link.get('inwardIssue') or
+                     link.get('outwardIssue') or {}).get('key')
+            if other in clone_ids:
+                linked.add(frozenset((clone_id, other)))
+    logging.info('Found {0} existing clones of {1} templates'.format(
+        len(clones), len(template_ids)))
+    return clones, linked
+
+
+def _origins(issue):
+    """Return IDs of templates named in origin comments of issue."""
+    comments = (issue['fields'].get('comment') or {}).get('comments') or []
+    origins = []
+    for comment in comments:
+        match = ORIGIN_PATTERN.match(comment.get('body', '').strip())
+        if match:
+            origins.append(match.group(1))
+    return origins
+
+
+def _key_number(key):
+    """Return number part of ticket ID, newer tickets have higher numbers."""
+    return int(key.rsplit('-', 1)[1])
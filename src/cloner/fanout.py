@@ -0,0 +1,112 @@
+"""Module for cloning the same templates for several targets in one run."""
+
+import logging
+
+from collections import namedtuple
+
+from utils import prepare_inject
+from workers import map_concurrently
+
+Target = namedtuple('Target', ['pav', 'milestone', 'custom_text'])
+
+
+def parse_target(value):
+    """Parse target in format PAV[:MILESTONE[:CUSTOM_TEXT]].
+
+    Args:
+        value: String target, empty milestone is not set
+
+    Returns:
+        Target namedtuple
+    """
+    parts = value.split(':', 2)
+    pav = parts[0].strip()
+    milestone = (parts[1].strip() or None) if len(parts) > 1 else None
+    custom_text = parts[2] if len(parts) > 2 else None
+    if not pav:
+        raise ValueError('Target {0} has no PAV'.format(value))
+    return Target(pav, milestone, custom_text)
+
+
+def target_inject(inject, target, prod=False):
+    """Return inject with PAV and milestone of target.
+
+    Args:
+        inject: Dictionary with values for injecting formatted for JIRA API
+                shared by all targets, default None
+        target: Target namedtuple
+        prod: Bool value to choose if production JIRA is used, default False
+
+    Returns:
+        New dictionary with values for injecting formatted for JIRA API
+    """
+    fields = {'PAV': target.pav}
+    if target.milestone:
+        fields['milestone'] = target.milestone
+    result = dict(inject or {})
+    result.update(prepare_inject(fields, prod=prod))
+    return result
+
+
+def target_substitutions(custom_substitutions, target):
+    """Return custom substitutions with custom text of target.
+
+    Args:
+        custom_substitutions: Dict with {VAR: value} shared by all targets,
+                              default None
+        target: Target namedtuple
+
+    Returns:
+        New dictionary with {VAR: value}
+    """
+    result = dict(custom_substitutions or {})
+    if target.custom_text is not None:
+        result['CUSTOM_TEXT'] = target.custom_text
+    return result
+
+
+def fan_out(tickets, targets, create_cloner, inject=None,
+            custom_substitutions=None, prod=False):
+    """Clone tickets once for every target concurrently.
+
+    Templates are resolved by the first target's cloner and shared by
+    cloners of other targets, so every template is fetched and compiled only
+    once. Each target has its own cloner, so clones and links of targets are
+    kept apart.
+
+    Args:
+        tickets: List of Ticket objects
+        targets: List of Target namedtuples
+        create_cloner: Function accepting tickets and Cloner keyword
+                       arguments inject, custom_substitutions and templates
+                       and returning Cloner object
+        inject: Dictionary with values for injecting formatted for JIRA API
+                shared by all targets, default None
+        custom_substitutions: Dict with {VAR: value} shared by all targets,
+                              default None
+        prod: Bool value to choose if production JIRA is used, default False
+
+    Returns:
+        List of Cloner objects in order of targets
+    """
+    templates = None
+    cloners = []
+    for target in targets:
+        cloner = create_cloner(
+            tickets, inject=target_inject(inject, target, prod=prod),
+            custom_substitutions=target_substitutions(custom_substitutions,
+                                                      target),
+            templates=templates)
+        if templates is None:
+            templates = cloner.get_templates()
+        cloners.append(cloner)
+
+    def clone(cloner):
+        cloner.clone_tickets()
+        cloner.link_tickets()
+
+    map_concurrently(clone, cloners, workers=len(cloners))
+    for target, cloner in zip(targets, cloners):
+        logging.info('Target {0}: {1} tickets cloned, {2} failed'.format(
+            target.pav, len(cloner._cloned), len(cloner._failed)))
+    return cloners
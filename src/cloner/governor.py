@@ -0,0 +1,347 @@
+"""Module with request governor shared by all requests to one JIRA server.
+
+Governor limits rate of requests with token bucket, pauses all requests to
+the server when it asks for it with Retry-After and adapts number of
+concurrent requests: limit is halved when the server throttles or its
+latency spikes and grows by one per limit of healthy responses (AIMD).
+"""
+
+import email.utils
+import json
+import logging
+import threading
+import time
+
+from urlparse import urlparse
+
+import requests
+
+from requests.adapters import HTTPAdapter
+
+from retry import get_retry_policy, is_transient, was_not_sent
+from stats import record_request
+
+# default number of requests per second to one server
+DEFAULT_RATE = 50.0
+# initial and maximal number of concurrent requests to one server
+INITIAL_CONCURRENCY = 8
+MAX_CONCURRENCY = 32
+# response is a latency spike if it took this many times the average and
+# at least SPIKE_MIN_LATENCY seconds
+SPIKE_FACTOR = 4.0
+SPIKE_MIN_LATENCY = 1.0
+# weight of the newest response in average latency
+LATENCY_WEIGHT = 0.1
+# statuses meaning the server is overloaded
+THROTTLE_STATUSES = (429, 503)
+# maximal number of attempts of a throttled request
+MAX_THROTTLED_ATTEMPTS = 6
+# wait in seconds after throttling without Retry-After, doubled every time
+THROTTLE_BACKOFF = 1.0
+# longest wait in seconds the server may ask for
+MAX_RETRY_AFTER = 120.0
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE')
+# paths of GET requests that change data, e.g. move subtask by one position
+NON_IDEMPOTENT_PATHS = ('/secure/MoveIssueLink.jspa',)
+
+_governors = {}
+_settings = {}
+_lock = threading.Lock()
+
+
+class Governor(object):
+    """Rate and concurrency limit of requests to one server.
+
+    Args:
+        rate: Number of requests per second, None for no limit, default
+              DEFAULT_RATE
+        burst: Number of requests that can be sent at once after idle
+               period, default rate
+        concurrency: Initial number of concurrent requests, default
+                     INITIAL_CONCURRENCY
+        max_concurrency: Maximal number of concurrent requests, default
+                         MAX_CONCURRENCY
+        min_concurrency: Minimal number of concurrent requests, default 1
+    """
+
+    def __init__(self, rate=DEFAULT_RATE, burst=None,
+                 concurrency=INITIAL_CONCURRENCY,
+                 max_concurrency=MAX_CONCURRENCY, min_concurrency=1):
+        self.rate = rate
+        self.burst = burst or rate or 1
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.limit = float(min(max(concurrency, min_concurrency),
+                               max_concurrency))
+        self.in_flight = 0
+        self.latency = None
+        self._tokens = float(self.burst)
+        self._refilled = time.time()
+        self._paused_until = 0.0
+        self._decreased = 0.0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        """Wait until a request may be sent and take its slot."""
+        with self._condition:
+            while True:
+                now = time.time()
+                if now < self._paused_until:
+                    self._condition.wait(self._paused_until - now)
+                    continue
+                if self.in_flight >= int(self.limit):
+                    self._condition.wait()
+                    continue
+                wait = self._take_token(now)
+                if wait:
+                    self._condition.wait(wait)
+                    continue
+                self.in_flight += 1
+                return time.time()
+
+    def _take_token(self, now):
+        """Take token from the bucket.
+
+        Returns:
+            0 if token was taken, otherwise seconds until next token
+        """
+        if self.rate is None:
+            return 0
+        self._tokens = min(self.burst, self._tokens +
+                           (now - self._refilled) * self.rate)
+        self._refilled = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0
+        return (1 - self._tokens) / self.rate
+
+    def release(self, started, throttled=False):
+        """Free slot of finished request and adapt concurrency limit.
+
+        Args:
+            started: Time returned by acquire()
+            throttled: True if the server refused request as overloaded,
+                       default False
+        """
+        now = time.time()
+        elapsed = now - started
+        with self._condition:
+            self.in_flight -= 1
+            spike = (self.latency is not None and
+                     elapsed > max(SPIKE_FACTOR * self.latency,
+                                   SPIKE_MIN_LATENCY))
+            if throttled or spike:
+                # decrease only once per round trip, responses of requests
+                # sent before the decrease carry no new information
+                if started >= self._decreased:
+                    self.limit = max(self.min_concurrency, self.limit / 2)
+                    self._decreased = now
+                    logging.debug('Concurrency limit decreased to {0}'.format(
+                        int(self.limit)))
+            else:
+                self.limit = min(self.max_concurrency,
+                                 self.limit + 1 / self.limit)
+            if not throttled:
+                self.latency = elapsed if self.latency is None else (
+                    (1 - LATENCY_WEIGHT) * self.latency +
+                    LATENCY_WEIGHT * elapsed)
+            self._condition.notify_all()
+
+    def pause(self, seconds):
+        """Stop sending requests to the server for given number of seconds."""
+        with self._condition:
+            self._paused_until = max(self._paused_until,
+                                     time.time() + seconds)
+            self._condition.notify_all()
+
+    def configure(self, **settings):
+        """Change rate and concurrency limits.
+
+        Args:
+            settings: Keyword arguments of Governor, limits that are not
+                      passed are kept
+        """
+        with self._condition:
+            self.rate = settings.get('rate', self.rate)
+            self.burst = settings.get('burst') or self.rate or 1
+            self._tokens = min(self._tokens, self.burst)
+            for name in ('max_concurrency', 'min_concurrency'):
+                if name in settings:
+                    setattr(self, name, settings[name])
+            if 'concurrency' in settings:
+                self.limit = float(settings['concurrency'])
+            self.limit = min(max(self.limit, self.min_concurrency),
+                             self.max_concurrency)
+            self._condition.notify_all()
+
+
+class GovernedAdapter(HTTPAdapter):
+    """Transport adapter sending every request through a Governor.
+
+    Requests refused with 429 are sent again after the time from Retry-After
+    header (or growing backoff), as the server didn't process them. Requests
+    refused with 503 are sent again only if they are idempotent or the
+    server sent Retry-After.
+
+    Requests without timeout get timeout of the retry policy. Idempotent
+    requests that failed with connection error, timeout or 5xx status are
+    sent again with jittered exponential backoff, other requests only if
+    they surely didn't reach the server.
+
+    Args:
+        governor: Governor of the server
+        kwargs: Keyword arguments of HTTPAdapter
+    """
+
+    def __init__(self, governor, **kwargs):
+        self.governor = governor
+        super(GovernedAdapter, self).__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        policy = get_retry_policy()
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = policy.timeout
+        idempotent = is_idempotent(request)
+        backoff = THROTTLE_BACKOFF
+        throttled_attempts = 0
+        failed_attempts = 0
+        while True:
+            started = self.governor.acquire()
+            response = error = None
+            throttled = False
+            try:
+                response = super(GovernedAdapter, self).send(request,
+                                                             **kwargs)
+                throttled = response.status_code in THROTTLE_STATUSES
+                if not kwargs.get('stream'):
+                    # body is read here to include it in latency and size
+                    response.content
+            except requests.RequestException as e:
+                error = e
+            finally:
+                self.governor.release(started, throttled=throttled)
+            record_request(request, started,
+                           response=response if error is None else None)
+            if error is not None:
+                repeatable = idempotent and is_transient(error=error) or \
+                    was_not_sent(error)
+                if not repeatable or failed_attempts >= policy.retries:
+                    raise error
+                failed_attempts += 1
+                logging.debug('{0} {1} failed: {2}'.format(
+                    request.method, request.url, error))
+                policy.wait(failed_attempts)
+                continue
+            if throttled:
+                throttled_attempts += 1
+                retry_after = parse_retry_after(
+                    response.headers.get('Retry-After'))
+                if throttled_attempts >= MAX_THROTTLED_ATTEMPTS or (
+                        response.status_code == 503 and
+                        retry_after is None and not idempotent):
+                    return response
+                delay = backoff if retry_after is None else retry_after
+                backoff *= 2
+                logging.debug('{0} {1} throttled with {2}, retrying in {3} '
+                              'seconds'.format(request.method, request.url,
+                                               response.status_code, delay))
+                response.close()
+                self.governor.pause(delay)
+                continue
+            if idempotent and is_transient(response=response) and \
+                    failed_attempts < policy.retries:
+                failed_attempts += 1
+                logging.debug('{0} {1} failed with {2}'.format(
+                    request.method, request.url, response.status_code))
+                response.close()
+                policy.wait(failed_attempts)
+                continue
+            return response
+
+
+def is_idempotent(request):
+    """Return True if sending request again has the same effect as sending
+    it once.
+
+    GET requests to NON_IDEMPOTENT_PATHS are not idempotent. PUT is
+    idempotent only if it sets values, other update operations (e.g. 'add')
+    would be applied again.
+
+    Args:
+        request: requests.PreparedRequest
+    """
+    if request.method not in IDEMPOTENT_METHODS:
+        return False
+    if urlparse(request.url).path.endswith(NON_IDEMPOTENT_PATHS):
+        return False
+    if request.method == 'PUT' and request.body:
+        try:
+            payload = json.loads(request.body)
+        except ValueError:
+            return False
+        update = payload.get('update') if isinstance(payload, dict) else None
+        for operations in (update or {}).values():
+            if any(set(operation) != {'set'} for operation in operations):
+                return False
+    return True
+
+
+def parse_retry_after(value):
+    """Return number of seconds from Retry-After header.
+
+    Args:
+        value: Header value, number of seconds or HTTP date, or None
+
+    Returns:
+        Number of seconds limited by MAX_RETRY_AFTER, None if value is
+        missing or invalid
+    """
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        parsed = email.utils.parsedate_tz(value)
+        if parsed is None:
+            return None
+        seconds = email.utils.mktime_tz(parsed) - time.time()
+    return min(max(seconds, 0.0), MAX_RETRY_AFTER)
+
+
+def get_governor(url):
+    """Return governor of server of the URL, create it on first use.
+
+    Args:
+        url: Any URL of the server
+
+    Returns:
+        Governor instance
+    """
+    server = urlparse(url).netloc
+    with _lock:
+        governor = _governors.get(server)
+        if governor is None:
+            governor = Governor(**_settings)
+            _governors[server] = governor
+        return governor
+
+
+def configure_governors(**settings):
+    """Set limits of governors of all servers, including existing ones.
+
+    Args:
+        settings: Keyword arguments of Governor
+    """
+    with _lock:
+        _settings.clear()
+        _settings.update(settings)
+        governors = list(_governors.values())
+    for governor in governors:
+        governor.configure(**settings)
+
+
+def reset_governors():
+    """Forget governors of all servers and their settings."""
+    with _lock:
+        _governors.clear()
+        _settings.clear()
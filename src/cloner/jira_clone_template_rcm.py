@@ -4,9 +4,25 @@ import argparse
 import logging
 import sys
 
+from functools import partial
+from ticketutil.ticket import TicketException
+
 from ticket import Ticket
+from async_cloner import AsyncCloner
+from client import DEFAULT_MAX_IN_FLIGHT
 from cloner import Cloner
-from utils import prepare_inject, get_ticket_IDs, get_ticket_IDs_specific
+from fanout import fan_out, parse_target
+from governor import configure_governors, DEFAULT_RATE
+from retry import configure_retries, CONNECT_TIMEOUT, READ_TIMEOUT, \
+    DEFAULT_RETRIES
+from stats import enable_stats, report_stats
+from journal import Journal
+from listing import write_listing, FORMATS, SEARCH_FIELDS
+from planner import Planner, count_requests, DEFAULT_LATENCY
+from resolver import fetch_tickets
+from snapshot import write_snapshot, DEFAULT_SNAPSHOT_PATH
+from utils import prepare_inject, iter_tickets, get_tickets_specific, \
+    open_snapshot, open_template_cache, DEFAULT_CACHE_PATH
 
 
 def main():
@@ -27,9 +43,47 @@ def main():
     if args.custom_text:
         custom_substitutions['CUSTOM_TEXT'] = args.custom_text
     log.debug("custom_substitutions={0}".format(custom_substitutions))
-    if args.type == 'search':
-        search_tickets(log, fields.get('PAV'), fields.get('keywords'),
-                       prod=prod)
+    if args.rate is not None:
+        configure_governors(rate=args.rate or None)
+    configure_retries(timeout=(CONNECT_TIMEOUT, args.timeout),
+                      retries=args.retries)
+    if args.stats is not None:
+        enable_stats()
+    if args.cache and args.snapshot:
+        parser.error('--cache cannot be used with --snapshot')
+    if args.cache and args.type == 'clone':
+        open_template_cache(args.cache, prod=prod)
+    if args.snapshot and args.type != 'snapshot':
+        # dry run and search don't need JIRA at all
+        open_snapshot(args.snapshot, prod=prod,
+                      offline=args.dry_run or args.type == 'search')
+    if args.resume and not args.journal:
+        parser.error('--resume requires --journal')
+    if args.journal and args.target:
+        parser.error('--journal cannot be used with --target')
+    if args.plan is not None and args.target:
+        parser.error('--plan cannot be used with --target')
+    journal = None
+    if args.journal and args.type == 'clone' and not args.dry_run and \
+            (args.plan is None or args.resume):
+        journal = Journal(args.journal, resume=args.resume)
+    plan = None
+    if args.plan is not None and args.type == 'clone':
+        plan = open(args.plan, 'w') if args.plan else sys.stdout
+    if args.type == 'snapshot':
+        if write_snapshot(args.snapshot or DEFAULT_SNAPSHOT_PATH,
+                          prod=prod) is None:
+            sys.exit(1)
+    elif args.type == 'search':
+        search_fields = [field.strip() for field in
+                         args.fields.split(',')] if args.fields else []
+        try:
+            search_tickets(log, fields.get('PAV'), fields.get('keywords'),
+                           prod=prod, fields=search_fields,
+                           output_format=args.format)
+        except TicketException:
+            # the failed search was already logged
+            sys.exit(1)
     elif args.type == 'clone':
         if not args.parent and args.pav:
             inject = prepare_inject(fields, prod=prod)
@@ -37,7 +91,11 @@ def main():
                 args.pav, fields.get('keywords'), args.project, inject,
                 prod=prod,
                 dry_run=args.dry_run,
-                custom_substitutions=custom_substitutions)
+                custom_substitutions=custom_substitutions,
+                bulk=args.bulk, workers=args.workers,
+                async_requests=args.async_requests, targets=args.target,
+                journal=journal, find_existing=args.skip_existing,
+                plan=plan, plan_latency=args.plan_latency)
         elif args.subtask and args.parent:
             inject = prepare_inject(fields, prod=prod)
             adjusted_position = (int(args.position) - 1
@@ -50,19 +108,29 @@ def main():
                 position=adjusted_position,
                 prod=prod,
                 dry_run=args.dry_run,
-                custom_substitutions=custom_substitutions)
+                custom_substitutions=custom_substitutions,
+                plan=plan, plan_latency=args.plan_latency)
         elif args.parent:
             inject = prepare_inject(fields, prod=prod)
             ticket_ids = [ticket_id.strip().upper()
                           for ticket_id in args.parent.split(',')]
             clone_tickets(ticket_ids, args.project, inject,
                           prod=prod, dry_run=args.dry_run,
-                          custom_substitutions=custom_substitutions)
+                          custom_substitutions=custom_substitutions,
+                          bulk=args.bulk, workers=args.workers,
+                          async_requests=args.async_requests,
+                          targets=args.target, journal=journal,
+                          find_existing=args.skip_existing,
+                          plan=plan, plan_latency=args.plan_latency)
         else:
             parser.error('Invalid combination of arguments provided, please '
                          'refer to documentation '
                          '(https://mojo.redhat.com/docs/DOC-1147075) for '
                          'usage examples.')
+    if plan is not None and plan is not sys.stdout:
+        plan.close()
+    if args.stats is not None:
+        report_stats(log, path=args.stats)
 
 
 def create_parser():
@@ -117,11 +185,20 @@ def create_parser():
                         help="Position into which cloned subtask should be "
                              "moved to; has effect only when used with "
                              "--parent and --subtask")
-    parser.add_argument("--type", default="clone", choices=("clone", "search"),
+    parser.add_argument("--type", default="clone",
+                        choices=("clone", "search", "snapshot"),
                         help="Action to perform; 'clone' tries to clone "
                              "provided tickets, 'search' prints ticket id, "
                              "summary, pav and labels for tickets that match "
-                             "given parameters, default clone")
+                             "given parameters, 'snapshot' writes all "
+                             "templates to --snapshot file, default clone")
+    parser.add_argument("--format", default="text", choices=FORMATS,
+                        help="Output of --type search; 'text' is logged, "
+                             "'ndjson' (JSON object per ticket) and 'csv' "
+                             "are written to standard output, default text")
+    parser.add_argument("--fields",
+                        help="Coma separated JIRA field IDs listed by --type "
+                             "search in addition to summary, PAV and labels")
     parser.add_argument("--subtask",
                         help="JIRA ID of a subtask, that will be cloned into "
                              "existing parent task; requires --parent; has no "
@@ -136,6 +213,83 @@ def create_parser():
     parser.add_argument("--dry-run", action="store_true",
                         help="Do not perform actions, just provide output "
                              "about what would happen.")
+    parser.add_argument("--plan", nargs="?", const="", metavar="PATH",
+                        help="Do not clone, write JSON execution plan with "
+                             "all operations, numbers of requests and "
+                             "estimated time to PATH or standard output; "
+                             "clones recorded in --journal with --resume and "
+                             "found by --skip-existing are reused; has no "
+                             "effect with --type search")
+    parser.add_argument("--plan-latency", type=float,
+                        default=DEFAULT_LATENCY, metavar="SECONDS",
+                        help="Average time of one request assumed by --plan, "
+                             "default {0}".format(DEFAULT_LATENCY))
+    parser.add_argument("--bulk", action="store_true",
+                        help="Create new tickets with JIRA bulk create "
+                             "requests, tasks first and then their subtasks; "
+                             "has no effect with --subtask")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of tickets cloned concurrently, parents "
+                             "are still created before their subtasks; has no "
+                             "effect with --subtask or --bulk, default 1")
+    parser.add_argument("--async", action="store_true", dest="async_requests",
+                        help="Submit requests without waiting for each of "
+                             "them, --workers then limits number of requests "
+                             "in flight (default {0}); has no effect with "
+                             "--subtask or --bulk".format(
+                                 DEFAULT_MAX_IN_FLIGHT))
+    parser.add_argument("--target", action="append", type=parse_target,
+                        metavar="PAV[:MILESTONE[:CUSTOM_TEXT]]",
+                        help="Clone tickets once for every target with its "
+                             "PAV, milestone and custom text, targets are "
+                             "cloned concurrently; can be used multiple "
+                             "times; has no effect with --subtask or --type "
+                             "search")
+    parser.add_argument("--journal", metavar="PATH",
+                        help="Record every finished operation to journal "
+                             "file, so the run can be resumed with --resume; "
+                             "has no effect with --subtask")
+    parser.add_argument("--resume", action="store_true",
+                        help="Continue run recorded in --journal, tickets, "
+                             "remote links, comments and links recorded "
+                             "there are not created again")
+    parser.add_argument("--skip-existing", action="store_true",
+                        help="Search --project (and --pav) for clones "
+                             "finished by previous runs and create only "
+                             "missing ones; has no effect with --subtask")
+    parser.add_argument("--rate", type=float, metavar="N",
+                        help="Maximal number of requests per second sent to "
+                             "JIRA, 0 for no limit, default {0:g}; number of "
+                             "concurrent requests is adapted to server's "
+                             "load".format(DEFAULT_RATE))
+    parser.add_argument("--timeout", type=float, default=READ_TIMEOUT,
+                        metavar="SECONDS",
+                        help="Time to wait for response of JIRA, default "
+                             "{0}".format(READ_TIMEOUT))
+    parser.add_argument("--retries", type=int, default=DEFAULT_RETRIES,
+                        metavar="N",
+                        help="Number of repeated attempts of requests that "
+                             "failed with connection error, timeout or "
+                             "server error; creating requests are repeated "
+                             "only if checked that they didn't create "
+                             "anything, default {0}".format(DEFAULT_RETRIES))
+    parser.add_argument("--cache", nargs="?", const=DEFAULT_CACHE_PATH,
+                        metavar="PATH",
+                        help="Keep content of templates in local cache file "
+                             "refreshed with templates updated since the "
+                             "last run, default path {0}; has no effect with "
+                             "--type search".format(DEFAULT_CACHE_PATH))
+    parser.add_argument("--snapshot", nargs="?", const=DEFAULT_SNAPSHOT_PATH,
+                        metavar="PATH",
+                        help="Snapshot file with all templates, default path "
+                             "{0}; written by --type snapshot, clone and "
+                             "search read templates from it instead of JIRA, "
+                             "with --dry-run and --type search JIRA is not "
+                             "contacted at all".format(DEFAULT_SNAPSHOT_PATH))
+    parser.add_argument("--stats", nargs="?", const="", metavar="PATH",
+                        help="Log count, size and latency percentiles of "
+                             "requests per operation at the end of the run, "
+                             "write them also as JSON to PATH if given")
     parser.add_argument("--debug", action="store_true",
                         help="Print debug messages. It's very spammy.")
     parser.add_argument("--custom-text",
@@ -169,31 +323,43 @@ def extract_fields(args):
     return fields
 
 
-def search_tickets(log, pav, keywords, prod=False):
+def search_tickets(log, pav, keywords, prod=False, fields=(),
+                   output_format='text', out=None):
     """Perform ticket search in JIRA based on provided values and output
-    number of tickets found, their IDs, summaries, PAVs and labels.
+    IDs, summaries, PAVs and labels of found tickets and their number.
+
+    Only listed fields are requested in the search itself and tickets are
+    written as result pages arrive.
 
     Args:
         log: Logger object
         pav: String Product Affects Version field
         keywords: List of keywords
         prod: Choose if production JIRA is used, default False
+        fields: List of additional field IDs to output, default ()
+        output_format: One of 'text', 'ndjson' and 'csv', default 'text'
+        out: File object for 'ndjson' and 'csv', default standard output
+
+    Returns:
+        Number of found tickets
     """
-    ticket_ids = get_ticket_IDs(pav=pav, keywords=keywords, prod=prod)
-    log.info('Nr. of tickets found: {0}'.format(len(ticket_ids)))
-    for ticket_id in ticket_ids:
-        ticket = Ticket(prod=prod, ticket_id=ticket_id)
-        log.info('Ticket: {0} - {1}'.format(ticket.ticket_id, ticket.summary))
-        pav = ticket.pav
-        labels = ticket.labels
-        log.info('PAV: {0}, Labels: {1}'.format(
-            ", ".join(pav) if pav else None,
-            ", ".join(labels) if labels else None))
+    requested = list(SEARCH_FIELDS) + [field for field in fields
+                                       if field not in SEARCH_FIELDS]
+    issues = iter_tickets(pav=pav, keywords=keywords, prod=prod,
+                          fields=requested)
+    count = write_listing(issues, out or sys.stdout,
+                          output_format=output_format, fields=fields, log=log)
+    log.info('Nr. of tickets found: {0}'.format(count))
+    return count
 
 
 def search_and_clone_specific_tickets(pav, keywords, project, inject,
                                       prod=False, dry_run=False,
-                                      custom_substitutions=None):
+                                      custom_substitutions=None, bulk=False,
+                                      workers=1, async_requests=False,
+                                      targets=None, journal=None,
+                                      find_existing=False, plan=None,
+                                      plan_latency=DEFAULT_LATENCY):
     """Perform cloning of tickets that match specified pav and keywords.
 
     Keyword matching is not performed for tickets of type Sub-task.
@@ -206,27 +372,45 @@ def search_and_clone_specific_tickets(pav, keywords, project, inject,
         prod: Choose if production JIRA is used, default False
         dry_run: If True action is not performed, just logged, default False
         custom_substitutions: dict containing VAR: substitution
+        bulk: If True tickets are created in bulk requests, default False
+        workers: Number of tickets cloned concurrently, default 1
+        async_requests: If True requests are submitted without waiting for
+                        each of them, default False
+        targets: List of Target namedtuples, if passed tickets are cloned
+                 once for every target, default None
+        journal: Journal object recording finished operations, default None
+        find_existing: If True clones finished by previous runs are not
+                       created again, default False
+        plan: File object, if passed nothing is cloned and execution plan is
+              written to it, default None
+        plan_latency: Seconds of one request assumed by plan, default
+                      DEFAULT_LATENCY
     """
-    ticket_ids = get_ticket_IDs_specific(pav, keywords=keywords, prod=prod)
-    tickets = []
-    for ticket_id in ticket_ids:
-        tickets.append(
-            Ticket(
-                prod=prod,
-                ticket_id=ticket_id,
-                custom_substitutions=custom_substitutions
-                )
-        )
-    cloner = Cloner(tickets, project, inject=inject,
-                    custom_substitutions=custom_substitutions,
-                    only_matched=True,
-                    prod=prod, dry_run=dry_run)
-    cloner.clone_tickets()
-    cloner.link_tickets()
+    reads = None
+    if plan is not None:
+        # search of templates is part of the plan
+        tickets, counts, seconds = count_requests(
+            get_tickets_specific, pav, keywords=keywords, prod=prod,
+            custom_substitutions=custom_substitutions)
+        reads = (counts, seconds)
+    else:
+        tickets = get_tickets_specific(
+            pav, keywords=keywords, prod=prod,
+            custom_substitutions=custom_substitutions)
+    run_cloners(tickets, project, inject, targets=targets,
+                custom_substitutions=custom_substitutions,
+                only_matched=True,
+                prod=prod, dry_run=dry_run, bulk=bulk,
+                workers=workers, async_requests=async_requests,
+                journal=journal, find_existing=find_existing, plan=plan,
+                plan_latency=plan_latency, plan_reads=reads)
 
 
 def clone_tickets(ticket_ids, project, inject, prod=False,
-                  dry_run=False, custom_substitutions=None):
+                  dry_run=False, custom_substitutions=None, bulk=False,
+                  workers=1, async_requests=False, targets=None,
+                  journal=None, find_existing=False, plan=None,
+                  plan_latency=DEFAULT_LATENCY):
     """Perform cloning of tickets with all their links, parents and subtasks.
 
     Args:
@@ -236,27 +420,125 @@ def clone_tickets(ticket_ids, project, inject, prod=False,
         prod: Choose if production JIRA is used, default False
         dry_run: If True action is not performed, just logged, default False
         custom_substitutions: dict with {"VAR": "substitution",}
+        bulk: If True tickets are created in bulk requests, default False
+        workers: Number of tickets cloned concurrently, default 1
+        async_requests: If True requests are submitted without waiting for
+                        each of them, default False
+        targets: List of Target namedtuples, if passed tickets are cloned
+                 once for every target, default None
+        journal: Journal object recording finished operations, default None
+        find_existing: If True clones finished by previous runs are not
+                       created again, default False
+        plan: File object, if passed nothing is cloned and execution plan is
+              written to it, default None
+        plan_latency: Seconds of one request assumed by plan, default
+                      DEFAULT_LATENCY
     """
+    # fetch all requested tickets with batched searches, fall back to single
+    # requests for those that could not be found this way
+    reads = None
+    if plan is not None:
+        # fetching of templates is part of the plan
+        fetched, counts, seconds = count_requests(
+            fetch_tickets, ticket_ids, prod=prod,
+            custom_substitutions=custom_substitutions)
+        reads = (counts, seconds)
+    else:
+        fetched = fetch_tickets(ticket_ids, prod=prod,
+                                custom_substitutions=custom_substitutions)
     tickets = []
     for id in ticket_ids:
         tickets.append(
+            fetched.get(id) or
             Ticket(
                 prod=prod,
                 ticket_id=id,
                 custom_substitutions=custom_substitutions,
             )
         )
-    cloner = Cloner(tickets, project, inject=inject,
-                    custom_substitutions=custom_substitutions,
-                    prod=prod, dry_run=dry_run)
+    run_cloners(tickets, project, inject, targets=targets,
+                custom_substitutions=custom_substitutions,
+                prod=prod, dry_run=dry_run, bulk=bulk,
+                workers=workers, async_requests=async_requests,
+                journal=journal, find_existing=find_existing, plan=plan,
+                plan_latency=plan_latency, plan_reads=reads)
+
+
+def run_cloners(tickets, project, inject, targets=None,
+                custom_substitutions=None, prod=False, plan=None,
+                plan_latency=DEFAULT_LATENCY, plan_reads=None, **kwargs):
+    """Clone and link tickets, once for every target if targets are passed.
+
+    Args:
+        tickets: List of Ticket objects
+        project: String project key in JIRA in which new tickets are created
+        inject: Dictionary with values for injecting formatted for JIRA API
+        targets: List of Target namedtuples, default None
+        custom_substitutions: dict with {"VAR": "substitution",}
+        prod: Choose if production JIRA is used, default False
+        plan: File object, if passed nothing is cloned and execution plan is
+              written to it, default None
+        plan_latency: Seconds of one request assumed by plan, default
+                      DEFAULT_LATENCY
+        plan_reads: Tuple (dictionary operation: number of requests,
+                    seconds) of requests sent to find tickets, added to
+                    plan, default None
+        kwargs: Other keyword arguments of create_cloner()
+    """
+    if plan is not None:
+        # nothing is created, clones of previous runs are still looked up
+        kwargs['dry_run'] = False
+        cloner = create_cloner(tickets, project, inject=inject,
+                               custom_substitutions=custom_substitutions,
+                               prod=prod, **kwargs)
+        concurrency = 1 if cloner.bulk else \
+            getattr(cloner, 'max_in_flight', cloner.workers)
+        planner = Planner(cloner, concurrency=concurrency,
+                          latency=plan_latency)
+        if plan_reads is not None:
+            planner.add_reads(*plan_reads)
+        planner.plan_tickets().write(plan)
+        return
+    if targets:
+        fan_out(tickets, targets,
+                partial(create_cloner, project=project, prod=prod, **kwargs),
+                inject=inject, custom_substitutions=custom_substitutions,
+                prod=prod)
+        return
+    cloner = create_cloner(tickets, project, inject=inject,
+                           custom_substitutions=custom_substitutions,
+                           prod=prod, **kwargs)
     cloner.clone_tickets()
     cloner.link_tickets()
 
 
+def create_cloner(tickets, project, workers=1, async_requests=False,
+                  **kwargs):
+    """Create Cloner or AsyncCloner for given tickets.
+
+    Args:
+        tickets: List of Ticket objects
+        project: String project key in JIRA in which new tickets are created
+        workers: Number of tickets cloned concurrently, with async_requests
+                 number of requests in flight, default 1
+        async_requests: If True AsyncCloner is created, default False
+        kwargs: Other keyword arguments of Cloner
+
+    Returns:
+        Cloner instance
+    """
+    if async_requests and not kwargs.get('bulk'):
+        max_in_flight = workers if workers > 1 else DEFAULT_MAX_IN_FLIGHT
+        return AsyncCloner(tickets, project, max_in_flight=max_in_flight,
+                           **kwargs)
+    return Cloner(tickets, project, workers=workers, **kwargs)
+
+
 def clone_subtask_to_existing_parent(subtask_id, parent_id, project, inject,
                                      position=None,
                                      prod=False, dry_run=False,
-                                     custom_substitutions=None):
+                                     custom_substitutions=None, plan=None,
+                                     plan_latency=DEFAULT_LATENCY):
     """Clone single subtask to existing parent task.
 
     Args:
@@ -268,7 +550,19 @@ def clone_subtask_to_existing_parent(subtask_id, parent_id, project, inject,
         prod: Choose if production JIRA is used, default False
         dry_run: If True action is not performed, just logged, default False
         custom_substitutions: dict with {"VAR": "substitution",}
+        plan: File object, if passed nothing is cloned and execution plan is
+              written to it, default None
+        plan_latency: Seconds of one request assumed by plan, default
+                      DEFAULT_LATENCY
     """
+    if plan is not None:
+        subtask = Ticket(prod=prod, ticket_id=subtask_id,
+                         custom_substitutions=custom_substitutions)
+        planner = Planner(Cloner([], project, inject=inject, prod=prod),
+                          latency=plan_latency)
+        planner.plan_subtask(subtask, parent_id, position=position)
+        planner.write(plan)
+        return
     cloner = Cloner(
                 [],
                 project,
@@ -0,0 +1,105 @@
+"""Module with write-ahead journal of cloning operations.
+
+Journal is a file with one JSON object per line, every finished operation
+is appended and flushed to disk before cloning continues, so a run that
+died can be resumed without creating duplicates.
+"""
+
+import json
+import logging
+import os
+import threading
+
+
+class Journal(object):
+    """Append-only journal of finished cloning operations.
+
+    Recorded operations are:
+        {"op": "create", "template": ID, "clone": ID}
+        {"op": "remote_links", "template": ID}
+        {"op": "comment", "template": ID}
+        {"op": "link", "clones": [ID, ID]}
+
+    Args:
+        path: Path to the journal file
+        resume: If True operations already in the file are loaded and new
+                ones are appended, otherwise the file is truncated, default
+                False
+    """
+
+    def __init__(self, path, resume=False):
+        self.path = path
+        self.cloned = {}
+        self.done = set()
+        self.linked = set()
+        self._lock = threading.Lock()
+        if resume and os.path.exists(path):
+            self._replay()
+            self._repair_tail()
+        self._file = open(path, 'a' if resume else 'w')
+
+    def _replay(self):
+        """Load operations recorded in the file."""
+        with open(self.path) as f:
+            for number, line in enumerate(f, 1):
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # last line may be cut off when the run died
+                    logging.warning('Skipping invalid line {0} of journal '
+                                    '{1}'.format(number, self.path))
+                    continue
+                self._apply(record)
+        logging.info('Resuming with {0} cloned tickets from {1}'.format(
+            len(self.cloned), self.path))
+
+    def _repair_tail(self):
+        """Make sure appended records start on a new line.
+
+        Last line cut off when the run died is removed, complete record
+        without newline gets it.
+        """
+        with open(self.path, 'rb+') as f:
+            data = f.read()
+            if not data or data.endswith('\n'):
+                return
+            start = data.rfind('\n') + 1
+            try:
+                json.loads(data[start:])
+            except ValueError:
+                f.truncate(start)
+            else:
+                f.write('\n')
+
+    def _apply(self, record):
+        """Update state of the journal with one record."""
+        if record['op'] == 'create':
+            self.cloned[record['template']] = record['clone']
+        elif record['op'] == 'link':
+            self.linked.add(frozenset(record['clones']))
+        else:
+            self.done.add((record['op'], record['template']))
+
+    def record(self, op, **data):
+        """Append finished operation to the journal and flush it to disk.
+
+        Args:
+            op: Name of the operation, 'create', 'remote_links', 'comment' or
+                'link'
+            data: Fields of the operation
+        """
+        data['op'] = op
+        with self._lock:
+            self._apply(data)
+            self._file.write(json.dumps(data, sort_keys=True) + '\n')
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def is_done(self, op, template):
+        """Return True if operation on template was already recorded."""
+        return (op, template) in self.done
+
+    def close(self):
+        """Close the journal file."""
+        with self._lock:
+            self._file.close()
@@ -0,0 +1,114 @@
+"""Module with listing of found tickets as text, NDJSON or CSV.
+
+Rows are written as soon as they are read from search results, so listing
+can be piped to other tools while the search is still running.
+"""
+
+import csv
+import json
+import logging
+
+from collections import OrderedDict
+
+# fields requested for every listed ticket
+SEARCH_FIELDS = ('summary', 'customfield_11911', 'labels')
+FORMATS = ('text', 'ndjson', 'csv')
+# columns present in every row
+BASE_COLUMNS = ('key', 'summary', 'pav', 'labels')
+
+
+def ticket_row(issue, fields=()):
+    """Return row describing ticket found by search.
+
+    Args:
+        issue: Dictionary with content of the issue from search results
+        fields: Names of additional fields, default ()
+
+    Returns:
+        OrderedDict with key, summary, pav, labels and additional fields
+    """
+    content = issue.get('fields', {})
+    row = OrderedDict()
+    row['key'] = issue['key']
+    row['summary'] = content.get('summary')
+    row['pav'] = [item.get('value') for item in
+                  content.get('customfield_11911') or []]
+    row['labels'] = content.get('labels') or []
+    for field in fields:
+        if field not in BASE_COLUMNS:
+            row[field] = content.get(field)
+    return row
+
+
+def field_text(value):
+    """Return field value as plain text.
+
+    Lists are joined with ', ', of objects (e.g. status or PAV option) the
+    value, name or key is used.
+
+    Args:
+        value: Field value from JSON content of the issue
+
+    Returns:
+        Unicode string, empty if value is not set
+    """
+    if value is None:
+        return u''
+    if isinstance(value, list):
+        return u', '.join(field_text(item) for item in value)
+    if isinstance(value, dict):
+        for key in ('value', 'name', 'key'):
+            if key in value:
+                return field_text(value[key])
+        return json.dumps(value, sort_keys=True).decode('utf-8')
+    if isinstance(value, str):
+        return value.decode('utf-8')
+    return unicode(value)
+
+
+def write_listing(issues, out, output_format='text', fields=(), log=None):
+    """Write row for every issue as it arrives.
+
+    Text is logged in the same way as it always was, with additional fields
+    on one line after PAV and labels. NDJSON has one JSON object per line,
+    CSV has a header line.
+
+    Args:
+        issues: Iterable of dictionaries with content of issues
+        out: File object to write NDJSON and CSV to
+        output_format: One of FORMATS, default 'text'
+        fields: Names of additional fields, default ()
+        log: Logger for text output, default root logger
+
+    Returns:
+        Number of written rows
+    """
+    log = log or logging.getLogger()
+    writer = None
+    count = 0
+    for issue in issues:
+        row = ticket_row(issue, fields=fields)
+        if output_format == 'ndjson':
+            out.write(json.dumps(row) + '\n')
+        elif output_format == 'csv':
+            if writer is None:
+                writer = csv.writer(out)
+                writer.writerow(list(row))
+            writer.writerow([field_text(value).encode('utf-8')
+                             for value in row.values()])
+        else:
+            log.info(u'Ticket: {0} - {1}'.format(row['key'], row['summary']))
+            log.info('PAV: {0}, Labels: {1}'.format(
+                ", ".join(row['pav']) if row['pav'] else None,
+                ", ".join(row['labels']) if row['labels'] else None))
+            extra = [u'{0}: {1}'.format(field, field_text(row[field]))
+                     for field in fields if field not in BASE_COLUMNS]
+            if extra:
+                log.info(u', '.join(extra))
+        if output_format != 'text':
+            out.flush()
+        count += 1
+    if output_format == 'csv' and writer is None:
+        csv.writer(out).writerow(list(ticket_row({'key': None},
+                                                 fields=fields)))
+    return count
@@ -4,8 +4,12 @@ import argparse
 import logging
 import sys
 
+from ticketutil.ticket import TicketException
+
+from stats import enable_stats, report_stats
 from ticket import Ticket
-from utils import get_ticket_IDs
+from utils import iter_ticket_IDs
+from workers import map_streaming, DEFAULT_WORKERS
 
 
 def main():
@@ -20,8 +24,19 @@ def main():
     prod = args.server == 'prod'
     if not args.pav or not args.pav_append:
         parser.error('Arguments PAV and PAVAppend are required')
-    append_pav_to_tickets(args.pav, args.pav_append, prod=prod,
-                          dry_run=args.dry_run)
+    if args.stats is not None:
+        enable_stats()
+    try:
+        failed = append_pav_to_tickets(args.pav, args.pav_append, prod=prod,
+                                       dry_run=args.dry_run,
+                                       workers=args.workers)
+    except TicketException:
+        # the failed search was already logged
+        failed = True
+    if args.stats is not None:
+        report_stats(log, path=args.stats)
+    if failed:
+        sys.exit(1)
 
 
 def create_parser():
@@ -42,32 +57,85 @@ def create_parser():
     parser.add_argument("--pav-append",
                         help="PAV value that will be appended to all "
                              "tickets.")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help="Number of tickets updated concurrently, "
+                             "default {0}".format(DEFAULT_WORKERS))
     parser.add_argument("--dry-run", action="store_true",
                         help="Do not perform actions, just provide output "
                              "about what would happen.")
+    parser.add_argument("--stats", nargs="?", const="", metavar="PATH",
+                        help="Log count, size and latency percentiles of "
+                             "requests per operation at the end of the run, "
+                             "write them also as JSON to PATH if given")
     parser.add_argument("--debug", action="store_true",
                         help="Print debug messages. It's very spammy.")
     return parser
 
 
-def append_pav_to_tickets(pav, pav_append, prod=False, dry_run=False):
+def append_pav_to_tickets(pav, pav_append, prod=False, dry_run=False,
+                          workers=DEFAULT_WORKERS):
     """Find tickets with given PAV and append new PAV to them.
 
+    Tickets that already have the new PAV are left out by the search.
+    Tickets are updated concurrently as pages of search results arrive,
+    without requesting their content, and summary of results is logged at
+    the end.
+
     Args:
         pav: Existing PAV to search with
         pav_append: New PAV that will be added to tickets
         prod: Choose if production JIRA is used, default False
         dry_run: If True action is not performed, just logged, default False
+        workers: Number of tickets updated concurrently, default
+                 DEFAULT_WORKERS
+
+    Returns:
+        Dictionary ticket ID: error message of tickets that failed
+
+    Raises:
+        TicketException if search failed, tickets found before it are
+        updated anyway
     """
-    ticket_ids = get_ticket_IDs(prod=prod, pav=pav)
-    if not ticket_ids:
-        logging.error('No tickets match provided PAV')
-        return
-    for ticket_id in ticket_ids:
+    ticket_ids = iter_ticket_IDs(prod=prod, pav=pav, without_pav=pav_append)
+
+    def append(ticket_id):
+        if dry_run:
+            logging.info('Would append PAV to ticket {0}'.format(ticket_id))
+            return None
         logging.debug('Appending PAV to ticket {0}'.format(ticket_id))
-        if not dry_run:
-            ticket = Ticket(prod=prod, ticket_id=ticket_id)
-            ticket.add_pav(pav_append)
+        ticket = Ticket.for_id(ticket_id, prod=prod)
+        return ticket.add_pav(pav_append)
+
+    results = map_streaming(append, ticket_ids,
+                            workers=1 if dry_run else workers)
+    if not results:
+        logging.error('No tickets match provided PAV or all of them already '
+                      'have {0}'.format(pav_append))
+        return {}
+    if dry_run:
+        return {}
+    failed = {}
+    for ticket_id, result in results:
+        if result.status == 'Failure':
+            failed[ticket_id] = result.error_message
+    log_summary(pav_append, [ticket_id for ticket_id, _ in results], failed)
+    return failed
+
+
+def log_summary(pav_append, ticket_ids, failed):
+    """Log number of updated tickets and errors of failed ones.
+
+    Args:
+        pav_append: Appended PAV
+        ticket_ids: List of IDs of all tickets
+        failed: Dictionary ticket ID: error message of failed tickets
+    """
+    logging.info('Appended PAV {0} to {1} of {2} tickets'.format(
+        pav_append, len(ticket_ids) - len(failed), len(ticket_ids)))
+    for ticket_id in ticket_ids:
+        if ticket_id in failed:
+            logging.error('Failed to append PAV to {0}: {1}'.format(
+                ticket_id, failed[ticket_id]))
 
 
 if __name__ == '__main__':
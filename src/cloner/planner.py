@@ -0,0 +1,349 @@
+"""Module with execution plans of cloning.
+
+Plan is the ordered graph of operations a Cloner would perform (creates,
+remote links, comments, links and subtask moves) with unique placeholder
+IDs of clones, number of requests of every operation and wall time
+estimated for given concurrency. Templates and their remote links are read
+with the same batched prefetches as a real run, requests of the prefetch
+are counted too.
+"""
+
+import heapq
+import itertools
+import json
+import time
+
+from collections import OrderedDict
+
+from resolver import prefetch_remote_links
+from stats import disable_stats, enable_stats, get_stats
+from ticket import BULK_CREATE_SIZE
+from workers import DEFAULT_WORKERS
+
+# assumed average latency of one request in seconds
+DEFAULT_LATENCY = 0.25
+
+
+def count_requests(func, *args, **kwargs):
+    """Call func counting requests it sends per operation.
+
+    Args:
+        func: Function to call
+        args: Positional arguments of func
+        kwargs: Keyword arguments of func
+
+    Returns:
+        Tuple (return value of func, dictionary operation: number of
+        requests, seconds func took)
+    """
+    stats = get_stats()
+    enabled = stats is None
+    if enabled:
+        stats = enable_stats()
+    before = stats.summary()
+    started = time.time()
+    try:
+        result = func(*args, **kwargs)
+    finally:
+        seconds = time.time() - started
+        counts = {}
+        for operation, summary in stats.summary().items():
+            count = summary['count'] - before.get(
+                operation, {}).get('count', 0)
+            if count:
+                counts[operation] = count
+        if enabled:
+            disable_stats()
+    return result, counts, seconds
+
+
+def estimate_seconds(operations, concurrency=1, latency=DEFAULT_LATENCY):
+    """Estimate wall time of operations by list scheduling.
+
+    Operations are started in their order as soon as their dependencies
+    are finished and one of concurrency slots is free, each request takes
+    latency seconds. Operations of phase 'link' start after all other ones,
+    as links are created once all tickets are cloned, on at least
+    DEFAULT_WORKERS slots.
+
+    Args:
+        operations: List of dictionaries with 'id', 'phase', 'requests',
+                    'depends_on' and 'after' (lists of IDs)
+        concurrency: Number of operations performed at the same time,
+                     default 1
+        latency: Seconds of one request, default DEFAULT_LATENCY
+
+    Returns:
+        Estimated number of seconds
+    """
+    finished = {}
+    phase_start = 0.0
+    for phase, slots in (('clone', concurrency),
+                         ('link', max(concurrency, DEFAULT_WORKERS))):
+        free = [phase_start] * max(slots, 1)
+        phase_end = phase_start
+        for operation in operations:
+            if operation['phase'] != phase:
+                continue
+            ready = max([finished.get(dependency, phase_start)
+                         for dependency in operation['depends_on'] +
+                         operation['after']] + [phase_start])
+            start = max(heapq.heappop(free), ready)
+            end = start + operation['requests'] * latency
+            finished[operation['id']] = end
+            heapq.heappush(free, end)
+            phase_end = max(phase_end, end)
+        phase_start = phase_end
+    return phase_start
+
+
+class Planner(object):
+    """Execution plan of a Cloner built without creating anything.
+
+    Args:
+        cloner: Cloner object, its options (project, bulk, journal) decide
+                the operations
+        concurrency: Number of requests performed at the same time, default
+                     1
+        latency: Assumed seconds of one request, default DEFAULT_LATENCY
+    """
+
+    def __init__(self, cloner, concurrency=1, latency=DEFAULT_LATENCY):
+        self.cloner = cloner
+        self.concurrency = concurrency
+        self.latency = latency
+        self.operations = []
+        self.templates = 0
+        # requests sent while planning per operation, see stats.classify()
+        self.reads = {}
+        self.prefetch_seconds = 0.0
+        self._placeholders = itertools.count(1)
+        # template ID: ID of its clone (placeholder or clone of previous run)
+        self._clones = {}
+        # template ID: ID of operation creating its clone
+        self._creates = {}
+
+    def add_reads(self, counts, seconds):
+        """Add requests sent before planning, e.g. search of templates.
+
+        Args:
+            counts: Dictionary operation: number of requests
+            seconds: Seconds the requests took
+        """
+        for operation, count in counts.items():
+            self.reads[operation] = self.reads.get(operation, 0) + count
+        self.prefetch_seconds += seconds
+
+    def _prefetch(self, func, *args):
+        """Call func counting requests it sends and time it takes.
+
+        Returns:
+            Return value of func
+        """
+        result, counts, seconds = count_requests(func, *args)
+        self.add_reads(counts, seconds)
+        return result
+
+    def _add(self, op, depends_on=(), requests=1, phase='clone', after=(),
+             **data):
+        """Append operation to the plan.
+
+        Operation is performed once operations in depends_on succeeded and
+        operations in after finished, failed or were skipped.
+
+        Returns:
+            ID of the operation
+        """
+        operation = OrderedDict([
+            ('id', len(self.operations) + 1), ('op', op),
+            ('phase', phase), ('requests', requests),
+            ('depends_on', sorted(set(d for d in depends_on
+                                      if d is not None))),
+            ('after', sorted(set(d for d in after if d is not None)))])
+        operation.update(sorted(data.items()))
+        self.operations.append(operation)
+        return operation['id']
+
+    def _clone(self, ticket):
+        """Assign ID to clone of template, existing clone of previous run
+        is reused.
+
+        Returns:
+            True if the clone has to be created
+        """
+        existing = self.cloner._existing.get(ticket.ticket_id)
+        if existing is not None:
+            self._clones[ticket.ticket_id] = existing
+            return False
+        self._clones[ticket.ticket_id] = '{0}-NEW-{1}'.format(
+            self.cloner.project, next(self._placeholders))
+        return True
+
+    def _add_clone_operations(self, ticket, create, comment=True):
+        """Append remote links and comment of clone of ticket, comment
+        is added after the remote links.
+        """
+        clone = self._clones[ticket.ticket_id]
+        remote_links = []
+        if not self.cloner._is_done('remote_links', ticket):
+            for remote_link in ticket.remote_links or []:
+                remote_links.append(self._add(
+                    'remote link', [create], clone=clone,
+                    template=ticket.ticket_id,
+                    url=remote_link.get('object', {}).get('url')))
+        if comment and not self.cloner._is_done('comment', ticket):
+            self._add('comment', [create] + remote_links, clone=clone,
+                      template=ticket.ticket_id)
+
+    def plan_tickets(self):
+        """Plan cloning of tickets of the cloner and links between them.
+
+        Returns:
+            self
+        """
+        cloner = self.cloner
+        templates = self._prefetch(cloner.collect_tickets)
+        self.templates += len(templates)
+        self._prefetch(prefetch_remote_links, [
+            ticket for ticket, parent_id in templates
+            if not cloner._is_done('remote_links', ticket)])
+        if cloner.bulk:
+            self._plan_bulk(templates)
+        else:
+            last_subtask = {}
+            for ticket, parent_id in templates:
+                # failed subtask doesn't stop creating of its siblings
+                after = [self._creates.get(last_subtask.get(parent_id))]
+                if parent_id is not None:
+                    last_subtask[parent_id] = ticket.ticket_id
+                create = None
+                if self._clone(ticket):
+                    create = self._add(
+                        'create', [self._creates.get(parent_id)], after=after,
+                        clone=self._clones[ticket.ticket_id],
+                        template=ticket.ticket_id,
+                        parent=self._clones.get(parent_id),
+                        summary=ticket.summary)
+                    self._creates[ticket.ticket_id] = create
+                self._add_clone_operations(ticket, create)
+        self._plan_links()
+        return self
+
+    def _plan_bulk(self, templates):
+        """Plan bulk creates of tasks and then of subtasks."""
+        waves = ([(t, p) for t, p in templates if p is None],
+                 [(t, p) for t, p in templates if p is not None])
+        previous = []
+        for wave in waves:
+            created = [(ticket, parent_id) for ticket, parent_id in wave
+                       if self._clone(ticket)]
+            batches = []
+            for i in range(0, len(created), BULK_CREATE_SIZE):
+                batch = created[i:i + BULK_CREATE_SIZE]
+                create = self._add(
+                    'bulk create', previous,
+                    clones=[self._clones[t.ticket_id] for t, p in batch],
+                    templates=[t.ticket_id for t, p in batch])
+                batches.append(create)
+                for ticket, parent_id in batch:
+                    self._creates[ticket.ticket_id] = create
+            for ticket, parent_id in wave:
+                self._add_clone_operations(
+                    ticket, self._creates.get(ticket.ticket_id))
+            previous = batches
+
+    def _plan_links(self):
+        """Plan links between clones not linked by previous run."""
+        linked = set(self.cloner._linked)
+        for ticket_id_1, ticket_id_2, link_type, direction in \
+                self.cloner._links:
+            clone_1 = self._clones.get(ticket_id_1)
+            clone_2 = self._clones.get(ticket_id_2)
+            if not clone_1 or not clone_2:
+                continue
+            pair = frozenset((clone_1, clone_2))
+            if pair in linked:
+                continue
+            linked.add(pair)
+            self._add('link', [self._creates.get(ticket_id_1),
+                               self._creates.get(ticket_id_2)],
+                      phase='link', clones=[clone_1, clone_2],
+                      type=link_type, direction=direction)
+
+    def plan_subtask(self, ticket, parent_id, position=None):
+        """Plan cloning of subtask into existing parent.
+
+        Args:
+            ticket: Ticket object of the subtask template
+            parent_id: JIRA id of an existing task
+            position: Zero-indexed position the clone is moved to, default
+                      None (clone stays last)
+
+        Returns:
+            self
+        """
+        if self._prefetch(lambda: ticket.status) == 'Deprecated':
+            return self
+        self._prefetch(lambda: ticket.remote_links)
+        self.templates += 1
+        # parent is read to verify position and again after the clone
+        # was added to its subtasks
+        read = self._add('content', template=parent_id)
+        self._clone(ticket)
+        create = self._add('create', [read],
+                           clone=self._clones[ticket.ticket_id],
+                           template=ticket.ticket_id, parent=parent_id,
+                           summary=ticket.summary)
+        self._creates[ticket.ticket_id] = create
+        self._add_clone_operations(ticket, create, comment=False)
+        read = self._add('content', [create], template=parent_id)
+        if position is not None:
+            self._add('subtask move', [read], parent=parent_id,
+                      position=position)
+        return self
+
+    def requests(self):
+        """Return number of requests per operation.
+
+        Prefetch requests sent while planning are included, as well as
+        request for the current user needed for reporter of clones.
+
+        Returns:
+            OrderedDict operation: number of requests ordered by name
+        """
+        counts = dict(self.reads)
+        for operation in self.operations:
+            counts[operation['op']] = \
+                counts.get(operation['op'], 0) + operation['requests']
+        if any(operation['op'] in ('create', 'bulk create')
+               for operation in self.operations):
+            counts['user'] = counts.get('user', 0) + 1
+        return OrderedDict(sorted(counts.items()))
+
+    def to_dict(self):
+        """Return the plan as OrderedDict serializable to JSON."""
+        requests = self.requests()
+        estimate = estimate_seconds(self.operations,
+                                    concurrency=self.concurrency,
+                                    latency=self.latency)
+        return OrderedDict([
+            ('project', self.cloner.project),
+            ('templates', self.templates),
+            ('concurrency', self.concurrency),
+            ('latency', self.latency),
+            ('requests', requests),
+            ('total_requests', sum(requests.values())),
+            ('prefetch_seconds', round(self.prefetch_seconds, 3)),
+            ('estimated_seconds', round(self.prefetch_seconds + estimate,
+                                        3)),
+            ('operations', self.operations),
+        ])
+
+    def write(self, out):
+        """Write the plan as JSON.
+
+        Args:
+            out: File object
+        """
+        json.dump(self.to_dict(), out, indent=2)
+        out.write('\n')
@@ -0,0 +1,151 @@
+"""Module for fetching whole graphs of templates with batched searches."""
+
+import logging
+
+from ticket import Ticket, cache_template, get_template_cache
+from workers import map_concurrently, DEFAULT_WORKERS
+
+# maximal number of keys in one 'key in (...)' search
+KEY_CHUNK_SIZE = 100
+
+
+def referenced_ids(ticket):
+    """Return IDs of templates referenced by ticket as parent, subtasks or
+    links.
+
+    Args:
+        ticket: Ticket object
+
+    Returns:
+        List of string ticket IDs
+    """
+    if ticket.status == 'Deprecated':
+        # deprecated tickets are not cloned, so are not their references
+        return []
+    ids = []
+    if ticket.parent_id:
+        ids.append(ticket.parent_id)
+    ids.extend(ticket.subtask_ids)
+    ids.extend(link[0] for link in ticket.links)
+    return ids
+
+
+def fetch_tickets(ticket_ids, prod=False, custom_substitutions=None,
+                  workers=DEFAULT_WORKERS):
+    """Fetch tickets with chunked 'key in (...)' searches.
+
+    Chunks are searched concurrently. JIRA rejects the whole search if one
+    of the keys doesn't exist, so failed chunk is split in halves that are
+    searched again until the failing keys are found, only those are not
+    returned. Cached templates are not searched and fetched templates are
+    cached.
+
+    Args:
+        ticket_ids: List of string ticket IDs
+        prod: Bool value to choose if production JIRA is used, default False
+        custom_substitutions: Dict with {VAR: value}, default None
+        workers: Maximal number of concurrent searches, default
+                 DEFAULT_WORKERS
+
+    Returns:
+        Dictionary ticket ID: Ticket object
+    """
+    ticket_ids = list(ticket_ids)
+    if not ticket_ids:
+        return {}
+    # create dummy ticket to search with
+    searcher = Ticket(prod=prod)
+    tickets = {}
+    cache = get_template_cache()
+    if cache is not None:
+        for ticket_id in ticket_ids:
+            content = cache.get(searcher.url, ticket_id)
+            if content is not None:
+                tickets[ticket_id] = Ticket.from_content(
+                    content, prod=prod,
+                    custom_substitutions=custom_substitutions)
+        ticket_ids = [ticket_id for ticket_id in ticket_ids
+                      if ticket_id not in tickets]
+        logging.debug('{0} templates found in cache'.format(len(tickets)))
+    chunks = [ticket_ids[i:i + KEY_CHUNK_SIZE]
+              for i in range(0, len(ticket_ids), KEY_CHUNK_SIZE)]
+
+    def search_chunk(chunk):
+        issues = searcher.search_issues('key in ({0})'.format(
+            ', '.join(chunk)))
+        if not hasattr(issues, 'status'):
+            return issues
+        if len(chunk) == 1:
+            logging.debug('Failed to fetch {0} in batch'.format(chunk[0]))
+            return []
+        half = len(chunk) // 2
+        return search_chunk(chunk[:half]) + search_chunk(chunk[half:])
+
+    for issues in map_concurrently(search_chunk, chunks, workers=workers):
+        for issue in issues:
+            cache_template(searcher.url, issue)
+            tickets[issue['key']] = Ticket.from_content(
+                issue, prod=prod, custom_substitutions=custom_substitutions)
+    return tickets
+
+
+def resolve_closure(tickets, prod=False, custom_substitutions=None,
+                    known=None, workers=DEFAULT_WORKERS):
+    """Fetch all templates reachable from tickets through parents, subtasks
+    and links.
+
+    Graph is walked breadth-first, every level is fetched with batched
+    searches, so number of round trips depends on depth of the graph and
+    not on number of templates.
+
+    Args:
+        tickets: List of Ticket objects to start from
+        prod: Bool value to choose if production JIRA is used, default False
+        custom_substitutions: Dict with {VAR: value}, default None
+        known: Dictionary ticket ID: Ticket object of already fetched
+               templates, default None
+        workers: Maximal number of concurrent searches, default
+                 DEFAULT_WORKERS
+
+    Returns:
+        Dictionary ticket ID: Ticket object with all fetched templates,
+        templates that could not be fetched are missing
+    """
+    templates = dict(known or {})
+    templates.update((ticket.ticket_id, ticket) for ticket in tickets)
+    attempted = set(templates)
+    level = list(tickets)
+    while level:
+        frontier = []
+        for ticket in level:
+            for ticket_id in referenced_ids(ticket):
+                if ticket_id not in attempted:
+                    attempted.add(ticket_id)
+                    frontier.append(ticket_id)
+        if not frontier:
+            break
+        logging.debug('Fetching {0} referenced templates'.format(
+            len(frontier)))
+        fetched = fetch_tickets(frontier, prod=prod,
+                                custom_substitutions=custom_substitutions,
+                                workers=workers)
+        templates.update(fetched)
+        level = list(fetched.values())
+    return templates
+
+
+def prefetch_remote_links(tickets, workers=DEFAULT_WORKERS):
+    """Request remote links of tickets concurrently, so they are available
+    in tickets once they are cloned.
+
+    Remote links of deprecated tickets are not requested, as they are not
+    cloned.
+
+    Args:
+        tickets: List of Ticket objects
+        workers: Maximal number of concurrent requests, default
+                 DEFAULT_WORKERS
+    """
+    tickets = [ticket for ticket in tickets if ticket.status != 'Deprecated']
+    map_concurrently(lambda ticket: ticket.remote_links, tickets,
+                     workers=workers)
@@ -0,0 +1,175 @@
+"""Module with timeouts and retries of requests to JIRA.
+
+Idempotent requests are sent again after transient failures (connection
+errors, timeouts and 5xx responses) with jittered exponential backoff. Other
+requests are sent again only if they surely didn't reach the server,
+otherwise only after a check that the write didn't happen (see
+post_with_check()).
+"""
+
+import logging
+import random
+import threading
+import time
+
+import requests
+from requests.packages.urllib3.exceptions import NewConnectionError
+
+CONNECT_TIMEOUT = 10
+READ_TIMEOUT = 120
+# maximal number of repeated attempts after failed one
+DEFAULT_RETRIES = 4
+# wait in seconds before the first repeated attempt, doubled for next ones
+BACKOFF_BASE = 0.5
+# longest wait in seconds between attempts
+BACKOFF_CAP = 30.0
+RETRY_STATUSES = (500, 502, 503, 504)
+
+_lock = threading.Lock()
+
+
+class RetryPolicy(object):
+    """Timeouts and retries of requests.
+
+    Args:
+        timeout: Tuple (connect timeout, read timeout) in seconds, default
+                 (CONNECT_TIMEOUT, READ_TIMEOUT)
+        retries: Maximal number of repeated attempts, default DEFAULT_RETRIES
+        backoff: Wait in seconds before the first repeated attempt, default
+                 BACKOFF_BASE
+        cap: Longest wait in seconds, default BACKOFF_CAP
+    """
+
+    def __init__(self, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT),
+                 retries=DEFAULT_RETRIES, backoff=BACKOFF_BASE,
+                 cap=BACKOFF_CAP):
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.cap = cap
+
+    def delay(self, attempt):
+        """Return random wait before repeating failed attempt ("full
+        jitter"), so clients failed at the same time don't retry together.
+
+        Args:
+            attempt: Number of failed attempts, starting with 1
+        """
+        return random.uniform(0, min(self.cap,
+                                     self.backoff * 2 ** (attempt - 1)))
+
+    def wait(self, attempt):
+        """Sleep before repeating failed attempt."""
+        time.sleep(self.delay(attempt))
+
+
+_policy = RetryPolicy()
+
+
+def get_retry_policy():
+    """Return retry policy used by all requests."""
+    return _policy
+
+
+def configure_retries(**settings):
+    """Replace retry policy used by all requests.
+
+    Args:
+        settings: Keyword arguments of RetryPolicy
+    """
+    global _policy
+    with _lock:
+        _policy = RetryPolicy(**settings)
+
+
+def is_transient(error=None, response=None):
+    """Return True if failure may disappear when request is sent again.
+
+    Args:
+        error: requests.RequestException raised by request, default None
+        response: requests.Response, default None
+    """
+    if error is not None:
+        return isinstance(error, (requests.ConnectionError, requests.Timeout))
+    return response is not None and response.status_code in RETRY_STATUSES
+
+
+def was_not_sent(error):
+    """Return True if request surely didn't reach the server, so it can be
+    sent again even if it is not idempotent.
+
+    Args:
+        error: requests.RequestException raised by request
+    """
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    if isinstance(error, requests.ConnectionError) and error.args:
+        reason = getattr(error.args[0], 'reason', None)
+        return isinstance(reason, NewConnectionError)
+    return False
+
+
+def post_with_check(session, url, payload, check):
+    """Send POST request, send it again after ambiguous failure only if
+    check shows that the previous attempt didn't write anything.
+
+    Args:
+        session: requests.Session
+        url: Requested URL
+        payload: Json payload
+        check: Function without arguments returning content written by
+               previous attempt as it would be returned in response, or None
+               if nothing was written
+
+    Returns:
+        Json content of the response or returned by check
+
+    Raises:
+        requests.RequestException if request failed
+    """
+    policy = get_retry_policy()
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            r = session.post(url, json=payload)
+        except requests.RequestException as e:
+            # requests that didn't reach the server were already repeated by
+            # transport adapter
+            if not is_transient(error=e) or was_not_sent(e) or \
+                    attempt > policy.retries:
+                raise
+            logging.debug('POST {0} failed: {1}'.format(url, e))
+        else:
+            if not is_transient(response=r) or attempt > policy.retries:
+                r.raise_for_status()
+                return r.json() if r.content else {}
+            logging.debug('POST {0} failed with {1}'.format(url,
+                                                            r.status_code))
+        written = check()
+        if written is not None:
+            logging.debug('POST {0} was done by previous attempt'.format(url))
+            return written
+        policy.wait(attempt)
+
+
+def error_detail(error):
+    """Return message describing failed request.
+
+    Args:
+        error: requests.RequestException
+
+    Returns:
+        First JIRA error message or description of the exception
+    """
+    response = getattr(error, 'response', None)
+    if response is not None:
+        try:
+            content = response.json()
+            messages = (list(content.get('errors', {}).values()) +
+                        content.get('errorMessages', []))
+            if messages:
+                return messages[0]
+        except (ValueError, AttributeError, TypeError):
+            pass
+    return str(error)
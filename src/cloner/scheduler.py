@@ -0,0 +1,134 @@
+"""Module for running dependent tasks on a bounded pool of threads."""
+
+import logging
+
+from collections import defaultdict
+from multiprocessing.pool import ThreadPool
+from Queue import Queue
+
+from workers import DEFAULT_WORKERS
+
+
+class Scheduler(object):
+    """Executor of a dependency graph (DAG) of tasks.
+
+    Task is started as soon as all tasks it depends on and all tasks it is
+    ordered after are finished. If task raises an exception, all tasks
+    depending on it are skipped, tasks only ordered after it are still run.
+
+    Args:
+        workers: Maximal number of tasks running at the same time, default
+                 DEFAULT_WORKERS
+    """
+
+    def __init__(self, workers=DEFAULT_WORKERS):
+        self.workers = workers
+        self._tasks = {}
+        self._order = []
+        self.failed = {}
+        self.skipped = []
+
+    def add(self, name, func, depends_on=(), after=()):
+        """Add task to the graph.
+
+        Args:
+            name: Unique hashable name of the task
+            func: Callable without arguments performing the task
+            depends_on: Names of tasks that have to finish successfully
+                        before this one, names of tasks that were not added
+                        are ignored, default no dependencies
+            after: Names of tasks that have to finish, fail or be skipped
+                   before this one, default none
+        """
+        if name in self._tasks:
+            raise ValueError('Task {0} already added'.format(name))
+        self._tasks[name] = (func, list(depends_on), list(after))
+        self._order.append(name)
+
+    def run(self):
+        """Run all tasks and wait for them to finish.
+
+        Ready tasks are started in the order in which they were added.
+        Failed tasks are stored in self.failed with the raised exception,
+        tasks that were not run because of failed dependencies in
+        self.skipped.
+
+        Returns:
+            True if all tasks finished successfully, else False
+        """
+        waiting_for = {}
+        dependents = defaultdict(list)
+        followers = defaultdict(list)
+        for name in self._order:
+            func, depends_on, after = self._tasks[name]
+            deps = set(dep for dep in depends_on if dep in self._tasks)
+            order = set(dep for dep in after if dep in self._tasks)
+            waiting_for[name] = deps | order
+            for dep in deps:
+                dependents[dep].append(name)
+            for dep in order - deps:
+                followers[dep].append(name)
+        finished = Queue()
+        pool = ThreadPool(max(1, min(self.workers, len(self._order))))
+        running = [0]
+
+        def start(name):
+            running[0] += 1
+            pool.apply_async(self._run_task, (name, finished))
+
+        def release(name, dependents):
+            for dependent in dependents:
+                deps = waiting_for.get(dependent)
+                if deps is None:
+                    continue
+                deps.discard(name)
+                if not deps:
+                    start(dependent)
+
+        try:
+            for name in self._order:
+                if not waiting_for[name]:
+                    start(name)
+            while running[0]:
+                name, error = finished.get()
+                running[0] -= 1
+                if error is None:
+                    release(name, dependents[name] + followers[name])
+                    continue
+                self.failed[name] = error
+                release(name, followers[name])
+                for skipped in self._skip(dependents, name, waiting_for):
+                    release(skipped, followers[skipped])
+        finally:
+            pool.close()
+            pool.join()
+        return not self.failed and not self.skipped
+
+    def _run_task(self, name, finished):
+        """Run one task and report result to finished queue."""
+        try:
+            self._tasks[name][0]()
+        except Exception as e:
+            logging.exception('Task {0} failed'.format(name))
+            finished.put((name, e))
+        else:
+            finished.put((name, None))
+
+    def _skip(self, dependents, name, waiting_for):
+        """Skip all tasks that depend on failed task transitively.
+
+        Returns:
+            List of names of skipped tasks
+        """
+        skipped = []
+        stack = list(dependents[name])
+        while stack:
+            dependent = stack.pop()
+            if waiting_for.pop(dependent, None) is None:
+                continue
+            logging.debug('Skipping task {0}, task {1} failed'.format(
+                dependent, name))
+            self.skipped.append(dependent)
+            skipped.append(dependent)
+            stack.extend(dependents[dependent])
+        return skipped
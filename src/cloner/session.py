@@ -0,0 +1,153 @@
+"""Module with shared, authenticated requests sessions for JIRA servers."""
+
+import logging
+import threading
+
+import requests
+from requests_kerberos import HTTPKerberosAuth, DISABLED
+
+from requests.adapters import BaseAdapter
+
+from governor import GovernedAdapter, get_governor, reset_governors
+
+# maximum number of keep-alive connections kept open to one server
+POOL_SIZE = 32
+
+_sessions = {}
+_verified_projects = set()
+# server URL: name of the user the sessions are authenticated as
+_current_users = {}
+_lock = threading.Lock()
+# if True, sessions don't authenticate and refuse to send requests
+_offline = False
+
+
+class OfflineAdapter(BaseAdapter):
+    """Transport adapter failing every request, used in offline mode."""
+
+    def send(self, request, **kwargs):
+        raise requests.ConnectionError(
+            'JIRA is not contacted in offline mode: {0} {1}'.format(
+                request.method, request.url), request=request)
+
+    def close(self):
+        pass
+
+
+def set_offline(offline):
+    """Switch offline mode, in which templates are read only from snapshot
+    (see snapshot.py) and no request is sent to JIRA.
+
+    Args:
+        offline: True to work offline
+    """
+    global _offline
+    _offline = offline
+
+
+def is_offline():
+    """Return True if working offline."""
+    return _offline
+
+
+def get_session(url, auth_url, auth='kerberos'):
+    """Return session authenticated to JIRA server, create it on first use.
+
+    All tickets of one server share the same session, so authentication is
+    done only once per process and connections are kept alive between
+    requests. Session is safe to be used from multiple threads.
+
+    Args:
+        url: Base URL of JIRA server
+        auth_url: URL used for authentication
+        auth: 'kerberos' or tuple (username, password), default 'kerberos'
+
+    Returns:
+        requests.Session instance, None if authentication failed
+    """
+    key = (url, auth)
+    with _lock:
+        s = _sessions.get(key)
+        if s is None:
+            s = _create_session(auth_url, auth)
+            if s is not None:
+                _sessions[key] = s
+        return s
+
+
+def _create_session(auth_url, auth):
+    """Create new session with connection pool and authenticate it.
+
+    All requests of the session, including authentication, go through
+    governor of the server. In offline mode the session is not
+    authenticated and refuses every request.
+
+    Args:
+        auth_url: URL used for authentication
+        auth: 'kerberos' or tuple (username, password)
+
+    Returns:
+        requests.Session instance, None if authentication failed
+    """
+    s = requests.Session()
+    if _offline:
+        s.mount('https://', OfflineAdapter())
+        s.mount('http://', OfflineAdapter())
+        return s
+    adapter = GovernedAdapter(get_governor(auth_url),
+                              pool_connections=POOL_SIZE,
+                              pool_maxsize=POOL_SIZE)
+    s.mount('https://', adapter)
+    s.mount('http://', adapter)
+    if auth == 'kerberos':
+        s.auth = HTTPKerberosAuth(mutual_authentication=DISABLED)
+        s.verify = False
+    if isinstance(auth, tuple):
+        s.auth = auth
+    try:
+        r = s.get(auth_url)
+        logging.debug("Create requests session: status code: {0}".format(
+            r.status_code))
+        r.raise_for_status()
+        return s
+    except requests.RequestException as e:
+        logging.error("Error authenticating to {0}".format(auth_url))
+        logging.error(e)
+        s.close()
+
+
+def is_project_verified(url, project):
+    """Return True if project was already verified on given server."""
+    return (url, project) in _verified_projects
+
+
+def set_project_verified(url, project):
+    """Remember that project exists on given server."""
+    _verified_projects.add((url, project))
+
+
+def get_current_user(url):
+    """Return name of the current user on given server or None if it was
+    not requested yet.
+    """
+    return _current_users.get(url)
+
+
+def set_current_user(url, name):
+    """Remember name of the current user on given server."""
+    _current_users[url] = name
+
+
+def close_sessions():
+    """Close all shared sessions, forget verified projects, current users
+    and governors and leave offline mode.
+    """
+    global _offline
+    with _lock:
+        for s in _sessions.values():
+            s.close()
+        _sessions.clear()
+        _verified_projects.clear()
+        _current_users.clear()
+        _offline = False
+    reset_governors()
@@ -0,0 +1,225 @@
+"""Module with offline snapshot of the template project.
+
+Snapshot is a single file with content and remote links of all templates:
+
+    header line      SNAPSHOT_MAGIC
+    records          zlib compressed JSON {"content": ..., "remote_links": ...}
+    index            zlib compressed JSON with server, project, keywords
+                     field and entries key: [offset, length, issue type,
+                     PAVs, keywords]
+    trailer line     offset of the index as 20 digits
+
+The file is memory-mapped and only the index is parsed when it is opened,
+so a template is read by decompressing its single record and searches by
+PAV and keywords are answered from the index alone.
+"""
+
+import json
+import logging
+import mmap
+import os
+import re
+import time
+import zlib
+
+from ticket import Ticket
+from workers import map_concurrently, DEFAULT_WORKERS
+
+DEFAULT_SNAPSHOT_PATH = os.path.join(os.path.expanduser('~'), '.cache',
+                                     'rcm-cloning-tool', 'templates.snapshot')
+SNAPSHOT_MAGIC = 'RCMTEMPL-SNAPSHOT 1\n'
+# length of the trailer with offset of the index, including newline
+TRAILER_SIZE = 21
+# positions of values in index entries
+OFFSET, LENGTH, ISSUETYPE, PAVS, KEYWORDS = range(5)
+
+
+def _values(fields, field_id):
+    """Return list of values of a multi select field."""
+    return [item.get('value') for item in fields.get(field_id) or []]
+
+
+def _key_order(key):
+    """Return sort key ordering ticket IDs by project and number."""
+    match = re.match(r'(.*)-(\d+)$', key)
+    if match is None:
+        return key, 0
+    return match.group(1), int(match.group(2))
+
+
+def write_snapshot(path=DEFAULT_SNAPSHOT_PATH, prod=False,
+                   project='RCMTEMPL', workers=DEFAULT_WORKERS):
+    """Export content and remote links of all templates to snapshot file.
+
+    Templates are searched with one paginated search and their remote links
+    are requested concurrently. The file is replaced only when the whole
+    snapshot was written.
+
+    Args:
+        path: Path to the snapshot file, default DEFAULT_SNAPSHOT_PATH
+        prod: Bool value to choose if production JIRA is used, default False
+        project: Project of templates, default RCMTEMPL
+        workers: Maximal number of concurrent requests, default
+                 DEFAULT_WORKERS
+
+    Returns:
+        Number of templates in the snapshot, None if search failed
+    """
+    searcher = Ticket(prod=prod, project=project)
+    issues = searcher.search_issues('project={0}'.format(project))
+    if hasattr(issues, 'status'):
+        logging.error('Searching templates failed, snapshot was not '
+                      'written.')
+        return None
+    issues.sort(key=lambda issue: _key_order(issue['key']))
+    tickets = [Ticket.from_content(issue, prod=prod) for issue in issues]
+    remote_links = map_concurrently(lambda ticket: ticket.remote_links,
+                                    tickets, workers=workers)
+    missing = len([links for links in remote_links if links is None])
+    if missing:
+        logging.warning('Remote links of {0} templates could not be '
+                        'requested, they will be requested from JIRA when '
+                        'needed.'.format(missing))
+    directory = os.path.dirname(path)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+    entries = {}
+    temporary = '{0}.tmp'.format(path)
+    with open(temporary, 'wb') as f:
+        f.write(SNAPSHOT_MAGIC)
+        for issue, links in zip(issues, remote_links):
+            record = zlib.compress(json.dumps(
+                {'content': issue, 'remote_links': links},
+                separators=(',', ':')))
+            fields = issue['fields']
+            entries[issue['key']] = [
+                f.tell(), len(record),
+                (fields.get('issuetype') or {}).get('name'),
+                _values(fields, 'customfield_11911'),
+                _values(fields, searcher.keywords_id)]
+            f.write(record)
+        index_offset = f.tell()
+        f.write(zlib.compress(json.dumps(
+            {'server': searcher.url, 'project': project,
+             'keywords_id': searcher.keywords_id, 'created': time.time(),
+             'entries': entries}, separators=(',', ':'))))
+        f.write('{0:020d}\n'.format(index_offset))
+    os.rename(temporary, path)
+    logging.info('Snapshot of {0} templates written to {1}'.format(
+        len(entries), path))
+    return len(entries)
+
+
+class TemplateSnapshot(object):
+    """Read-only template source backed by a snapshot file.
+
+    Snapshot provides the interface of TemplateCache, so it can be set with
+    set_template_cache() and tickets then take content and remote links of
+    templates from it instead of JIRA. Templates of other servers are not
+    found in it.
+
+    Args:
+        path: Path to the snapshot file, default DEFAULT_SNAPSHOT_PATH
+
+    Raises:
+        ValueError if the file is not a snapshot
+    """
+
+    def __init__(self, path=DEFAULT_SNAPSHOT_PATH):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        size = len(self._map)
+        if self._map[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC or \
+                size < len(SNAPSHOT_MAGIC) + TRAILER_SIZE:
+            self._map.close()
+            raise ValueError('{0} is not a snapshot of templates'.format(
+                path))
+        index_offset = int(self._map[size - TRAILER_SIZE:size])
+        index = json.loads(zlib.decompress(
+            self._map[index_offset:size - TRAILER_SIZE]))
+        self.server = index['server']
+        self.project = index['project']
+        self.keywords_id = index['keywords_id']
+        self.created = index['created']
+        self._entries = index['entries']
+        self._keys = sorted(self._entries, key=_key_order)
+
+    def _record(self, server, key):
+        """Return decompressed record of a template or None."""
+        entry = self._entries.get(key) if server == self.server else None
+        if entry is None:
+            return None
+        start = entry[OFFSET]
+        return json.loads(zlib.decompress(
+            self._map[start:start + entry[LENGTH]]))
+
+    def get(self, server, key):
+        """Return content of a template.
+
+        Args:
+            server: Base URL of JIRA server
+            key: Ticket ID of the template
+
+        Returns:
+            Dictionary with content of the template or None if it is not in
+            the snapshot
+        """
+        record = self._record(server, key)
+        return record['content'] if record else None
+
+    def get_remote_links(self, server, key):
+        """Return remote links of a template.
+
+        Args:
+            server: Base URL of JIRA server
+            key: Ticket ID of the template
+
+        Returns:
+            List of remote links or None if they are not in the snapshot
+        """
+        record = self._record(server, key)
+        return record['remote_links'] if record else None
+
+    def put(self, server, content):
+        """Snapshot is read-only, content is not stored."""
+
+    def put_remote_links(self, server, key, remote_links):
+        """Snapshot is read-only, remote links are not stored."""
+
+    def __len__(self):
+        return len(self._entries)
+
+    def search(self, pav=None, keywords=None, without_pav=None,
+               subtask_keywords=True):
+        """Return IDs of templates with given PAV and keywords.
+
+        Args:
+            pav: Product Affects Version field as string, default None
+            keywords: List of string keywords, default None
+            without_pav: Product Affects Version templates must not have,
+                         default None
+            subtask_keywords: If False keywords don't apply to subtasks,
+                              default True
+
+        Returns:
+            List of string ticket IDs ordered by number
+        """
+        keys = []
+        for key in self._keys:
+            entry = self._entries[key]
+            if pav and pav not in entry[PAVS]:
+                continue
+            if without_pav and without_pav in entry[PAVS]:
+                continue
+            if keywords and (subtask_keywords or
+                             entry[ISSUETYPE] != 'Sub-task'):
+                if any(keyword not in entry[KEYWORDS]
+                       for keyword in keywords):
+                    continue
+            keys.append(key)
+        return keys
+
+    def close(self):
+        """Close the snapshot file."""
+        self._map.close()
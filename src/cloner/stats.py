@@ -0,0 +1,217 @@
+"""Module with statistics of requests to JIRA.
+
+Every request sent through a session (see session.py), including repeated
+attempts, is recorded under its logical operation (content GET, search,
+create, ...) with its size and latency, so a run can report where it spent
+its time. Recording is disabled until enable_stats() is called.
+"""
+
+import json
+import math
+import re
+import threading
+import time
+
+from collections import OrderedDict
+from urlparse import urlparse
+
+# (method or None for any, regex of URL path, operation)
+OPERATIONS = (
+    ('GET', r'/rest/api/2/issue/[^/]+$', 'content'),
+    ('PUT', r'/rest/api/2/issue/[^/]+$', 'update'),
+    ('POST', r'/rest/api/2/issue$', 'create'),
+    ('POST', r'/rest/api/2/issue/bulk$', 'bulk create'),
+    ('GET', r'/rest/api/2/issue/[^/]+/remotelink$', 'remote link read'),
+    ('POST', r'/rest/api/2/issue/[^/]+/remotelink$', 'remote link'),
+    ('GET', r'/rest/api/2/issue/[^/]+/comment$', 'comment read'),
+    ('POST', r'/rest/api/2/issue/[^/]+/comment$', 'comment'),
+    ('POST', r'/rest/api/2/issueLink$', 'link'),
+    (None, r'/rest/api/2/search$', 'search'),
+    (None, r'/secure/MoveIssueLink\.jspa$', 'subtask move'),
+    (None, r'/rest/api/2/project/', 'project'),
+    (None, r'/rest/auth/1/session$', 'user'),
+)
+PERCENTILES = (50, 95, 99)
+
+_compiled = [(method, re.compile(pattern), operation)
+             for method, pattern, operation in OPERATIONS]
+_stats = None
+_lock = threading.Lock()
+
+
+def classify(method, url):
+    """Return name of logical operation performed by request.
+
+    Args:
+        method: HTTP method
+        url: Requested URL
+
+    Returns:
+        Name of operation from OPERATIONS or 'other'
+    """
+    path = urlparse(url).path
+    for op_method, pattern, operation in _compiled:
+        if op_method in (None, method) and pattern.search(path):
+            return operation
+    return 'other'
+
+
+def percentile(samples, percent):
+    """Return percentile of sorted samples (nearest rank).
+
+    Args:
+        samples: Sorted list of numbers
+        percent: Percentile from 0 to 100
+
+    Returns:
+        Number from samples, None if there are no samples
+    """
+    if not samples:
+        return None
+    rank = int(math.ceil(percent / 100.0 * len(samples)))
+    return samples[min(max(rank, 1), len(samples)) - 1]
+
+
+class RequestStats(object):
+    """Count, transferred bytes and latencies of requests per operation."""
+
+    def __init__(self):
+        self._operations = {}
+        self._lock = threading.Lock()
+
+    def record(self, operation, latency, sent=0, received=0, failed=False):
+        """Record one finished request.
+
+        Args:
+            operation: Name of the operation, see classify()
+            latency: Seconds from sending the request to its response
+            sent: Number of bytes of request body, default 0
+            received: Number of bytes of response body, default 0
+            failed: True if request raised error or got error status,
+                    default False
+        """
+        with self._lock:
+            stats = self._operations.get(operation)
+            if stats is None:
+                stats = {'count': 0, 'errors': 0, 'sent': 0, 'received': 0,
+                         'latencies': []}
+                self._operations[operation] = stats
+            stats['count'] += 1
+            stats['errors'] += 1 if failed else 0
+            stats['sent'] += sent
+            stats['received'] += received
+            stats['latencies'].append(latency)
+
+    def summary(self):
+        """Return statistics of all operations.
+
+        Returns:
+            OrderedDict operation: dictionary with count, errors, sent and
+            received bytes, total seconds and p50, p95, p99 latency in
+            seconds; operations with the most total time go first
+        """
+        with self._lock:
+            operations = [(operation, dict(stats, latencies=sorted(
+                stats['latencies'])))
+                for operation, stats in self._operations.items()]
+        result = []
+        for operation, stats in operations:
+            latencies = stats.pop('latencies')
+            stats['total'] = sum(latencies)
+            for percent in PERCENTILES:
+                stats['p{0}'.format(percent)] = percentile(latencies, percent)
+            result.append((operation, stats))
+        result.sort(key=lambda item: (-item[1]['total'], item[0]))
+        return OrderedDict(result)
+
+    def format_table(self):
+        """Return summary as lines of text table, latencies are in
+        milliseconds and sizes in KiB.
+        """
+        header = ('operation', 'count', 'errors', 'sent KiB', 'recv KiB',
+                  'total s', 'p50 ms', 'p95 ms', 'p99 ms')
+        rows = [header]
+        for operation, stats in self.summary().items():
+            rows.append((operation, str(stats['count']), str(stats['errors']),
+                         '{0:.1f}'.format(stats['sent'] / 1024.0),
+                         '{0:.1f}'.format(stats['received'] / 1024.0),
+                         '{0:.2f}'.format(stats['total'])) +
+                        tuple('{0:.0f}'.format(stats['p{0}'.format(p)] * 1000)
+                              for p in PERCENTILES))
+        widths = [max(len(row[i]) for row in rows)
+                  for i in range(len(header))]
+        return ['  '.join(cell.ljust(width) if i == 0 else cell.rjust(width)
+                          for i, (cell, width) in
+                          enumerate(zip(row, widths)))
+                for row in rows]
+
+    def write_json(self, path):
+        """Write summary to JSON file.
+
+        Args:
+            path: Path of the file
+        """
+        with open(path, 'w') as f:
+            json.dump(self.summary(), f, indent=2)
+            f.write('\n')
+
+
+def enable_stats():
+    """Start recording statistics of requests, return RequestStats."""
+    global _stats
+    with _lock:
+        if _stats is None:
+            _stats = RequestStats()
+        return _stats
+
+
+def disable_stats():
+    """Stop recording statistics of requests and forget recorded ones."""
+    global _stats
+    with _lock:
+        _stats = None
+
+
+def get_stats():
+    """Return RequestStats if recording is enabled, else None."""
+    return _stats
+
+
+def record_request(request, started, response=None):
+    """Record request sent through session if recording is enabled.
+
+    Args:
+        request: requests.PreparedRequest
+        started: Time when the request was sent
+        response: requests.Response, None if request failed, default None
+    """
+    stats = _stats
+    if stats is None:
+        return
+    latency = time.time() - started
+    body = request.body
+    sent = len(body) if isinstance(body, basestring) else 0
+    received = 0
+    if response is not None and response._content_consumed:
+        received = len(response.content or '')
+    stats.record(classify(request.method, request.url), latency, sent=sent,
+                 received=received,
+                 failed=response is None or response.status_code >= 400)
+
+
+def report_stats(log, path=None):
+    """Log table with statistics of requests, write them also to JSON file
+    if path is given.
+
+    Args:
+        log: Logger object
+        path: Path of JSON file, default None
+    """
+    stats = get_stats()
+    if stats is None:
+        return
+    log.info('Request statistics:')
+    for line in stats.format_table():
+        log.info(line)
+    if path:
+        stats.write_json(path)
@@ -4,16 +4,30 @@ import logging
 import re
 import requests
 
-from requests_kerberos import HTTPKerberosAuth, DISABLED
 from urllib import urlencode
 
 from ticketutil.jira import JiraTicket
-from ticketutil.ticket import _get_kerberos_principal
+from ticketutil.ticket import TicketException, _get_kerberos_principal
+
+from compiled import CompiledTemplate, get_compiled, store_compiled
+from retry import error_detail, post_with_check
+from session import get_current_user, get_session, is_offline, \
+    is_project_verified, set_current_user, set_project_verified
+from workers import imap_concurrently, map_concurrently, DEFAULT_WORKERS
 
 PROD_URL = 'https://projects.engineering.redhat.com'
 STAGE_URL = 'https://projects.stage.engineering.redhat.com'
 PROD_KEYWORDS_ID = 'customfield_12407'
 STAGE_KEYWORDS_ID = 'customfield_12700'
+# number of issues requested per page of search results
+SEARCH_PAGE_SIZE = 500
+# maximal number of tickets created with one bulk request
+BULK_CREATE_SIZE = 50
+# tickets created this many minutes ago are checked when their creation
+# failed ambiguously (e.g. response timed out)
+CREATED_CHECK_MINUTES = 10
+# injected select list fields (PAV, milestone) compared by the check
+CREATED_CHECK_FIELDS = ('customfield_11911', 'customfield_12000')
 
 
 def substitute_pav(ticketobj):
@@ -46,7 +60,6 @@ def substitute_keywords(ticketobj):
     result = None
 
     if ticketobj.keywords:
-        print ticketobj.keywords
         result = ", ".join(ticketobj.keywords)
         logging.debug("substituting <KEYWORK> with '{0}'".format(result))
     return result
@@ -92,22 +105,151 @@ SUPPORTED_VAR_SUBSTITUTIONS = {
     r'<MILESTONE>': substitute_milestone,
 }
 
+# tuple (regexes, compiled pattern, group name: regex) built from
+# SUPPORTED_VAR_SUBSTITUTIONS
+_compiled_substitutions = (None, None, None)
+
+
+def register_substitution(variable, callback):
+    """Register callback providing value of <variable> in templates.
+
+    Args:
+        variable: Name of the variable without angle brackets, e.g. 'PAV'
+        callback: Function accepting Ticket object and returning string
+                  value of the variable or None if value is not set
+    """
+    SUPPORTED_VAR_SUBSTITUTIONS['<{0}>'.format(variable)] = callback
+
+
+def _substitution_pattern():
+    """Return regex matching any of supported variables.
+
+    Regex is compiled again only if SUPPORTED_VAR_SUBSTITUTIONS changed.
+
+    Returns:
+        Tuple (compiled regex, dictionary group name: regex of variable)
+    """
+    global _compiled_substitutions
+    regexes = tuple(sorted(SUPPORTED_VAR_SUBSTITUTIONS))
+    if _compiled_substitutions[0] != regexes:
+        groups = dict(('v{0}'.format(i), regex)
+                      for i, regex in enumerate(regexes))
+        pattern = re.compile('|'.join(
+            '(?P<{0}>{1})'.format(name, regex)
+            for name, regex in sorted(groups.items())))
+        _compiled_substitutions = (regexes, pattern, groups)
+    return _compiled_substitutions[1:]
+
+
+# persistent cache of template content consulted before requesting it
+_template_cache = None
+
+
+def set_template_cache(cache):
+    """Set cache consulted before requesting content of templates.
+
+    Args:
+        cache: TemplateCache object, None disables caching
+    """
+    global _template_cache
+    _template_cache = cache
+
+
+def get_template_cache():
+    """Return cache of template content or None if caching is disabled."""
+    return _template_cache
+
+
+def cache_template(server, content):
+    """Store full content of a template in cache if caching is enabled.
+
+    Args:
+        server: Base URL of JIRA server
+        content: Dictionary with content of the ticket
+    """
+    if _template_cache is not None and \
+            content['key'].startswith('RCMTEMPL-'):
+        _template_cache.put(server, content)
+
 
 class Ticket(JiraTicket):
-    """Object representation of a JIRA Ticket."""
+    """Object representation of a JIRA Ticket.
+
+    Content of a ticket with ticket_id is not requested until it is first
+    needed. If fields are given, only those fields are requested; fields
+    needed later are requested when they are missing, load_content()
+    requests the whole content.
+
+    Args:
+        prod: Bool value to choose if production JIRA is used, default False
+        project: String project key, default RCMTEMPL
+        auth: Authentication passed to ticketutil, default None
+        ticket_id: String ID of existing ticket, default None
+        custom_substitutions: Dict with {VAR: value}, default None
+        fields: List of names of fields to request instead of the whole
+                content, default None
+    """
 
     def __init__(self, prod=False, project='RCMTEMPL', auth=None,
-                 ticket_id=None, custom_substitutions=None):
+                 ticket_id=None, custom_substitutions=None, fields=None):
         url = PROD_URL if prod else STAGE_URL
         self.keywords_id = PROD_KEYWORDS_ID if prod else STAGE_KEYWORDS_ID
-        super(Ticket, self).__init__(url, project, auth=auth,
-                                     ticket_id=ticket_id)
+        self._content = None
+        # names of loaded fields, None if the whole content is loaded
+        self._loaded_fields = None
+        self._fields = tuple(fields) if fields else None
+        self._remote_links = None
+        self._substitution_values = {}
+        super(Ticket, self).__init__(url, project, auth=auth)
         self._user = None
         self.custom_substitutions = custom_substitutions
-        if self.ticket_id:
-            self._content = self._get_content()
-        else:
-            self._content = None
+        if ticket_id:
+            # existence of the ticket is verified by loading its content
+            self.ticket_id = ticket_id
+            self.ticket_url = self._generate_ticket_url()
+
+    @classmethod
+    def from_content(cls, content, prod=False, project='RCMTEMPL', auth=None,
+                     custom_substitutions=None):
+        """Create ticket from already fetched content (e.g. from search)
+        without requesting it from JIRA again.
+
+        Args:
+            content: Dictionary with content of the ticket, has to contain
+                     'key' and 'fields'
+            prod: Bool value to choose if production JIRA is used, default
+                  False
+            project: String project key, default RCMTEMPL
+            auth: Authentication passed to ticketutil, default None
+            custom_substitutions: Dict with {VAR: value}, default None
+
+        Returns:
+            Ticket object
+        """
+        ticket = cls(prod=prod, project=project, auth=auth,
+                     custom_substitutions=custom_substitutions)
+        ticket.ticket_id = content['key']
+        ticket.ticket_url = ticket._generate_ticket_url()
+        ticket.content = content
+        return ticket
+
+    @classmethod
+    def for_id(cls, ticket_id, prod=False, project='RCMTEMPL', auth=None):
+        """Create ticket with given ID without requesting its content, e.g.
+        to update it.
+
+        Args:
+            ticket_id: String ID of the ticket
+            prod: Bool value to choose if production JIRA is used, default
+                  False
+            project: String project key, default RCMTEMPL
+            auth: Authentication passed to ticketutil, default None
+
+        Returns:
+            Ticket object
+        """
+        return cls(prod=prod, project=project, auth=auth,
+                   ticket_id=ticket_id)
 
     @property
     def custom_substitutions(self):
@@ -132,21 +274,87 @@ class Ticket(JiraTicket):
         assert isinstance(val, dict), "Expected dict instance on input."
         logging.debug("Setting .custom_substitutions to '{0}'".format(val))
         self._custom_substitutions = val
+        self._substitution_values = {}
 
     @property
     def content(self):
-        """Return dictionary with content of the ticket."""
+        """Return dictionary with content of the ticket, it is requested on
+        first access.
+        """
+        if self._content is None and self.ticket_id:
+            self.load_content(self._fields)
         return self._content
 
     @content.setter
     def content(self, val):
         self._content = val
+        self._loaded_fields = None
+        self._substitution_values = {}
+
+    def load_content(self, fields=None):
+        """Request content of the ticket again, replacing loaded content.
+
+        Content of cached templates is taken from the template cache.
+
+        Args:
+            fields: List of names of fields to request, default None for
+                    the whole content
+
+        Raises:
+            TicketException if the ticket doesn't exist
+            requests.RequestException if request failed
+        """
+        content = None
+        if _template_cache is not None and \
+                self.ticket_id.startswith('RCMTEMPL-'):
+            content = _template_cache.get(self.url, self.ticket_id)
+            if content is not None:
+                logging.debug('Using cached content of {0}'.format(
+                    self.ticket_id))
+                fields = None
+        if content is None:
+            try:
+                content = self._get_content(fields)
+            except requests.HTTPError as e:
+                if e.response is not None and e.response.status_code == 404:
+                    raise TicketException('Ticket {0} is not valid'.format(
+                        self.ticket_id))
+                raise
+            if not fields:
+                cache_template(self.url, content)
+        self.content = content
+        self._loaded_fields = frozenset(fields) if fields else None
+
+    def _require(self, *fields):
+        """Return content with given fields, fields missing in partially
+        loaded content are requested and added to it.
+
+        Args:
+            fields: Names of needed fields
+
+        Returns:
+            Dictionary with content of the ticket or None
+        """
+        content = self.content
+        if content is None or self._loaded_fields is None:
+            return content
+        missing = [field for field in fields
+                   if field not in self._loaded_fields]
+        if missing:
+            logging.debug('Requesting fields {0} of {1}'.format(
+                ', '.join(missing), self.ticket_id))
+            content['fields'].update(
+                self._get_content(missing)['fields'])
+            self._loaded_fields = self._loaded_fields.union(missing)
+            self._substitution_values = {}
+        return content
 
     @property
     def summary(self):
         """Return ticket summary."""
-        if self.content:
-            return self.content['fields']['summary']
+        content = self._require('summary')
+        if content:
+            return content['fields']['summary']
 
     @summary.setter
     def summary(self, val):
@@ -155,8 +363,9 @@ class Ticket(JiraTicket):
     @property
     def description(self):
         """Return ticket description."""
-        if self.content:
-            return self.content['fields']['description']
+        content = self._require('description')
+        if content:
+            return content['fields']['description']
 
     @description.setter
     def description(self, val):
@@ -165,14 +374,16 @@ class Ticket(JiraTicket):
     @property
     def issuetype(self):
         """Return ticket type."""
-        if self.content:
-            return self.content['fields']['issuetype']['name']
+        content = self._require('issuetype')
+        if content:
+            return content['fields']['issuetype']['name']
 
     @property
     def pav(self):
         """Return Product Affects Version field."""
-        if self.content and 'customfield_11911' in self.content['fields']:
-            pav = self.content['fields']['customfield_11911']
+        content = self._require('customfield_11911')
+        if content and 'customfield_11911' in content['fields']:
+            pav = content['fields']['customfield_11911']
             if pav:
                 return [item.get('value') for item in pav]
         return []
@@ -196,7 +407,8 @@ class Ticket(JiraTicket):
             r.raise_for_status()
             return self.request_result
         except requests.RequestException as e:
-            error_message = "Error appending PAV"
+            error_message = "Error appending PAV - {0}".format(
+                error_detail(e))
             logging.error(error_message)
             logging.error(e)
             return self.request_result._replace(status='Failure',
@@ -205,39 +417,44 @@ class Ticket(JiraTicket):
     @property
     def keywords(self):
         """Return keywords field."""
-        if self.content and 'customfield_12700' in self.content['fields']:
-            keywords = self.content['fields']['customfield_12700']
+        content = self._require('customfield_12700')
+        if content and 'customfield_12700' in content['fields']:
+            keywords = content['fields']['customfield_12700']
             return [item.get('value') for item in keywords]
         return []
 
     @property
     def milestone(self):
         """Return milestone field."""
-        if self.content and 'customfield_12000' in self.content['fields']:
-            milestone = self.content['fields']['customfield_12000']
+        content = self._require('customfield_12000')
+        if content and 'customfield_12000' in content['fields']:
+            milestone = content['fields']['customfield_12000']
             return [item.get('value') for item in milestone]
         return []
 
     @property
     def labels(self):
         """Return ticket labels."""
-        if self.content:
-            return self.content['fields']['labels']
+        content = self._require('labels')
+        if content:
+            return content['fields']['labels']
 
     @property
     def parent_id(self):
         """Return parent's ID if issue type is Sub-task, else is None."""
-        if (self.content is not None and
+        content = self._require('issuetype', 'parent')
+        if (content is not None and
             self.issuetype == 'Sub-task' and
-                self.content['fields']['parent']['key'].startswith(
+                content['fields']['parent']['key'].startswith(
                     'RCMTEMPL')):
-            return self.content['fields']['parent']['key']
+            return content['fields']['parent']['key']
 
     @property
     def subtask_ids(self):
         """Return list of subtask IDs that are in RCMTEMPL."""
-        if self.content is not None:
-            subtasks = self.content['fields']['subtasks']
+        content = self._require('subtasks')
+        if content is not None:
+            subtasks = content['fields']['subtasks']
             if subtasks:
                 ids = []
                 for subtask in subtasks:
@@ -249,8 +466,9 @@ class Ticket(JiraTicket):
     @property
     def nr_of_subtasks(self):
         """Return number of all subtasks (not only in RCMTEMPL)."""
-        if self.content is not None and self.issuetype != 'Sub-task':
-            return len(self.content['fields']['subtasks'])
+        content = self._require('issuetype', 'subtasks')
+        if content is not None and self.issuetype != 'Sub-task':
+            return len(content['fields']['subtasks'])
 
     @property
     def links(self):
@@ -263,9 +481,10 @@ class Ticket(JiraTicket):
         """
         if self.issuetype == 'Sub-task':
             return []
-        issuelinks = self.content['fields']['issuelinks']
+        content = self._require('issuelinks')
+        issuelinks = content['fields']['issuelinks']
         links = []
-        if self.content is not None and issuelinks:
+        if content is not None and issuelinks:
             for link in issuelinks:
                 relation = 'inwardIssue' if link.get('inwardIssue') \
                     else 'outwardIssue'
@@ -285,35 +504,47 @@ class Ticket(JiraTicket):
 
     def get_substituted_string(self, field):
         """Update field of ticket with supported substitutions
-        See SUPPORTED_VAR_SUBSTITUTIONS.
+        See SUPPORTED_VAR_SUBSTITUTIONS and register_substitution().
+        All variables are substituted in one pass, value of every variable
+        is computed only once per ticket content.
         Function prints warning if value is not set.
         In this case string is not substituted.
 
         Return field value with substituted variables
         """
-        result = field
-        for regex, callback in SUPPORTED_VAR_SUBSTITUTIONS.iteritems():
-            logging.debug(
-                u"Searching for regex '{0}' in {1}".format(regex, result)
-            )
-            if re.search(regex, field):
-                logging.debug(u"Matched regex '{0}'.".format(result))
-                subst_with = callback(self)
-                if not subst_with:
-                    logging.warning(
-                        u"Not substituting '{0}' got None. ".format(regex))
-                    logging.warning(
-                        u"Fields: {0}".format(self.content['fields']))
-                    continue
-                result = re.sub(regex, subst_with, result)
-            else:
-                logging.debug(u"Did not match regex '{0}'.".format(regex))
+        if not field:
+            return field
+        pattern, groups = _substitution_pattern()
+
+        def substitute(match):
+            value = self._substitution_value(groups[match.lastgroup])
+            return match.group(0) if value is None else value
+
+        return pattern.sub(substitute, field)
 
-        return result
+    def _substitution_value(self, regex):
+        """Return memoized value of variable matched by regex.
+
+        Args:
+            regex: Key of SUPPORTED_VAR_SUBSTITUTIONS
+
+        Returns:
+            String value or None if value is not set
+        """
+        if regex not in self._substitution_values:
+            value = SUPPORTED_VAR_SUBSTITUTIONS[regex](self) or None
+            if value is None:
+                logging.warning(u"Not substituting '{0}' in {1}, value is "
+                                u"not set.".format(regex, self.summary))
+            self._substitution_values[regex] = value
+        return self._substitution_values[regex]
 
     def create_link(self, link):
         """Create issue link.
 
+        If request fails ambiguously, it is sent again only if the link
+        doesn't exist.
+
         Args:
             link: Tuple in format (ID, type, 'inwardIssue'/'outwardIssue')
 
@@ -337,29 +568,58 @@ class Ticket(JiraTicket):
         }
         url = '{0}Link'.format(self.rest_url)
         try:
-            r = self.s.post(url, json=payload)
-            logging.debug('Create issue link: Status code {0}'.format(
-                r.status_code))
-            r.raise_for_status()
+            post_with_check(self.s, url, payload,
+                            lambda: self._find_link(inward, outward,
+                                                    link_type))
+            logging.debug('Created issue link {0} - {1}'.format(
+                inward, outward))
         except requests.RequestException as e:
             error_message = "Error while creating issue link - {0}".format(
-                r.json()['errorMessages'][0])
+                error_detail(e))
             logging.error(error_message)
             logging.error(e)
             return self.request_result._replace(status='Failure',
                                                 error_message=error_message
                                                 )
 
+    def _find_link(self, inward, outward, link_type):
+        """Return empty dictionary if issue link exists, else None."""
+        url = '{0}/{1}?fields=issuelinks'.format(self.rest_url, inward)
+        r = self.s.get(url)
+        r.raise_for_status()
+        for link in r.json()['fields'].get('issuelinks') or []:
+            if link['type']['name'] == link_type and \
+                    link.get('outwardIssue', {}).get('key') == outward:
+                return {}
+
     @property
     def remote_links(self):
-        """Return dictionary with representation of remote links if ticket has
-        any, else None.
+        """Return list with representation of remote links of the ticket or
+        None if they could not be retrieved.
+
+        Remote links are requested only once, remote links of cached
+        templates are taken from the template cache.
         """
-        remote_links = self._get_remote_links()
-        if (hasattr(remote_links, 'status') and
-                remote_links.status == 'Failure'):
-            return
-        return remote_links
+        if self._remote_links is None:
+            cacheable = (_template_cache is not None and self.ticket_id and
+                         self.ticket_id.startswith('RCMTEMPL-'))
+            if cacheable:
+                self._remote_links = _template_cache.get_remote_links(
+                    self.url, self.ticket_id)
+            if self._remote_links is None:
+                remote_links = self._get_remote_links()
+                if (hasattr(remote_links, 'status') and
+                        remote_links.status == 'Failure'):
+                    return
+                self._remote_links = remote_links
+                if cacheable:
+                    _template_cache.put_remote_links(self.url, self.ticket_id,
+                                                     remote_links)
+        return self._remote_links
+
+    @remote_links.setter
+    def remote_links(self, val):
+        self._remote_links = val
 
     def _get_remote_links(self):
         """Get dictionary with remote links.
@@ -375,7 +635,8 @@ class Ticket(JiraTicket):
                 r.status_code))
             r.raise_for_status()
         except requests.RequestException as e:
-            error_message = "Error while getting ticket remote links"
+            error_message = "Error while getting ticket remote links - " \
+                "{0}".format(error_detail(e))
             logging.error(error_message)
             logging.error(e)
             return self.request_result._replace(status='Failure',
@@ -385,7 +646,10 @@ class Ticket(JiraTicket):
     def create_remote_link(self, links):
         """Create remote links from list of dictionaries.
 
-        First removes fields 'id' and 'self' because they should not be cloned.
+        Fields 'id' and 'self' are not copied because they should not be
+        cloned, passed dictionaries are not modified. Links are created
+        concurrently. If request fails ambiguously, it is sent again only if
+        the link doesn't exist.
 
         Args:
             links: List of dictionaries with representation of links
@@ -394,38 +658,59 @@ class Ticket(JiraTicket):
             In case of failure namedtuple with status, error message and url,
             else None
         """
-        for link in links:
-            link.pop("id")
-            link.pop("self")
-            url = '{0}/{1}/remotelink'.format(self.rest_url, self.ticket_id)
+        url = '{0}/{1}/remotelink'.format(self.rest_url, self.ticket_id)
+
+        def create(link):
+            link = dict((key, val) for key, val in link.items()
+                        if key not in ('id', 'self'))
             try:
-                r = self.s.post(url, json=link)
-                logging.debug('Create remote link: Status code {0}'.format(
-                    r.status_code))
-                r.raise_for_status()
+                post_with_check(self.s, url, link,
+                                lambda: self._find_remote_link(url, link))
+                logging.debug('Created remote link of {0}'.format(
+                    self.ticket_id))
             except requests.RequestException as e:
                 error_message = "Error creating remote ticket link - {0}".\
-                    format(r.json()['errorMessages'][0])
+                    format(error_detail(e))
                 logging.error(error_message)
                 logging.error(e)
                 return self.request_result._replace(status='Failure',
                                                     error_message=error_message
                                                     )
 
+        for result in map_concurrently(create, links):
+            if result is not None:
+                return result
+
+    def _find_remote_link(self, url, link):
+        """Return existing remote link with the same object, else None."""
+        r = self.s.get(url)
+        r.raise_for_status()
+        for existing in r.json():
+            if existing.get('object') == link.get('object') and \
+                    existing.get('globalId') == link.get('globalId'):
+                return existing
+
     @property
     def status(self):
         """Return ticket status as a string, if no content returns None."""
-        if self.content is not None:
-            return self.content['fields']['status']['name']
+        content = self._require('status')
+        if content is not None:
+            return content['fields']['status']['name']
 
-    def _get_content(self):
+    def _get_content(self, fields=None):
         """Get content of a JIRA ticket.
 
+        Args:
+            fields: List of names of fields to request, default None for all
+                    fields
+
         Returns:
             Dictionary containing ticket fields
         """
         self.s.headers.update({'Content-Type': 'application/json'})
         url = '{0}/{1}'.format(self.rest_url, self.ticket_id)
+        if fields:
+            url += '?' + urlencode({'fields': ','.join(fields)})
         r = self.s.get(url)
         logging.debug('Get ticket content: Status code {0}'.format(
             r.status_code))
@@ -434,9 +719,16 @@ class Ticket(JiraTicket):
 
     @property
     def user(self):
-        """Return username of currently logged in user."""
+        """Return username of currently logged in user.
+
+        User is requested only once per server, as all tickets share its
+        session.
+        """
+        if not self._user:
+            self._user = get_current_user(self.url)
         if not self._user:
             self._user = self._get_currently_logged_in_user()
+            set_current_user(self.url, self._user)
         return self._user
 
     def _get_currently_logged_in_user(self):
@@ -462,10 +754,25 @@ class Ticket(JiraTicket):
             inject: Dictionary with fields to be injected into content
             parent: In case of subtask, specifies its parent's ID
         """
-        self.content = {"fields": other.content['fields'].copy()}
-        self.remove_unwanted_fields()
-        self.remove_customfields()
-        self.fix_specific_fields()
+        self.prepare_clone(other, inject=inject,
+                           custom_substitutions=custom_substitutions,
+                           parent=parent)
+        self.create_from_json(self.content)
+        remote_links = other.remote_links
+        if remote_links:
+            self.create_remote_link(remote_links)
+
+    def prepare_clone(self, other, inject=None, custom_substitutions=None,
+                      parent=None):
+        """Prepare content for cloning other ticket without creating it.
+
+        Args:
+            other: Ticket object from which we clone data.
+            inject: Dictionary with fields to be injected into content
+            parent: In case of subtask, specifies its parent's ID
+        """
+        compiled = self.compile_template(other)
+        self.content = {"fields": compiled.payload_fields()}
         self.content['fields']['project'] = {'key': self.project}
         self.content['fields']['reporter'] = {'name': self.user}
         self.content['fields']['assignee'] = {'name': self.user}
@@ -477,10 +784,56 @@ class Ticket(JiraTicket):
         self.custom_substitutions = custom_substitutions
 
         # substitution must be executed after inject part
-        self.substitute_fields()
-        self.create_from_json(self.content)
-        if other.remote_links:
-            self.create_remote_link(other.remote_links)
+        self.fill_slots(compiled)
+
+    def compile_template(self, other):
+        """Return other ticket compiled for cloning.
+
+        Compiled templates are cached by server, ticket ID and 'updated'
+        field of the template, so every template is cleaned and parsed only
+        once.
+
+        Args:
+            other: Ticket object from which we clone data
+
+        Returns:
+            CompiledTemplate object
+        """
+        pattern, groups = _substitution_pattern()
+        if other.ticket_id and other._loaded_fields is not None:
+            # template with only some fields loaded is cloned as a whole
+            other.load_content()
+        updated = other.content['fields'].get('updated')
+        key = None
+        if other.ticket_id and updated:
+            key = (self.url, other.ticket_id, updated)
+            compiled = get_compiled(key)
+            if compiled is not None and compiled.pattern is pattern:
+                return compiled
+        self.content = {"fields": other.content['fields'].copy()}
+        self.remove_unwanted_fields()
+        self.remove_customfields()
+        self.fix_specific_fields()
+        compiled = CompiledTemplate(self.content['fields'], pattern, groups)
+        if key is not None:
+            store_compiled(key, compiled)
+        return compiled
+
+    def fill_slots(self, compiled):
+        """Substitute text in supported fields using slots of compiled
+        template, fields replaced by inject are substituted as a whole.
+
+        Args:
+            compiled: CompiledTemplate object of the cloned template
+        """
+        fields = self.content['fields']
+        for field in compiled.SLOT_FIELDS:
+            if field not in fields:
+                continue
+            if fields[field] is compiled.fields.get(field):
+                fields[field] = compiled.fill(field, self._substitution_value)
+            else:
+                fields[field] = self.get_substituted_string(fields[field])
 
     def substitute_fields(self):
         """Substitute text in supported fields.
@@ -497,6 +850,130 @@ class Ticket(JiraTicket):
         """
         return self._create_ticket_request(json)
 
+    def _create_ticket_request(self, params):
+        """Overridden method from ticketutil to not create duplicates when
+        request fails ambiguously, it is sent again only if the ticket was
+        not created.
+
+        Args:
+            params: Json dictionary with ticket data
+
+        Returns:
+            Namedtuple with status, error message and url
+        """
+        try:
+            content = post_with_check(self.s, self.rest_url, params,
+                                      lambda: self._find_created(params))
+        except requests.RequestException as e:
+            error_message = "Error creating ticket - {0}".format(
+                error_detail(e))
+            logging.error(error_message)
+            logging.error(e)
+            return self.request_result._replace(status='Failure',
+                                                error_message=error_message)
+        self.ticket_id = content['key']
+        self.ticket_url = self._generate_ticket_url()
+        logging.info("Created ticket {0} - {1}".format(self.ticket_id,
+                                                       self.ticket_url))
+        return self.request_result
+
+    def _find_created(self, params):
+        """Return {'key': ID} of ticket with the same summary, description,
+        type, parent, PAV and milestone created recently by current user,
+        else None.
+
+        Creator is searched, because reporter of clones can be set to someone
+        else.
+        """
+        fields = params['fields']
+        query = ('project = {0} and creator = currentUser() and '
+                 'created >= -{1}m'.format(fields['project']['key'],
+                                           CREATED_CHECK_MINUTES))
+        issues = self.search_issues(
+            query, fields=','.join(('summary', 'description', 'issuetype',
+                                    'parent') + CREATED_CHECK_FIELDS))
+        if hasattr(issues, 'status'):
+            raise requests.RequestException(issues.error_message)
+        for issue in issues:
+            found = issue['fields']
+            same = (found.get('summary') == fields.get('summary') and
+                    found.get('description') == fields.get('description') and
+                    _same_named(found.get('issuetype'),
+                                fields.get('issuetype')) and
+                    (found.get('parent') or {}).get('key') ==
+                    (fields.get('parent') or {}).get('key') and
+                    all(_same_values(found.get(field), fields[field])
+                        for field in CREATED_CHECK_FIELDS if field in fields))
+            if same:
+                return {'key': issue['key']}
+
+    def create_bulk(self, payloads):
+        """Create tickets from list of json payloads using bulk endpoint.
+
+        Payloads are sent in batches of BULK_CREATE_SIZE, tickets within
+        a batch are created in order of payloads.
+
+        Args:
+            payloads: List of json dictionaries with ticket data
+
+        Returns:
+            List with item for each payload, string ID of created ticket or
+            namedtuple with status, error message and url in case of failure
+        """
+        results = []
+        for i in range(0, len(payloads), BULK_CREATE_SIZE):
+            results.extend(
+                self._create_bulk_request(payloads[i:i + BULK_CREATE_SIZE]))
+        return results
+
+    def _create_bulk_request(self, batch):
+        """Create batch of tickets with one request.
+
+        JIRA creates all valid tickets even if some of them fail, failed ones
+        are reported by their index in the batch.
+
+        Args:
+            batch: List of json dictionaries with ticket data
+
+        Returns:
+            List with item for each payload, string ID of created ticket or
+            namedtuple with status, error message and url in case of failure
+        """
+        url = '{0}/bulk'.format(self.rest_url)
+        try:
+            r = self.s.post(url, json={'issueUpdates': batch})
+            logging.debug('Create tickets in bulk: Status code {0}'.format(
+                r.status_code))
+            # partial failure is reported with 400 and still creates tickets
+            if r.status_code != 400:
+                r.raise_for_status()
+            content = r.json()
+        except (requests.RequestException, ValueError) as e:
+            error_message = 'Error creating tickets in bulk'
+            logging.error(error_message)
+            logging.error(e)
+            return [self.request_result._replace(status='Failure',
+                                                 error_message=error_message)
+                    ] * len(batch)
+        errors = {}
+        for error in content.get('errors', []):
+            element_errors = error.get('elementErrors', {})
+            messages = (element_errors.get('errorMessages', []) +
+                        list(element_errors.get('errors', {}).values()))
+            errors[error['failedElementNumber']] = \
+                'Error creating ticket - {0}'.format(', '.join(messages))
+        created = iter(content.get('issues', []))
+        results = []
+        for i in range(len(batch)):
+            issue = None if i in errors else next(created, None)
+            if issue is None:
+                error_message = errors.get(i, 'Error creating ticket')
+                results.append(self.request_result._replace(
+                    status='Failure', error_message=error_message))
+            else:
+                results.append(issue['key'])
+        return results
+
     def verify_position(self, position):
         """Ask user if they want to continue if the position is invalid.
 
@@ -554,23 +1031,131 @@ class Ticket(JiraTicket):
         Returns:
             List of ticket IDs that match given query
         """
+        issues = self.search_issues(query, fields='key')
+        if hasattr(issues, 'status'):
+            return issues
+        id_list = [d.get('key') for d in issues]
+        return id_list
+
+    def search_issues(self, query, fields='*all'):
+        """Search in JIRA using jql and return content of all found issues.
+
+        Args:
+            query: JQL query to search
+            fields: Comma separated string of fields to be returned for each
+                    issue, default '*all' (same content as single issue GET)
+        Returns:
+            List of dictionaries with content of issues that match given
+            query, in case of failure namedtuple with status, error message
+            and url
+        """
+        issues = []
+        for page in self._iter_search_pages(query, fields):
+            if hasattr(page, 'status'):
+                return page
+            issues.extend(page['issues'])
+        return issues
+
+    def iter_search(self, query, fields='key', page_size=SEARCH_PAGE_SIZE,
+                    workers=DEFAULT_WORKERS, ordered=True):
+        """Search in JIRA using jql and yield issues as result pages arrive.
+
+        First page is requested alone to find out total number of results,
+        remaining pages are requested concurrently. In case of failure error
+        is logged and exception is raised, so results are never silently
+        truncated.
+
+        Args:
+            query: JQL query to search
+            fields: Comma separated string of fields to be returned for each
+                    issue, default 'key'
+            page_size: Number of issues requested per page, default
+                       SEARCH_PAGE_SIZE
+            workers: Maximal number of concurrently requested pages, default
+                     DEFAULT_WORKERS
+            ordered: If False pages are yielded in order in which they arrive,
+                     default True
+
+        Yields:
+            Dictionaries with content of issues that match given query
+
+        Raises:
+            TicketException if any page of results could not be requested
+        """
+        for page in self._iter_search_pages(query, fields,
+                                            page_size=page_size,
+                                            workers=workers, ordered=ordered):
+            if hasattr(page, 'status'):
+                raise TicketException(page.error_message)
+            for issue in page['issues']:
+                yield issue
+
+    def _iter_search_pages(self, query, fields, page_size=SEARCH_PAGE_SIZE,
+                           workers=DEFAULT_WORKERS, ordered=True):
+        """Yield all result pages of a search.
+
+        Args:
+            query: JQL query to search
+            fields: Comma separated string of fields to be returned
+            page_size: Number of issues requested per page, default
+                       SEARCH_PAGE_SIZE
+            workers: Maximal number of concurrently requested pages, default
+                     DEFAULT_WORKERS
+            ordered: If False pages are yielded in order in which they arrive,
+                     default True
+
+        Yields:
+            Dictionaries with search results, in case of failure namedtuple
+            with status, error message and url
+        """
+        first = self._search_page(query, fields, 0, page_size)
+        yield first
+        if hasattr(first, 'status'):
+            return
+        total = first.get('total', len(first['issues']))
+        # server may return less issues per page than requested
+        step = first.get('maxResults') or page_size
+        start_positions = range(step, total, step)
+
+        def search_page(start_at):
+            return self._search_page(query, fields, start_at, step)
+
+        for page in imap_concurrently(search_page, start_positions,
+                                      workers=workers, ordered=ordered):
+            yield page
+            if hasattr(page, 'status'):
+                return
+
+    def _search_page(self, query, fields, start_at, max_results):
+        """Request single page of search results.
+
+        Args:
+            query: JQL query to search
+            fields: Comma separated string of fields to be returned
+            start_at: Index of the first returned issue
+            max_results: Maximal number of returned issues
+
+        Returns:
+            Dictionary with search results, in case of failure namedtuple with
+            status, error message and url
+        """
         jql = urlencode({
             'jql': '{0}'.format(query),
-            'fields': 'key',
-            'maxResults': '500'})
+            'fields': fields,
+            'startAt': start_at,
+            'maxResults': max_results})
         try:
             r = self.s.get('{0}/rest/api/2/search?{1}'.format(self.url, jql))
             logging.debug('Search for tickets: Status code {0}'.format(
                 r.status_code))
             r.raise_for_status()
-        except requests.RequestException:
+        except requests.RequestException as e:
             error_message = 'Error while performing search - {0}'.format(
-                r.json()['errorMessages'][0])
+                error_detail(e))
             logging.error(error_message)
             return self.request_result._replace(status='Failure',
                                                 error_message=error_message)
-        id_list = [d.get('key') for d in r.json()['issues']]
-        return id_list
+        return r.json()
 
     def remove_unwanted_fields(self):
         """Remove empty or undesired fields.
@@ -634,27 +1219,72 @@ class Ticket(JiraTicket):
                 self.content['fields'].pop(key)
 
     def _create_requests_session(self):
-        """Overridden method from ticketutil to be less "noisy"."""
-        s = requests.Session()
-        if self.auth == 'kerberos':
+        """Overridden method from ticketutil to borrow session shared by all
+        tickets of the same server instead of authenticating every time.
+        Kerberos principal is not looked up when working offline.
+        """
+        if self.auth == 'kerberos' and not is_offline():
             self.principal = _get_kerberos_principal()
-            s.auth = HTTPKerberosAuth(mutual_authentication=DISABLED)
-            s.verify = False
-        if isinstance(self.auth, tuple):
-            s.auth = self.auth
+        return get_session(self.url, self.auth_url, auth=self.auth)
+
+    def _verify_project(self, project):
+        """Overridden method from ticketutil to verify project only once per
+        server, projects are not verified when working offline.
+        """
+        if is_offline() or is_project_verified(self.url, project):
+            return True
+        if super(Ticket, self)._verify_project(project):
+            set_project_verified(self.url, project)
+            return True
+        return False
+
+    def add_comment(self, comment):
+        """Override method from ticketutil to be less "noisy" and to not
+        add the same comment twice when request fails ambiguously.
+
+        Args:
+            comment: String with the comment
+
+        Returns:
+            Namedtuple with status, error message and url
+        """
+        url = '{0}/{1}/comment'.format(self.rest_url, self.ticket_id)
         try:
-            r = s.get(self.auth_url)
-            logging.debug("Create requests session: status code: {0}".format(
-                r.status_code))
-            r.raise_for_status()
-            return s
+            post_with_check(self.s, url, {'body': comment},
+                            lambda: self._find_comment(url, comment))
+            logging.debug('Added comment to ticket {0}'.format(
+                self.ticket_id))
+            return self.request_result
         except requests.RequestException as e:
-            logging.error("Error authenticating to {0}".format(self.auth_url))
+            error_message = "Error adding comment to ticket - {0}".format(
+                error_detail(e))
+            logging.error(error_message)
             logging.error(e)
-            s.close()
+            return self.request_result._replace(status='Failure',
+                                                error_message=error_message)
 
-    def add_comment(self, comment):
-        """Override method from ticketutil to be less "noisy"."""
-        logging.disable(logging.INFO)
-        super(Ticket, self).add_comment(comment)
-        logging.disable(logging.NOTSET)
+    def _find_comment(self, url, comment):
+        """Return existing comment with the same text, else None."""
+        r = self.s.get(url)
+        r.raise_for_status()
+        for existing in r.json().get('comments', []):
+            if existing.get('body') == comment:
+                return existing
+
+
+def _same_values(found, sent):
+    """Return True if select list field from JIRA has the values sent to
+    JIRA, regardless of their order.
+    """
+    return (set(value.get('value') for value in found or []) ==
+            set(value.get('value') for value in sent or []))
+
+
+def _same_named(found, sent):
+    """Return True if named field from JIRA (e.g. issue type) is the value
+    sent to JIRA by name or id.
+    """
+    found = found or {}
+    sent = sent or {}
+    return any(sent.get(key) is not None and sent.get(key) == found.get(key)
+               for key in ('id', 'name'))
@@ -0,0 +1,90 @@
+"""Module with iterative walk over templates in the order of cloning."""
+
+import logging
+
+
+class Traversal(object):
+    """Depth-first walk over templates with their parents, subtasks and
+    links using explicit stack instead of recursion.
+
+    Iterating over traversal yields tuples (Ticket, parent's ticket ID or
+    None) in the order in which tickets are cloned: ticket, its subtasks and
+    then linked tickets. Subtask is reached through its parent, parent is
+    yielded before it. Visited ticket is added to seen set when it is
+    yielded, so consumer can work on it before traversal continues. Links
+    between visited tickets are appended to links list after the linked
+    ticket is visited.
+
+    IDs of tickets waiting to be visited are available in frontier, so
+    their templates can be fetched together before get_template is called
+    for each of them.
+
+    Args:
+        tickets: List of Ticket objects to start from
+        get_template: Function returning Ticket object for ticket ID
+        seen: Set of IDs of already visited tickets, default empty set
+        matched: Set of IDs of tickets that may be visited, others are
+                 skipped without fetching them, default None (all tickets)
+        links: List to which tuples (ID, linked ID, type, direction) are
+               appended, default empty list
+    """
+
+    def __init__(self, tickets, get_template, seen=None, matched=None,
+                 links=None):
+        self.get_template = get_template
+        self.seen = seen if seen is not None else set()
+        self.matched = matched
+        self.links = links if links is not None else []
+        self._stack = [('visit', ticket.ticket_id, ticket, None)
+                       for ticket in reversed(tickets)]
+
+    @property
+    def frontier(self):
+        """Return IDs of tickets waiting to be visited in the order of
+        visiting, tickets that will be skipped are left out.
+        """
+        ids = []
+        for entry in reversed(self._stack):
+            if entry[0] != 'visit':
+                continue
+            ticket_id = entry[1]
+            if ticket_id in self.seen or ticket_id in ids:
+                continue
+            if self.matched is not None and ticket_id not in self.matched:
+                continue
+            ids.append(ticket_id)
+        return ids
+
+    def __iter__(self):
+        while self._stack:
+            entry = self._stack.pop()
+            if entry[0] == 'link':
+                self.links.append(entry[1])
+                continue
+            _, ticket_id, ticket, parent = entry
+            if ticket_id in self.seen:
+                continue
+            if self.matched is not None and ticket_id not in self.matched:
+                # visiting only matched tickets and this doesn't match
+                continue
+            if ticket is None:
+                ticket = self.get_template(ticket_id)
+            if ticket.status == 'Deprecated':
+                logging.info('Skipped {0} as it is in deprecated '
+                             'state.'.format(ticket_id))
+                continue
+            if ticket.parent_id and ticket.parent_id not in self.seen:
+                # parent has to be visited first, subtasks are then visited
+                # through their parent to preserve order
+                self._stack.append(('visit', ticket.parent_id, None, None))
+                continue
+            self.seen.add(ticket_id)
+            # stack is LIFO, so following entries are pushed in reverse
+            for link in reversed(ticket.links):
+                linked_ticket_id, link_type, direction = link
+                self._stack.append(('link', (ticket_id, linked_ticket_id,
+                                             link_type, direction)))
+                self._stack.append(('visit', linked_ticket_id, None, None))
+            for subtask_id in reversed(ticket.subtask_ids):
+                self._stack.append(('visit', subtask_id, None, ticket_id))
+            yield ticket, parent
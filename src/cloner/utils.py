@@ -1,4 +1,12 @@
-from ticket import Ticket
+import logging
+import time
+
+from cache import TemplateCache, DEFAULT_CACHE_PATH
+from resolver import fetch_tickets
+from session import set_offline
+from snapshot import TemplateSnapshot, DEFAULT_SNAPSHOT_PATH
+from ticket import Ticket, cache_template, get_template_cache, \
+    set_template_cache
 
 
 def prepare_inject(fields, prod=False):
@@ -51,37 +59,233 @@ def get_ticket_IDs_specific(pav, keywords=None, prod=False):
     Returns:
         List of string ticket IDs that match passed parameters
     """
+    query = _specific_query(pav, keywords)
+    # create dummy ticket to search with
+    t = Ticket(prod=prod)
+    tickets = t.search(query)
+    return tickets
+
+
+def get_tickets_specific(pav, keywords=None, prod=False,
+                         custom_substitutions=None):
+    """Get Ticket objects from RCMTEMPL project based on passed parameters
+    with specific restrictions for searching.
+
+    Content of tickets is taken from search results, so no additional request
+    is done per ticket. If template cache is enabled, only keys are searched
+    and content of cached templates is not requested at all. If snapshot is
+    used, tickets are searched in it and nothing is requested. If keywords
+    are specified, they don't apply to subtasks.
+
+    Args:
+        pav: Product Affects Version field as string
+        keywords: List of string keywords, default None
+        prod: Bool value to choose if production JIRA is used, default False
+        custom_substitutions: Dict with {VAR: value}, default None
+
+    Returns:
+        List of Ticket objects that match passed parameters
+    """
+    query = _specific_query(pav, keywords)
+    # create dummy ticket to search with
+    t = Ticket(prod=prod)
+    snapshot = get_snapshot(t.url)
+    if snapshot is not None or get_template_cache() is not None:
+        if snapshot is not None:
+            ticket_ids = snapshot.search(pav=pav, keywords=keywords,
+                                         subtask_keywords=False)
+        else:
+            ticket_ids = t.search(query)
+        if hasattr(ticket_ids, 'status'):
+            return []
+        fetched = fetch_tickets(ticket_ids, prod=prod,
+                                custom_substitutions=custom_substitutions)
+        return [fetched[ticket_id] for ticket_id in ticket_ids
+                if ticket_id in fetched]
+    issues = t.search_issues(query)
+    if hasattr(issues, 'status'):
+        return []
+    for issue in issues:
+        cache_template(t.url, issue)
+    return [Ticket.from_content(issue, prod=prod,
+                                custom_substitutions=custom_substitutions)
+            for issue in issues]
+
+
+def open_template_cache(path=DEFAULT_CACHE_PATH, prod=False):
+    """Open template cache, refresh it and use it for all tickets.
+
+    Args:
+        path: Path to the cache file, default DEFAULT_CACHE_PATH
+        prod: Bool value to choose if production JIRA is used, default False
+
+    Returns:
+        TemplateCache object
+    """
+    cache = TemplateCache(path)
+    cache.refresh(Ticket(prod=prod))
+    set_template_cache(cache)
+    return cache
+
+
+def open_snapshot(path=DEFAULT_SNAPSHOT_PATH, prod=False, offline=False):
+    """Open snapshot of templates and read templates from it instead of
+    JIRA.
+
+    Args:
+        path: Path to the snapshot file, default DEFAULT_SNAPSHOT_PATH
+        prod: Bool value to choose if production JIRA is used, default False
+        offline: If True no request is sent to JIRA, default False
+
+    Returns:
+        TemplateSnapshot object
+    """
+    snapshot = TemplateSnapshot(path)
+    set_offline(offline)
+    server = Ticket(prod=prod).url
+    if snapshot.server != server:
+        logging.warning('Snapshot {0} was taken from {1}, templates of {2} '
+                        'are not in it.'.format(path, snapshot.server, server))
+    logging.info('Using snapshot of {0} templates from {1}'.format(
+        len(snapshot), time.strftime('%Y-%m-%d %H:%M',
+                                     time.localtime(snapshot.created))))
+    set_template_cache(snapshot)
+    return snapshot
+
+
+def get_snapshot(server):
+    """Return TemplateSnapshot of server templates are read from.
+
+    Args:
+        server: Base URL of JIRA server
+
+    Returns:
+        TemplateSnapshot object or None if snapshot of the server is not used
+    """
+    cache = get_template_cache()
+    if isinstance(cache, TemplateSnapshot) and cache.server == server:
+        return cache
+    return None
+
+
+def _specific_query(pav, keywords=None):
+    """Create JQL query for tickets with given PAV and keywords, keywords are
+    not applied to subtasks.
+
+    Args:
+        pav: Product Affects Version field as string
+        keywords: List of string keywords, default None
+
+    Returns:
+        String JQL query
+    """
     query = 'project=RCMTEMPL and "Product Affects Version"="{0}"'.format(pav)
     if keywords:
         query += ' and ((issuetype="Sub-task") or (issuetype!="Sub-task"'
         for item in keywords:
             query += ' and "Keyword"="{0}"'.format(item)
         query += '))'
+    return query
+
+
+def get_ticket_IDs(prod=True, pav=None, keywords=None):
+    """Get list of tickets from RCMTEMPL project based on passed parameters.
+    Only parameters 'Product Affects Version' and 'Keyword' supported.
+
+    Args:
+        prod: bool value to choose if production JIRA is used, default True
+        pav: Product Affects Version field as string, default None
+        keywords: List of string keywords, default None
+
+    Returns:
+        List of string ticket IDs that match passed parameters
+    """
+    query = _query(pav, keywords)
     # create dummy ticket to search with
     t = Ticket(prod=prod)
     tickets = t.search(query)
     return tickets
 
 
-def get_ticket_IDs(prod=True, pav=None, keywords=None):
-    """Get list of tickets from RCMTEMPL project based on passed parameters.
+def iter_ticket_IDs(prod=True, pav=None, keywords=None, without_pav=None):
+    """Yield tickets from RCMTEMPL project based on passed parameters as
+    pages of search results arrive.
     Only parameters 'Product Affects Version' and 'Keyword' supported.
 
     Args:
         prod: bool value to choose if production JIRA is used, default True
         pav: Product Affects Version field as string, default None
         keywords: List of string keywords, default None
+        without_pav: Product Affects Version tickets must not have, default
+                     None
+
+    Yields:
+        String ticket IDs that match passed parameters
+
+    Raises:
+        TicketException if search results could not be requested
+    """
+    query = _query(pav, keywords, without_pav=without_pav)
+    # create dummy ticket to search with
+    t = Ticket(prod=prod)
+    for issue in t.iter_search(query):
+        yield issue['key']
+
+
+def iter_tickets(prod=True, pav=None, keywords=None, fields=('summary',)):
+    """Yield content of tickets from RCMTEMPL project based on passed
+    parameters as pages of search results arrive.
+    Only parameters 'Product Affects Version' and 'Keyword' supported. If
+    snapshot is used, tickets are searched in it.
+
+    Args:
+        prod: bool value to choose if production JIRA is used, default True
+        pav: Product Affects Version field as string, default None
+        keywords: List of string keywords, default None
+        fields: Names of fields returned for every ticket, default
+                ('summary',)
+
+    Yields:
+        Dictionaries with key and requested fields of tickets that match
+        passed parameters
+
+    Raises:
+        TicketException if search results could not be requested
+    """
+    query = _query(pav, keywords)
+    # create dummy ticket to search with
+    t = Ticket(prod=prod)
+    snapshot = get_snapshot(t.url)
+    if snapshot is not None:
+        for key in snapshot.search(pav=pav, keywords=keywords):
+            content = snapshot.get(t.url, key)
+            yield {'key': key, 'fields': dict(
+                (field, value) for field, value in content['fields'].items()
+                if field in fields)}
+        return
+    for issue in t.iter_search(query, fields=','.join(fields)):
+        yield issue
+
+
+def _query(pav=None, keywords=None, without_pav=None):
+    """Create JQL query for RCMTEMPL tickets with given PAV and keywords.
+
+    Args:
+        pav: Product Affects Version field as string, default None
+        keywords: List of string keywords, default None
+        without_pav: Product Affects Version tickets must not have, default
+                     None
 
     Returns:
-        List of string ticket IDs that match passed parameters
+        String JQL query
     """
     query = 'project=RCMTEMPL'
     if pav:
         query += ' and "Product Affects Version"="{0}"'.format(pav)
+    if without_pav:
+        query += ' and "Product Affects Version" not in ("{0}")'.format(
+            without_pav)
     if keywords:
         for item in keywords:
             query += ' and "Keyword"="{0}"'.format(item)
-    # create dummy ticket to search with
-    t = Ticket(prod=prod)
-    tickets = t.search(query)
-    return tickets
+    return query
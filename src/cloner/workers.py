@@ -0,0 +1,84 @@
+"""Module with helpers for running I/O bound work concurrently."""
+
+from multiprocessing.pool import ThreadPool
+
+# default number of threads used for concurrent requests to JIRA
+DEFAULT_WORKERS = 8
+
+
+def imap_concurrently(func, items, workers=DEFAULT_WORKERS, ordered=True):
+    """Apply func to every item using pool of threads and yield results.
+
+    Results are yielded as soon as they are available, so consumer can start
+    working before all items are processed. Exceptions raised by func are
+    re-raised in consumer.
+
+    Args:
+        func: Function accepting one item
+        items: Iterable of items
+        workers: Maximal number of threads, default DEFAULT_WORKERS
+        ordered: If True results are yielded in order of items, otherwise in
+                 order of completion, default True
+
+    Yields:
+        Results of func
+    """
+    items = list(items)
+    if workers <= 1 or len(items) <= 1:
+        for item in items:
+            yield func(item)
+        return
+    pool = ThreadPool(min(workers, len(items)))
+    try:
+        if ordered:
+            results = pool.imap(func, items)
+        else:
+            results = pool.imap_unordered(func, items)
+        for result in results:
+            yield result
+    finally:
+        pool.terminate()
+
+
+def map_concurrently(func, items, workers=DEFAULT_WORKERS):
+    """Apply func to every item using pool of threads.
+
+    Args:
+        func: Function accepting one item
+        items: Iterable of items
+        workers: Maximal number of threads, default DEFAULT_WORKERS
+
+    Returns:
+        List of results of func in order of items
+    """
+    return list(imap_concurrently(func, items, workers=workers))
+
+
+def map_streaming(func, items, workers=DEFAULT_WORKERS):
+    """Apply func to every item using pool of threads as soon as the item
+    is produced.
+
+    Unlike map_concurrently items are not collected first, so work starts
+    while e.g. next pages of search results are still requested. If
+    iterating items raises an exception, work already started is finished
+    before the exception is re-raised.
+
+    Args:
+        func: Function accepting one item
+        items: Iterable of items
+        workers: Maximal number of threads, default DEFAULT_WORKERS
+
+    Returns:
+        List of tuples (item, result of func) in order of items
+    """
+    if workers <= 1:
+        return [(item, func(item)) for item in items]
+    pool = ThreadPool(workers)
+    submitted = []
+    try:
+        for item in items:
+            submitted.append((item, pool.apply_async(func, (item,))))
+    finally:
+        pool.close()
+        pool.join()
+    return [(item, result.get()) for item, result in submitted]
@@ -0,0 +1,425 @@
+"""Local stand-in JIRA server for tests.
+
+Server implements only the parts of JIRA REST API used by the cloner, data
+are kept in memory.
+"""
+
+import datetime
+import json
+import random
+import re
+import socket
+import sys
+import threading
+import time
+
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+from urlparse import urlparse, parse_qs
+
+from cloner.compiled import clear_compiled
+
+
+def now():
+    """Return current time formatted as JIRA 'updated' field."""
+    return datetime.datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S.000+0000')
+
+
+def make_issue(key, summary='Summary', issuetype='Task', parent=None,
+               subtasks=None, links=None, status='Open', pav=None):
+    """Create content of an issue as returned by JIRA.
+
+    Args:
+        key: Issue key
+        summary: Issue summary, default 'Summary'
+        issuetype: Name of issue type, default 'Task'
+        parent: Key of parent issue, default None
+        subtasks: List of keys of subtasks, default None
+        links: List of tuples (key, type, 'inwardIssue'/'outwardIssue'),
+               default None
+        status: Name of status, default 'Open'
+        pav: List of Product Affects Versions, default None
+
+    Returns:
+        Dictionary with issue content
+    """
+    fields = {
+        'summary': summary,
+        'description': 'Description of {0}'.format(key),
+        'issuetype': {'name': issuetype, 'id': '3'},
+        'priority': {'name': 'Major', 'id': '3'},
+        'status': {'name': status},
+        'labels': [],
+        'customfield_11911': [{'value': value} for value in pav or []],
+        'subtasks': [{'key': subtask} for subtask in subtasks or []],
+        'issuelinks': [{'type': {'name': link_type},
+                        direction: {'key': link_key}}
+                       for link_key, link_type, direction in links or []],
+        'project': {'key': key.split('-')[0]},
+        'updated': '2018-01-01T00:00:00.000+0000',
+    }
+    if parent:
+        fields['parent'] = {'key': parent}
+    return {'id': str(abs(hash(key)) % 100000), 'key': key, 'fields': fields}
+
+
+class FakeJira(object):
+    """In-memory JIRA served over HTTP on localhost.
+
+    Args:
+        issues: List of issue contents, default None
+        remote_links: Dictionary issue key: list of remote links, default
+                      None
+        latency: Average delay of every response in seconds, actual delay
+                 is random between half and one and half of it, default 0
+        error_rate: Probability that request fails with 502 without being
+                    processed, default 0
+        seed: Seed of random latencies and errors, default None
+    """
+
+    def __init__(self, issues=None, remote_links=None, latency=0,
+                 error_rate=0, seed=None):
+        self.issues = dict((issue['key'], issue) for issue in issues or [])
+        self.latency = latency
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self.remote_links = remote_links or {}
+        self.comments = {}
+        self.links = []
+        self.created = []
+        self.requests = []
+        self.faults = []
+        self._counter = 0
+        self._lock = threading.Lock()
+        self._server = None
+
+    @property
+    def url(self):
+        """Return base URL of running server."""
+        return 'http://127.0.0.1:{0}'.format(self._server.server_port)
+
+    def start(self):
+        """Start serving requests in background thread."""
+        jira = self
+
+        class Handler(FakeJiraHandler):
+            server_jira = jira
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        thread = threading.Thread(target=self._server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def stop(self):
+        """Stop the server.
+
+        Templates compiled from its issues are dropped, as the next server
+        may get the same URL and issues with the same 'updated' field.
+        """
+        self._server.shutdown()
+        self._server.server_close()
+        clear_compiled()
+
+    def throttle(self, times, status=429, retry_after='0'):
+        """Refuse next requests as overloaded server.
+
+        Args:
+            times: Number of refused requests
+            status: Status of refused requests, default 429
+            retry_after: Value of Retry-After header or None, default '0'
+        """
+        headers = {'Retry-After': retry_after} if retry_after else {}
+        with self._lock:
+            self.faults.extend([{'status': status, 'headers': headers}] *
+                               times)
+
+    def fail(self, times, status=502, processed=False, method=None,
+             path=None):
+        """Fail next requests.
+
+        Args:
+            times: Number of failed requests
+            status: Status of failed requests, default 502
+            processed: If True requests are processed before failure is
+                       returned, as if the response was lost, default False
+            method: Only requests with this method fail, default None (all)
+            path: Only requests with path matching this regex fail, default
+                  None (all)
+        """
+        with self._lock:
+            self.faults.extend([{'status': status, 'processed': processed,
+                                 'method': method, 'path': path}] * times)
+
+    def delay(self, times, seconds, method=None):
+        """Process next requests after a delay.
+
+        Args:
+            times: Number of delayed requests
+            seconds: Delay in seconds
+            method: Only requests with this method are delayed, default None
+                    (all)
+        """
+        with self._lock:
+            self.faults.extend([{'delay': seconds, 'method': method}] * times)
+
+    def _pop_fault(self, method, path):
+        """Return next fault for request with method and path, random fault
+        if there is no such fault and latency or error rate is set, else
+        None.
+        """
+        for i, fault in enumerate(self.faults):
+            if fault.get('method') in (None, method) and \
+                    re.search(fault.get('path') or '', path):
+                return self.faults.pop(i)
+        fault = {}
+        if self.latency:
+            fault['delay'] = self.latency * self._random.uniform(0.5, 1.5)
+        if self.error_rate and self._random.random() < self.error_rate:
+            fault['status'] = 502
+        return fault or None
+
+    def count(self, method, pattern):
+        """Return number of requests with method and path matching regex."""
+        return len([1 for m, path in self.requests
+                    if m == method and re.search(pattern, path)])
+
+    def create(self, fields):
+        """Create issue from fields of create request.
+
+        Returns:
+            Key of the new issue
+        """
+        with self._lock:
+            self._counter += 1
+            key = '{0}-{1}'.format(fields['project']['key'], self._counter)
+            issue = make_issue(key)
+            issue['fields'].update(fields)
+            issue['fields']['subtasks'] = []
+            issue['fields']['created'] = now()
+            self.issues[key] = issue
+            self.created.append(key)
+            parent = fields.get('parent', {}).get('key')
+            if parent:
+                self.issues[parent]['fields']['subtasks'].append(
+                    {'key': key})
+        return key
+
+    def search(self, jql):
+        """Return issues matching simple JQL.
+
+        Supported are conditions joined by 'and': project=X,
+        key in (A, B), "Product Affects Version"="X", "Product Affects
+        Version" not in ("X"), cf[N]="X" of select list fields,
+        updated >= -Nm, created >= -Nm and (comment ~ "\"phrase\"" or ...),
+        other conditions (e.g. creator = currentUser()) are ignored.
+
+        Raises:
+            ValueError if key in (...) contains key of missing issue, as
+            JIRA rejects such query
+        """
+        issues = sorted(self.issues.values(), key=lambda i: i['key'])
+        for condition in re.split(r'\s+and\s+', jql, flags=re.I):
+            match = re.match(r'project\s*=\s*"?(\w+)"?$', condition.strip())
+            if match:
+                issues = [i for i in issues
+                          if i['key'].startswith(match.group(1) + '-')]
+                continue
+            match = re.match(r'key\s+in\s+\((.*)\)$', condition.strip())
+            if match:
+                keys = [k.strip(' "') for k in match.group(1).split(',')]
+                for key in keys:
+                    if key not in self.issues:
+                        raise ValueError("An issue with key '{0}' does not "
+                                         "exist for field 'key'.".format(key))
+                issues = [i for i in issues if i['key'] in keys]
+                continue
+            match = re.match(r'"Product Affects Version"\s*=\s*"(.*)"$',
+                             condition.strip())
+            if match:
+                issues = [i for i in issues if match.group(1) in
+                          [v['value'] for v in
+                           i['fields'].get('customfield_11911') or []]]
+                continue
+            match = re.match(r'cf\[(\d+)\]\s*=\s*"(.*)"$', condition.strip())
+            if match:
+                field = 'customfield_{0}'.format(match.group(1))
+                issues = [i for i in issues if match.group(2) in
+                          [v['value'] for v in i['fields'].get(field) or []]]
+                continue
+            match = re.match(
+                r'"Product Affects Version"\s+not\s+in\s+\("(.*)"\)$',
+                condition.strip())
+            if match:
+                issues = [i for i in issues if match.group(1) not in
+                          [v['value'] for v in
+                           i['fields'].get('customfield_11911') or []]]
+                continue
+            match = re.match(r'(updated|created)\s*>=\s*-(\d+)m$',
+                             condition.strip())
+            if match:
+                since = datetime.datetime.utcnow() - datetime.timedelta(
+                    minutes=int(match.group(2)))
+                field = match.group(1)
+                issues = [i for i in issues if datetime.datetime.strptime(
+                    i['fields'].get(field, '2000-01-01T00:00:00')[:19],
+                    '%Y-%m-%dT%H:%M:%S') >= since]
+                continue
+            phrases = re.findall(r'comment\s*~\s*"\\"(.*?)\\""', condition)
+            if phrases:
+                issues = [i for i in issues if any(
+                    phrase in comment['body'] for phrase in phrases
+                    for comment in i['fields'].get(
+                        'comment', {}).get('comments', []))]
+        return issues
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # clients that timed out close connection before response is written
+        if not isinstance(sys.exc_info()[1], socket.error):
+            HTTPServer.handle_error(self, request, client_address)
+
+
+class FakeJiraHandler(BaseHTTPRequestHandler):
+    """Request handler routing requests to FakeJira."""
+
+    server_jira = None
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def do_PUT(self):
+        self._handle('PUT')
+
+    def _handle(self, method):
+        jira = self.server_jira
+        url = urlparse(self.path)
+        path = url.path
+        with jira._lock:
+            jira.requests.append((method, path))
+            fault = jira._pop_fault(method, path)
+        length = int(self.headers.getheader('content-length') or 0)
+        body = json.loads(self.rfile.read(length)) if length else None
+        self._status = None
+        if fault is not None:
+            time.sleep(fault.get('delay', 0))
+            if fault.get('processed'):
+                self._status = fault['status']
+            elif 'status' in fault:
+                self._respond(fault['status'], {'errorMessages': ['Failed'],
+                                                'errors': {}},
+                              headers=fault.get('headers'))
+                return
+        match = re.match(r'/rest/api/2/issue/([\w-]+)(/\w+)?$', path)
+        if path in ('/', '/step-auth-gss') or \
+                path.startswith('/rest/api/2/project/'):
+            self._respond(200, {})
+        elif path == '/rest/auth/1/session':
+            self._respond(200, {'name': 'user'})
+        elif path == '/rest/api/2/search':
+            self._search(parse_qs(url.query))
+        elif path == '/rest/api/2/issue' and method == 'POST':
+            key = jira.create(body['fields'])
+            self._respond(201, {'key': key})
+        elif path == '/rest/api/2/issue/bulk' and method == 'POST':
+            keys = [jira.create(update['fields'])
+                    for update in body['issueUpdates']]
+            self._respond(201, {'issues': [{'key': k} for k in keys],
+                                'errors': []})
+        elif path == '/rest/api/2/issueLink' and method == 'POST':
+            with jira._lock:
+                jira.links.append(body)
+                inward = body['inwardIssue']['key']
+                outward = body['outwardIssue']['key']
+                for key, other, direction in ((inward, outward,
+                                               'outwardIssue'),
+                                              (outward, inward,
+                                               'inwardIssue')):
+                    if key in jira.issues:
+                        jira.issues[key]['fields']['issuelinks'].append(
+                            {'type': body['type'], direction: {'key': other}})
+            self._respond(201, None)
+        elif match and match.group(1) not in jira.issues:
+            self._respond(404, {'errorMessages': ['Issue Does Not Exist'],
+                                'errors': {}})
+        elif match and match.group(2) is None and method == 'GET':
+            self._respond(200, self._project(
+                jira.issues[match.group(1)], parse_qs(url.query)))
+        elif match and match.group(2) is None and method == 'PUT':
+            self._update(jira.issues[match.group(1)], body)
+            self._respond(204, None)
+        elif match and match.group(2) == '/remotelink':
+            links = jira.remote_links.setdefault(match.group(1), [])
+            if method == 'GET':
+                self._respond(200, links)
+            else:
+                with jira._lock:
+                    links.append(body)
+                self._respond(201, {'id': len(links)})
+        elif match and match.group(2) == '/comment' and method == 'GET':
+            self._respond(200, jira.issues[match.group(1)]['fields'].get(
+                'comment', {'comments': []}))
+        elif match and match.group(2) == '/comment' and method == 'POST':
+            with jira._lock:
+                jira.comments.setdefault(match.group(1), []).append(
+                    body['body'])
+                jira.issues[match.group(1)]['fields'].setdefault(
+                    'comment', {'comments': []})['comments'].append(
+                        {'body': body['body']})
+            self._respond(201, {})
+        else:
+            self._respond(404, {'errorMessages': ['Not found'], 'errors': {}})
+
+    def _search(self, query):
+        try:
+            issues = self.server_jira.search(query['jql'][0])
+        except ValueError as e:
+            self._respond(400, {'errorMessages': [str(e)], 'errors': {}})
+            return
+        start_at = int(query.get('startAt', ['0'])[0])
+        max_results = int(query.get('maxResults', ['50'])[0])
+        page = [self._project(issue, query)
+                for issue in issues[start_at:start_at + max_results]]
+        self._respond(200, {'startAt': start_at, 'maxResults': max_results,
+                            'total': len(issues), 'issues': page})
+
+    @staticmethod
+    def _project(issue, query):
+        """Return issue with only fields requested by the query."""
+        fields = query.get('fields', ['*all'])[0].split(',')
+        if '*all' in fields:
+            return issue
+        return {'key': issue['key'], 'id': issue['id'],
+                'fields': dict((k, v) for k, v in issue['fields'].items()
+                               if k in fields)}
+
+    def _update(self, issue, body):
+        for field, operations in body.get('update', {}).items():
+            for operation in operations:
+                if 'add' in operation:
+                    issue['fields'].setdefault(field, []).append(
+                        operation['add'])
+        issue['fields'].update(body.get('fields', {}))
+
+    def _respond(self, status, content, headers=None):
+        if getattr(self, '_status', None):
+            # request was processed, but its response is lost
+            status, content = self._status, {'errorMessages': ['Failed'],
+                                             'errors': {}}
+        data = json.dumps(content) if content is not None else ''
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
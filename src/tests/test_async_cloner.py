@@ -0,0 +1,171 @@
+import logging
+import unittest
+
+from mock import MagicMock, patch
+
+from cloner import session
+from cloner.async_cloner import AsyncCloner
+from cloner.client import Future, JiraClient
+from cloner.retry import configure_retries
+from cloner.ticket import Ticket
+from fake_jira import FakeJira, make_issue
+
+REMOTE_LINK = {'id': 1, 'self': 'url', 'object': {'url': 'http://doc',
+                                                  'title': 'Doc'}}
+
+
+class TestFuture(unittest.TestCase):
+
+    def test_result(self):
+        """Test that callbacks are called with finished future."""
+        future = Future()
+        results = []
+        future.add_done_callback(lambda f: results.append(f.result()))
+        future.set_result('spam')
+        future.add_done_callback(lambda f: results.append(f.result()))
+        self.assertEqual(results, ['spam', 'spam'])
+
+    def test_exception(self):
+        """Test that exception is raised from result()."""
+        future = Future()
+        future.set_exception(ValueError('eggs'))
+        self.assertIsInstance(future.exception(), ValueError)
+        with self.assertRaises(ValueError):
+            future.result()
+
+
+class TestAsyncCloner(unittest.TestCase):
+    """Tests running against local stand-in JIRA server."""
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.jira = FakeJira(
+            issues=[
+                make_issue('RCMTEMPL-1', subtasks=['RCMTEMPL-2',
+                                                   'RCMTEMPL-3'],
+                           links=[('RCMTEMPL-4', 'Blocks', 'outwardIssue')]),
+                make_issue('RCMTEMPL-2', issuetype='Sub-task',
+                           parent='RCMTEMPL-1'),
+                make_issue('RCMTEMPL-3', issuetype='Sub-task',
+                           parent='RCMTEMPL-1'),
+                make_issue('RCMTEMPL-4'),
+            ],
+            remote_links={'RCMTEMPL-4': [REMOTE_LINK]})
+        self.jira.start()
+        self.patcher = patch('cloner.ticket.STAGE_URL', self.jira.url)
+        self.patcher.start()
+        self.client = JiraClient(self.jira.url, max_in_flight=4)
+
+    def tearDown(self):
+        self.client.close()
+        self.patcher.stop()
+        session.close_sessions()
+        self.jira.stop()
+
+    def test_client_requests(self):
+        """Test that client returns futures with content of responses."""
+        futures = [self.client.get_issue('RCMTEMPL-{0}'.format(i))
+                   for i in range(1, 5)]
+        self.assertEqual([f.result()['key'] for f in futures],
+                         ['RCMTEMPL-1', 'RCMTEMPL-2', 'RCMTEMPL-3',
+                          'RCMTEMPL-4'])
+        self.assertIsNotNone(self.client.get_issue('RCMTEMPL-5').exception())
+
+    def test_clone_and_link(self):
+        """Test that tickets are cloned with subtasks in order, remote links,
+        comments and links.
+        """
+        cloner = AsyncCloner([Ticket(ticket_id='RCMTEMPL-1')], 'RCM',
+                             client=self.client)
+        cloner.clone_tickets()
+        cloner.link_tickets()
+        cloned = cloner._cloned
+        self.assertEqual(sorted(cloned), ['RCMTEMPL-1', 'RCMTEMPL-2',
+                                          'RCMTEMPL-3', 'RCMTEMPL-4'])
+        parent = self.jira.issues[cloned['RCMTEMPL-1']]
+        self.assertEqual([s['key'] for s in parent['fields']['subtasks']],
+                         [cloned['RCMTEMPL-2'], cloned['RCMTEMPL-3']])
+        self.assertEqual(
+            self.jira.remote_links[cloned['RCMTEMPL-4']],
+            [{'object': {'url': 'http://doc', 'title': 'Doc'}}])
+        # remote links of every template are requested once
+        self.assertEqual(self.jira.count('GET', '/RCMTEMPL-4/remotelink'), 1)
+        self.assertEqual(self.jira.comments[cloned['RCMTEMPL-2']],
+                         ['This issue was cloned from RCMTEMPL-2'])
+        self.assertEqual(self.jira.links, [{
+            'type': {'name': 'Blocks'},
+            'inwardIssue': {'key': cloned['RCMTEMPL-1']},
+            'outwardIssue': {'key': cloned['RCMTEMPL-4']}}])
+        self.assertEqual(cloner._failed, {})
+
+    def test_create_not_duplicated(self):
+        """Test that ticket created by ambiguously failed request is not
+        created again.
+        """
+        configure_retries(retries=2, backoff=0.01)
+        self.addCleanup(configure_retries)
+        self.jira.fail(1, processed=True, method='POST')
+        cloner = AsyncCloner([Ticket(ticket_id='RCMTEMPL-4')], 'RCM',
+                             client=self.client)
+        cloner.clone_tickets()
+        self.assertEqual(self.jira.created, ['RCM-1'])
+        self.assertEqual(cloner._cloned, {'RCMTEMPL-4': 'RCM-1'})
+        self.assertEqual(cloner._failed, {})
+
+    def test_failed_check_resolves_future(self):
+        """Test that error raised by idempotency check is set to the future
+        instead of leaving it unresolved.
+        """
+        configure_retries(retries=2, backoff=0.01)
+        self.addCleanup(configure_retries)
+        self.jira.fail(1, processed=True, method='POST')
+
+        def check(payload):
+            raise KeyError('key')
+
+        future = self.client.create_issue(
+            {'fields': {'project': {'key': 'RCM'}, 'summary': 'Spam'}},
+            check=check)
+        self.assertIsInstance(future.exception(), KeyError)
+        self.client.join()
+
+    def test_failed_link_is_logged(self):
+        """Test that failed link is logged and stored as failure."""
+        cloner = AsyncCloner([Ticket(ticket_id='RCMTEMPL-1')], 'RCM',
+                             client=self.client)
+        cloner.log = MagicMock()
+        cloner.clone_tickets()
+        self.jira.fail(1, status=400, method='POST')
+        cloner.link_tickets()
+        self.assertEqual(self.jira.links, [])
+        self.assertEqual(list(cloner._failed), ['RCMTEMPL-1'])
+        self.assertIn('Linking', cloner._failed['RCMTEMPL-1'])
+        cloner.log.error.assert_called()
+
+    def clone_existing(self, clone_id):
+        """Finish clone of RCMTEMPL-4 created by previous run."""
+        cloner = AsyncCloner([Ticket(ticket_id='RCMTEMPL-4')], 'RCM',
+                             client=self.client)
+        cloner.log = MagicMock()
+        cloner._existing['RCMTEMPL-4'] = clone_id
+        cloner.clone_tickets()
+        return cloner
+
+    def test_failed_writes_are_logged(self):
+        """Test that failed remote link and comment are logged and stored as
+        failure.
+        """
+        self.jira.issues['RCM-100'] = make_issue('RCM-100')
+        self.jira.fail(1, status=400, method='POST', path='/remotelink$')
+        cloner = self.clone_existing('RCM-100')
+        self.assertIn('Copying remote link', cloner._failed['RCMTEMPL-4'])
+        cloner.log.error.assert_called()
+        self.jira.fail(1, status=400, method='POST', path='/comment$')
+        cloner = self.clone_existing('RCM-100')
+        self.assertIn('Adding comment', cloner._failed['RCMTEMPL-4'])
+        self.assertEqual(len(self.jira.remote_links['RCM-100']), 1)
+        self.assertNotIn('RCM-100', self.jira.comments)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import logging
+import unittest
+
+from benchmarks.benchmark import compare, make_template_graph, run_scenario
+
+
+class TestBenchmark(unittest.TestCase):
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+
+    def test_template_graph(self):
+        """Test that graph has subtasks and links on both sides."""
+        issues, remote_links = make_template_graph(
+            10, subtasks=3, link_density=0.5, remote_links=1)
+        self.assertEqual(len(issues), 40)
+        tasks = dict((issue['key'], issue) for issue in issues
+                     if issue['fields']['issuetype']['name'] == 'Task')
+        self.assertEqual(len(tasks), 10)
+        self.assertEqual(len(remote_links), 10)
+        for key, task in tasks.items():
+            self.assertEqual(len(task['fields']['subtasks']), 3)
+            for link in task['fields']['issuelinks']:
+                other = link.get('outwardIssue') or link.get('inwardIssue')
+                links = tasks[other['key']]['fields']['issuelinks']
+                self.assertIn(key, [
+                    (reverse.get('outwardIssue') or
+                     reverse.get('inwardIssue'))['key'] for reverse in links])
+        self.assertEqual(make_template_graph(10, seed=1),
+                         make_template_graph(10, seed=1))
+
+    def test_run_scenarios(self):
+        """Test that scenarios report processed tickets and requests."""
+        graph = make_template_graph(5)
+        result = run_scenario('clone', graph)
+        self.assertEqual(result['tickets'], 15)
+        self.assertEqual(result['operations']['create'], 15)
+        result = run_scenario('pav-update', graph, error_rate=0.2)
+        self.assertEqual(result['tickets'], 15)
+        self.assertEqual(result['operations']['search'], 1)
+        result = run_scenario('search-listing', graph)
+        self.assertEqual(result['tickets'], 15)
+        self.assertEqual(result['requests'], 3)
+
+    def test_compare(self):
+        """Test that slower scenario or more requests are reported."""
+        baseline = [{'scenario': 'clone', 'tickets_per_second': 100.0,
+                     'requests': 100}]
+        self.assertEqual(compare([{'scenario': 'clone',
+                                   'tickets_per_second': 90.0,
+                                   'requests': 110}], baseline), [])
+        self.assertEqual(len(compare([{'scenario': 'clone',
+                                       'tickets_per_second': 50.0,
+                                       'requests': 200}], baseline)), 2)
+        self.assertEqual(compare([{'scenario': 'search',
+                                   'tickets_per_second': 1.0,
+                                   'requests': 1}], baseline), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+import logging
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from mock import patch
+
+from cloner import session
+from cloner.cache import TemplateCache
+from cloner.resolver import fetch_tickets
+from cloner.ticket import Ticket, set_template_cache
+from cloner.utils import get_tickets_specific, open_template_cache
+from fake_jira import FakeJira, make_issue, now
+
+
+class TestTemplateCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'cache', 'templates.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_put_get(self):
+        """Test that content survives reopening of the cache."""
+        cache = TemplateCache(self.path)
+        cache.put('url', make_issue('RCMTEMPL-1', summary=u'Šablona'))
+        cache.close()
+        cache = TemplateCache(self.path)
+        self.assertEqual(cache.get('url', 'RCMTEMPL-1')['fields']['summary'],
+                         u'Šablona')
+        self.assertIsNone(cache.get('other-url', 'RCMTEMPL-1'))
+        self.assertIsNone(cache.get('url', 'RCMTEMPL-2'))
+
+    def test_remote_links(self):
+        """Test that remote links are dropped when template changes."""
+        cache = TemplateCache(self.path)
+        cache.put_remote_links('url', 'RCMTEMPL-1', [])
+        self.assertIsNone(cache.get_remote_links('url', 'RCMTEMPL-1'))
+        cache.put('url', make_issue('RCMTEMPL-1'))
+        cache.put_remote_links('url', 'RCMTEMPL-1', [{'object': {}}])
+        self.assertEqual(cache.get_remote_links('url', 'RCMTEMPL-1'),
+                         [{'object': {}}])
+        cache.put('url', make_issue('RCMTEMPL-1'))
+        self.assertIsNone(cache.get_remote_links('url', 'RCMTEMPL-1'))
+
+    def test_evict_max_entries(self):
+        """Test that least recently used templates are evicted."""
+        cache = TemplateCache(self.path, max_entries=2)
+        with patch('cloner.cache.time.time') as mock_time:
+            for i in range(1, 4):
+                mock_time.return_value = i
+                cache.put('url', make_issue('RCMTEMPL-{0}'.format(i)))
+            mock_time.return_value = 4
+            cache.get('url', 'RCMTEMPL-1')
+            cache.evict()
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get('url', 'RCMTEMPL-2'))
+
+    def test_evict_max_age(self):
+        """Test that templates not used for max_age are evicted."""
+        cache = TemplateCache(self.path, max_age=60)
+        with patch('cloner.cache.time.time', return_value=time.time() - 120):
+            cache.put('url', make_issue('RCMTEMPL-1'))
+        cache.put('url', make_issue('RCMTEMPL-2'))
+        cache.evict()
+        self.assertIsNone(cache.get('url', 'RCMTEMPL-1'))
+        self.assertIsNotNone(cache.get('url', 'RCMTEMPL-2'))
+
+
+class TestTemplateCacheWithJira(unittest.TestCase):
+    """Tests running against local stand-in JIRA server."""
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.jira = FakeJira(issues=[
+            make_issue('RCMTEMPL-1', subtasks=['RCMTEMPL-2'], pav=['1.0']),
+            make_issue('RCMTEMPL-2', issuetype='Sub-task',
+                       parent='RCMTEMPL-1', pav=['1.0']),
+            make_issue('RCMTEMPL-3', pav=['1.0']),
+        ])
+        self.jira.start()
+        self.patcher = patch('cloner.ticket.STAGE_URL', self.jira.url)
+        self.patcher.start()
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'templates.db')
+
+    def tearDown(self):
+        set_template_cache(None)
+        shutil.rmtree(self.directory)
+        self.patcher.stop()
+        session.close_sessions()
+        self.jira.stop()
+
+    def test_ticket_uses_cache(self):
+        """Test that cached template is not requested."""
+        open_template_cache(self.path)
+        self.assertEqual(Ticket(ticket_id='RCMTEMPL-1').summary, 'Summary')
+        self.assertEqual(Ticket(ticket_id='RCMTEMPL-1').summary, 'Summary')
+        self.assertEqual(self.jira.count('GET', '/issue/RCMTEMPL-1$'), 1)
+
+    def test_remote_links_cached(self):
+        """Test that remote links of cached template are not requested."""
+        open_template_cache(self.path)
+        Ticket(ticket_id='RCMTEMPL-1').load_content()
+        self.assertEqual(Ticket(ticket_id='RCMTEMPL-1').remote_links, [])
+        self.assertEqual(Ticket(ticket_id='RCMTEMPL-1').remote_links, [])
+        self.assertEqual(self.jira.count('GET', '/remotelink'), 1)
+
+    def test_repeated_run(self):
+        """Test that second run requests only changed templates."""
+        cache = open_template_cache(self.path)
+        self.assertEqual(self.jira.count('GET', '/search'), 0)
+        tickets = get_tickets_specific('1.0')
+        self.assertEqual([t.ticket_id for t in tickets],
+                         ['RCMTEMPL-1', 'RCMTEMPL-2', 'RCMTEMPL-3'])
+        cache.close()
+
+        self.jira.issues['RCMTEMPL-3']['fields'].update(
+            {'summary': 'Changed', 'updated': now()})
+        del self.jira.requests[:]
+        cache = open_template_cache(self.path)
+        self.assertEqual(cache.get(self.jira.url,
+                                   'RCMTEMPL-3')['fields']['summary'],
+                         'Changed')
+        tickets = get_tickets_specific('1.0')
+        self.assertEqual([t.summary for t in tickets],
+                         ['Summary', 'Summary', 'Changed'])
+        # refresh and search of keys, no content is requested
+        self.assertEqual(self.jira.count('GET', '/search'), 2)
+        self.assertEqual(self.jira.count('GET', '/issue/'), 0)
+
+    def test_fetch_tickets_cached(self):
+        """Test that only templates missing in cache are searched."""
+        open_template_cache(self.path)
+        fetch_tickets(['RCMTEMPL-1'])
+        del self.jira.requests[:]
+        fetched = fetch_tickets(['RCMTEMPL-1', 'RCMTEMPL-3'])
+        self.assertEqual(sorted(fetched), ['RCMTEMPL-1', 'RCMTEMPL-3'])
+        self.assertEqual(self.jira.count('GET', '/search'), 1)
+        fetch_tickets(['RCMTEMPL-1', 'RCMTEMPL-3'])
+        self.assertEqual(self.jira.count('GET', '/search'), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,23 +1,49 @@
 import logging
 import unittest
 
+from collections import namedtuple
+
 from mock import MagicMock, patch, call
 
 from cloner.cloner import Cloner
 from cloner.ticket import Ticket
 
 
+FAILURE = namedtuple('Result', ['status', 'error_message'])('Failure', 'error')
+
+
+def make_template(ticket_id, parent_id=None, subtask_ids=None, links=None,
+                  issuetype='Task', status='Open'):
+    """Create mocked template ticket."""
+    t = MagicMock(spec=Ticket)
+    t.ticket_id = ticket_id
+    t.parent_id = parent_id
+    t.subtask_ids = subtask_ids or []
+    t.links = links or []
+    t.issuetype = issuetype
+    t.status = status
+    t.remote_links = None
+    return t
+
+
 class TestCloner(unittest.TestCase):
 
     def setUp(self):
         logging.disable(logging.CRITICAL)
+        # templates are fetched by mocked _get_template in tests
+        self.patcher = patch('cloner.cloner.resolve_closure',
+                             side_effect=lambda tickets, **kw: kw['known'])
+        self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
 
     @patch('cloner.cloner.Cloner.clone_ticket')
     def test_clone_tickets(self, mock_clone):
         """Test that clone_tickets() calls clone_ticket for all tickets."""
-        t1 = MagicMock(spec=Ticket)
-        t2 = MagicMock(spec=Ticket)
-        t3 = MagicMock(spec=Ticket)
+        t1 = make_template('T-1')
+        t2 = make_template('T-2')
+        t3 = make_template('T-3')
         cloner = Cloner([t1, t2, t3], None)
         cloner.clone_tickets()
         calls = [call(t1, only_matched=False),
@@ -44,6 +70,131 @@ class TestCloner(unittest.TestCase):
         cloner.clone_subtask_to_existing_parent(t, 'parent')
         self.assertEqual(cloner._cloned, {})
 
+    @patch('cloner.cloner.Ticket', autospec=True)
+    def test_clone_tickets_bulk(self, mock_ticket):
+        """Test that tasks are created in first wave and subtasks with
+        their parents filled in the second one.
+        """
+        task = make_template('T-1', subtask_ids=['T-2', 'T-3'])
+        subtask_1 = make_template('T-2', parent_id='T-1',
+                                  issuetype='Sub-task')
+        subtask_2 = make_template('T-3', parent_id='T-1',
+                                  issuetype='Sub-task')
+        templates = {'T-2': subtask_1, 'T-3': subtask_2}
+        new = mock_ticket.return_value
+        new.create_bulk.side_effect = [['CID-1'], ['CID-2', FAILURE]]
+        cloner = Cloner([task], 'RCM', bulk=True)
+        with patch.object(cloner, '_get_template', templates.get):
+            cloner.clone_tickets()
+        self.assertEqual(new.create_bulk.call_count, 2)
+        new.prepare_clone.assert_has_calls([
+            call(task, inject=None, parent=None, custom_substitutions=None),
+            call(subtask_1, inject=None, parent='CID-1',
+                 custom_substitutions=None),
+            call(subtask_2, inject=None, parent='CID-1',
+                 custom_substitutions=None)])
+        self.assertEqual(cloner._cloned, {'T-1': 'CID-1', 'T-2': 'CID-2'})
+        self.assertEqual(cloner._failed, {'T-3': 'error'})
+
+    @patch('cloner.cloner.Ticket', autospec=True)
+    def test_clone_tickets_bulk_without_parent(self, mock_ticket):
+        """Test that subtasks are not created when parent failed."""
+        task = make_template('T-1', subtask_ids=['T-2'])
+        subtask = make_template('T-2', parent_id='T-1', issuetype='Sub-task')
+        new = mock_ticket.return_value
+        new.create_bulk.return_value = [FAILURE]
+        cloner = Cloner([task], 'RCM', bulk=True)
+        with patch.object(cloner, '_get_template', {'T-2': subtask}.get):
+            cloner.clone_tickets()
+        new.create_bulk.assert_called_once()
+        self.assertEqual(cloner._cloned, {})
+        self.assertIn('T-2', cloner._failed)
+
+    @patch('cloner.cloner.Cloner._new_ticket')
+    def test_clone_tickets_concurrently(self, mock_new):
+        """Test that concurrent cloning creates parents before subtasks and
+        keeps order of subtasks.
+        """
+        task = make_template('T-1', subtask_ids=['T-2', 'T-3'])
+        templates = {
+            'T-2': make_template('T-2', parent_id='T-1',
+                                 issuetype='Sub-task'),
+            'T-3': make_template('T-3', parent_id='T-1',
+                                 issuetype='Sub-task'),
+        }
+        other = make_template('T-4')
+        created = []
+
+        def new_ticket():
+            new = MagicMock(spec=Ticket)
+            new.ticket_id = None
+
+            def prepare_clone(ticket, **kwargs):
+                new.template = ticket
+
+            def create_from_json(json):
+                new.ticket_id = 'C' + new.template.ticket_id
+                created.append(new.template.ticket_id)
+            new.prepare_clone.side_effect = prepare_clone
+            new.create_from_json.side_effect = create_from_json
+            return new
+        mock_new.side_effect = new_ticket
+        cloner = Cloner([task, other], 'RCM', workers=4)
+        with patch.object(cloner, '_get_template', templates.get):
+            cloner.clone_tickets()
+        self.assertEqual(cloner._cloned, {'T-1': 'CT-1', 'T-2': 'CT-2',
+                                          'T-3': 'CT-3', 'T-4': 'CT-4'})
+        self.assertLess(created.index('T-1'), created.index('T-2'))
+        self.assertLess(created.index('T-2'), created.index('T-3'))
+        self.assertEqual(cloner._failed, {})
+
+    @patch('cloner.cloner.Cloner._new_ticket')
+    def test_clone_tickets_concurrently_failed_parent(self, mock_new):
+        """Test that subtasks are not cloned if parent failed."""
+        task = make_template('T-1', subtask_ids=['T-2'])
+        subtask = make_template('T-2', parent_id='T-1', issuetype='Sub-task')
+        mock_new.return_value.ticket_id = None
+        mock_new.return_value.create_from_json.return_value = FAILURE
+        cloner = Cloner([task], 'RCM', workers=2)
+        with patch.object(cloner, '_get_template', {'T-2': subtask}.get):
+            cloner.clone_tickets()
+        mock_new.return_value.create_from_json.assert_called_once()
+        self.assertEqual(cloner._cloned, {})
+        self.assertEqual(cloner._failed, {'T-1': 'error',
+                                          'T-2': 'Parent was not cloned'})
+
+    @patch('cloner.cloner.Cloner._new_ticket')
+    def test_clone_tickets_concurrently_failed_subtask(self, mock_new):
+        """Test that later subtasks are cloned if their sibling failed."""
+        task = make_template('T-1', subtask_ids=['T-2', 'T-3'])
+        templates = {
+            'T-2': make_template('T-2', parent_id='T-1',
+                                 issuetype='Sub-task'),
+            'T-3': make_template('T-3', parent_id='T-1',
+                                 issuetype='Sub-task'),
+        }
+
+        def new_ticket():
+            new = MagicMock(spec=Ticket)
+            new.ticket_id = None
+
+            def prepare_clone(ticket, **kwargs):
+                new.template = ticket
+
+            def create_from_json(json):
+                if new.template.ticket_id == 'T-2':
+                    return FAILURE
+                new.ticket_id = 'C' + new.template.ticket_id
+            new.prepare_clone.side_effect = prepare_clone
+            new.create_from_json.side_effect = create_from_json
+            return new
+        mock_new.side_effect = new_ticket
+        cloner = Cloner([task], 'RCM', workers=2)
+        with patch.object(cloner, '_get_template', templates.get):
+            cloner.clone_tickets()
+        self.assertEqual(cloner._cloned, {'T-1': 'CT-1', 'T-3': 'CT-3'})
+        self.assertEqual(cloner._failed, {'T-2': 'error'})
+
     @patch('cloner.cloner.Ticket', autospec=True)
     def test_link_tickets(self, mock_ticket):
         """Test that tickets are linked and same links are not created multiple
@@ -53,10 +204,32 @@ class TestCloner(unittest.TestCase):
         cloner._links = [('ID-1', 'ID-2', 'type', 'inward'),
                          ('ID-2', 'ID-1', 'type', 'outward')]
         cloner._cloned = {'ID-1': 'CID-1', 'ID-2': 'CID-2'}
+        mock_ticket.return_value.create_link.return_value = None
         cloner.link_tickets()
         calls = [call(('CID-2', 'type', 'inward'))]
         mock_ticket.return_value.create_link.assert_has_calls(calls)
-        self.assertEqual(cloner._linked, [['CID-1', 'CID-2']])
+        mock_ticket.return_value.create_link.assert_called_once()
+        self.assertEqual(cloner._linked, {frozenset(['CID-1', 'CID-2'])})
+        # clone's content is not requested
+        for args, kwargs in mock_ticket.call_args_list:
+            self.assertNotIn('ticket_id', kwargs)
+
+    @patch('cloner.cloner.Ticket', autospec=True)
+    def test_failed_link_is_retried(self, mock_ticket):
+        """Test that failed link is not stored as created and is tried again
+        by next link_tickets.
+        """
+        cloner = Cloner([], None)
+        cloner._links = [('ID-1', 'ID-2', 'type', 'inward')]
+        cloner._cloned = {'ID-1': 'CID-1', 'ID-2': 'CID-2'}
+        create_link = mock_ticket.return_value.create_link
+        create_link.return_value = FAILURE
+        cloner.link_tickets()
+        self.assertEqual(cloner._linked, set())
+        create_link.return_value = None
+        cloner.link_tickets()
+        self.assertEqual(create_link.call_count, 2)
+        self.assertEqual(cloner._linked, {frozenset(['CID-1', 'CID-2'])})
 
 
 if __name__ == '__main__':
@@ -0,0 +1,49 @@
+import re
+import unittest
+
+from mock import patch
+
+from cloner import compiled
+from cloner.compiled import CompiledTemplate, get_compiled, store_compiled
+
+
+class TestCompiledTemplate(unittest.TestCase):
+
+    def setUp(self):
+        self.pattern = re.compile('(?P<v0><PAV>)|(?P<v1><X>)')
+        self.groups = {'v0': '<PAV>', 'v1': '<X>'}
+
+    def test_fill(self):
+        """Test that slots are filled and variables without value kept."""
+        template = CompiledTemplate(
+            {'summary': '<PAV> and <X>', 'description': 'No slots',
+             'labels': ['a']}, self.pattern, self.groups)
+        values = {'<PAV>': '1.0'}
+        self.assertEqual(template.fill('summary', values.get), '1.0 and <X>')
+        self.assertEqual(template.fill('description', values.get),
+                         'No slots')
+        self.assertIsNone(template.fill('environment', values.get))
+
+    def test_payload_fields(self):
+        """Test that payload can be changed without changing template."""
+        template = CompiledTemplate({'summary': 'S'}, self.pattern,
+                                    self.groups)
+        fields = template.payload_fields()
+        fields['summary'] = 'Changed'
+        self.assertEqual(template.fields, {'summary': 'S'})
+
+    @patch.object(compiled, 'MAX_COMPILED_TEMPLATES', 2)
+    def test_store(self):
+        """Test that least recently used templates are dropped."""
+        with patch.object(compiled, '_compiled', compiled.OrderedDict()):
+            store_compiled('A', 1)
+            store_compiled('B', 2)
+            get_compiled('A')
+            store_compiled('C', 3)
+            self.assertEqual(get_compiled('A'), 1)
+            self.assertIsNone(get_compiled('B'))
+            self.assertEqual(get_compiled('C'), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,194 @@
+import logging
+import unittest
+
+from mock import patch
+from ticketutil.ticket import TicketException
+
+from cloner import session
+from cloner.async_cloner import AsyncCloner
+from cloner.client import JiraClient
+from cloner.cloner import Cloner
+from cloner.existing import find_clones, origin_query
+from cloner.ticket import Ticket
+from cloner.utils import prepare_inject
+from fake_jira import FakeJira, make_issue
+
+
+class TestExisting(unittest.TestCase):
+    """Tests running against local stand-in JIRA server."""
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.jira = FakeJira(
+            issues=[
+                make_issue('RCMTEMPL-1', subtasks=['RCMTEMPL-2',
+                                                   'RCMTEMPL-3'],
+                           links=[('RCMTEMPL-4', 'Blocks', 'outwardIssue')]),
+                make_issue('RCMTEMPL-2', issuetype='Sub-task',
+                           parent='RCMTEMPL-1'),
+                make_issue('RCMTEMPL-3', issuetype='Sub-task',
+                           parent='RCMTEMPL-1'),
+                make_issue('RCMTEMPL-4'),
+            ],
+            remote_links={'RCMTEMPL-4': [{'object': {'url': 'http://doc'}}]})
+        self.jira.start()
+        self.patcher = patch('cloner.ticket.STAGE_URL', self.jira.url)
+        self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+        session.close_sessions()
+        self.jira.stop()
+
+    def clone(self, cloner_class=Cloner, pav='1.0', milestone=None,
+              **kwargs):
+        """Clone RCMTEMPL-1 with everything that belongs to it."""
+        fields = {'PAV': pav}
+        if milestone:
+            fields['milestone'] = milestone
+        inject = prepare_inject(fields)
+        cloner = cloner_class([Ticket(ticket_id='RCMTEMPL-1')], 'RCM',
+                              inject=inject, find_existing=True, **kwargs)
+        cloner.clone_tickets()
+        cloner.link_tickets()
+        return cloner._cloned
+
+    def test_origin_query(self):
+        """Test that origin comments are searched as phrases."""
+        self.assertEqual(
+            origin_query(['T-1', 'T-2']),
+            '(comment ~ "\\"This issue was cloned from T-1\\"" or '
+            'comment ~ "\\"This issue was cloned from T-2\\"")')
+
+    def test_find_clones(self):
+        """Test that clones are found with their links and the latest clone
+        of a template is used.
+        """
+        first = self.clone()
+        searches = self.jira.count('GET', '/search')
+        clones, linked = find_clones(['RCMTEMPL-1', 'RCMTEMPL-4', 'OTHER-1'],
+                                     'RCM', pav='1.0')
+        self.assertEqual(clones, {'RCMTEMPL-1': first['RCMTEMPL-1'],
+                                  'RCMTEMPL-4': first['RCMTEMPL-4']})
+        self.assertEqual(linked, {frozenset([first['RCMTEMPL-1'],
+                                             first['RCMTEMPL-4']])})
+        self.assertEqual(self.jira.count('GET', '/search'), searches + 1)
+        # comment with longer template ID doesn't match
+        self.jira.issues['RCM-9'] = make_issue('RCM-9', pav=['1.0'])
+        self.jira.issues['RCM-9']['fields']['comment'] = {'comments': [
+            {'body': 'This issue was cloned from RCMTEMPL-10'}]}
+        clones, _ = find_clones(['RCMTEMPL-1'], 'RCM', pav='1.0')
+        self.assertEqual(clones, {'RCMTEMPL-1': first['RCMTEMPL-1']})
+
+    def test_find_clones_failed_search(self):
+        """Test that failed search raises instead of missing clones."""
+        self.clone()
+        self.jira.fail(1, status=400, method='GET', path='/search$')
+        with self.assertRaises(TicketException):
+            find_clones(['RCMTEMPL-1', 'RCMTEMPL-4'], 'RCM', pav='1.0')
+
+    def assert_not_cloned_again(self, cloner_class=Cloner, **kwargs):
+        """Check that second run doesn't change anything."""
+        first = self.clone()
+        posts = self.jira.count('POST', '.')
+        remote_link_gets = self.jira.count('GET', '/remotelink')
+        again = self.clone(cloner_class, **kwargs)
+        self.assertEqual(again, first)
+        self.assertEqual(self.jira.count('POST', '.'), posts)
+        # remote links of finished clones are not needed
+        self.assertEqual(self.jira.count('GET', '/remotelink'),
+                         remote_link_gets)
+
+    def test_skip_existing(self):
+        """Test that repeated run doesn't create anything."""
+        self.assert_not_cloned_again()
+
+    def test_skip_existing_concurrently(self):
+        """Test that repeated concurrent run doesn't create anything."""
+        self.assert_not_cloned_again(workers=4)
+
+    def test_skip_existing_bulk(self):
+        """Test that repeated bulk run doesn't create anything."""
+        self.assert_not_cloned_again(bulk=True)
+
+    def test_skip_existing_async(self):
+        """Test that repeated asynchronous run doesn't create anything."""
+        client = JiraClient(self.jira.url, max_in_flight=4)
+        try:
+            self.assert_not_cloned_again(AsyncCloner, client=client)
+        finally:
+            client.close()
+
+    def assert_comment_after_remote_links(self, cloner_class=Cloner,
+                                          **kwargs):
+        """Check that clone whose remote links failed gets no origin
+        comment.
+        """
+        self.jira.fail(1, status=400, method='POST', path='/remotelink$')
+        cloned = self.clone(cloner_class, **kwargs)
+        self.assertEqual(len(cloned), 4)
+        self.assertNotIn(cloned['RCMTEMPL-4'], self.jira.comments)
+        self.assertIn(cloned['RCMTEMPL-1'], self.jira.comments)
+
+    def test_comment_after_remote_links(self):
+        """Test that clone with failed remote links is not finished."""
+        self.assert_comment_after_remote_links()
+
+    def test_comment_after_remote_links_concurrently(self):
+        """Test that clone with failed remote links is not finished in
+        concurrent run.
+        """
+        self.assert_comment_after_remote_links(workers=4)
+
+    def test_comment_after_remote_links_bulk(self):
+        """Test that clone with failed remote links is not finished in bulk
+        run.
+        """
+        self.assert_comment_after_remote_links(bulk=True)
+
+    def test_comment_after_remote_links_async(self):
+        """Test that clone with failed remote links is not finished in
+        asynchronous run.
+        """
+        client = JiraClient(self.jira.url, max_in_flight=4)
+        try:
+            self.assert_comment_after_remote_links(AsyncCloner, client=client)
+        finally:
+            client.close()
+
+    def test_create_missing(self):
+        """Test that only clones without origin comment are created."""
+        first = self.clone()
+        # clone of RCMTEMPL-3 was not finished
+        del self.jira.issues[first['RCMTEMPL-3']]['fields']['comment']
+        again = self.clone()
+        self.assertNotEqual(again['RCMTEMPL-3'], first['RCMTEMPL-3'])
+        del again['RCMTEMPL-3']
+        del first['RCMTEMPL-3']
+        self.assertEqual(again, first)
+        self.assertEqual(len(self.jira.created), 5)
+        parent = self.jira.issues[first['RCMTEMPL-1']]
+        self.assertEqual(parent['fields']['subtasks'][-1]['key'],
+                         self.jira.created[-1])
+
+    def test_other_pav(self):
+        """Test that clones with other PAV are not used."""
+        first = self.clone()
+        again = self.clone(pav='2.0')
+        self.assertEqual(len(self.jira.created), 8)
+        self.assertFalse(set(first.values()) & set(again.values()))
+
+    def test_other_milestone(self):
+        """Test that clones with the same PAV but other milestone are not
+        used.
+        """
+        first = self.clone(milestone='Alpha')
+        again = self.clone(milestone='Beta')
+        self.assertEqual(len(self.jira.created), 8)
+        self.assertFalse(set(first.values()) & set(again.values()))
+        self.assertEqual(self.clone(milestone='Beta'), again)
+        self.assertEqual(len(self.jira.created), 8)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+import logging
+import unittest
+
+from mock import patch
+
+from cloner import session
+from cloner.cloner import Cloner
+from cloner.fanout import Target, fan_out, parse_target, target_inject
+from cloner.ticket import Ticket
+from fake_jira import FakeJira, make_issue
+
+
+class TestTarget(unittest.TestCase):
+
+    def test_parse_target(self):
+        """Test that targets are parsed with optional parts."""
+        self.assertEqual(parse_target('rhel-8.0'),
+                         Target('rhel-8.0', None, None))
+        self.assertEqual(parse_target('rhel-8.0::Text: more'),
+                         Target('rhel-8.0', None, 'Text: more'))
+        self.assertEqual(parse_target(' rhel-8.0 : Beta '),
+                         Target('rhel-8.0', 'Beta', None))
+        self.assertRaises(ValueError, parse_target, ':Beta')
+
+    def test_target_inject(self):
+        """Test that PAV and milestone of target override inject."""
+        inject = {'labels': ['a'], 'customfield_11911': [{'value': 'X'}]}
+        self.assertEqual(
+            target_inject(inject, Target('1.0', 'GA', None)),
+            {'labels': ['a'], 'customfield_11911': [{'value': '1.0'}],
+             'customfield_12000': [{'value': 'GA'}]})
+        self.assertEqual(inject['customfield_11911'], [{'value': 'X'}])
+
+
+class TestFanOut(unittest.TestCase):
+    """Tests running against local stand-in JIRA server."""
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.jira = FakeJira(issues=[
+            make_issue('RCMTEMPL-1', summary='<PAV> <CUSTOM_TEXT>',
+                       subtasks=['RCMTEMPL-2'],
+                       links=[('RCMTEMPL-3', 'Blocks', 'outwardIssue')]),
+            make_issue('RCMTEMPL-2', summary='<PAV> subtask',
+                       issuetype='Sub-task', parent='RCMTEMPL-1'),
+            make_issue('RCMTEMPL-3'),
+        ])
+        self.jira.start()
+        self.patcher = patch('cloner.ticket.STAGE_URL', self.jira.url)
+        self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+        session.close_sessions()
+        self.jira.stop()
+
+    def test_fan_out(self):
+        """Test that every target gets its own clones and links while
+        templates are fetched once.
+        """
+        tickets = [Ticket(ticket_id='RCMTEMPL-1')]
+        del self.jira.requests[:]
+        targets = [Target('1.0', None, 'one'), Target('2.0', 'GA', 'two')]
+        cloners = fan_out(
+            tickets, targets,
+            lambda tickets, **kwargs: Cloner(tickets, 'RCM', **kwargs))
+        self.assertEqual(self.jira.count('GET', '/search'), 1)
+        self.assertEqual(self.jira.count('GET', '/RCMTEMPL-2/remotelink'), 1)
+        for target, cloner in zip(targets, cloners):
+            self.assertEqual(sorted(cloner._cloned),
+                             ['RCMTEMPL-1', 'RCMTEMPL-2', 'RCMTEMPL-3'])
+            parent = self.jira.issues[cloner._cloned['RCMTEMPL-1']]
+            self.assertEqual(parent['fields']['summary'],
+                             '{0} {1}'.format(target.pav,
+                                              target.custom_text))
+            self.assertEqual(parent['fields']['customfield_11911'],
+                             [{'value': target.pav}])
+            subtask = self.jira.issues[cloner._cloned['RCMTEMPL-2']]
+            self.assertEqual(subtask['fields']['parent']['key'],
+                             cloner._cloned['RCMTEMPL-1'])
+        self.assertEqual(len(self.jira.created), 6)
+        self.assertEqual(sorted(link['outwardIssue']['key']
+                                for link in self.jira.links),
+                         sorted(cloner._cloned['RCMTEMPL-3']
+                                for cloner in cloners))
+
+
+if __name__ == '__main__':
+    unittest.main()
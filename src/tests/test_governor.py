@@ -0,0 +1,163 @@
+import logging
+import threading
+import time
+import unittest
+
+import requests
+from mock import patch
+
+from cloner import session
+from cloner.governor import Governor, get_governor, configure_governors, \
+    is_idempotent, parse_retry_after
+from fake_jira import FakeJira, make_issue
+
+
+class TestGovernor(unittest.TestCase):
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+
+    def tearDown(self):
+        session.close_sessions()
+
+    def test_rate_limit(self):
+        """Test that requests are not sent faster than the rate."""
+        governor = Governor(rate=100, burst=1)
+        start = time.time()
+        for _ in range(11):
+            governor.release(governor.acquire())
+        self.assertGreaterEqual(time.time() - start, 0.09)
+
+    def test_concurrency_limit(self):
+        """Test that request waits for a free slot."""
+        governor = Governor(rate=None, concurrency=1)
+        started = governor.acquire()
+        acquired = threading.Event()
+
+        def other():
+            governor.release(governor.acquire())
+            acquired.set()
+        thread = threading.Thread(target=other)
+        thread.start()
+        self.assertFalse(acquired.wait(0.1))
+        governor.release(started)
+        thread.join()
+        self.assertTrue(acquired.is_set())
+
+    def test_aimd(self):
+        """Test that limit is halved once per round trip when throttled and
+        grows slowly when healthy.
+        """
+        governor = Governor(rate=None, concurrency=8)
+        started = [governor.acquire() for _ in range(4)]
+        for start in started:
+            governor.release(start, throttled=True)
+        self.assertEqual(governor.limit, 4)
+        for _ in range(4):
+            governor.release(governor.acquire())
+        self.assertEqual(int(governor.limit), 4)
+        self.assertGreater(governor.limit, 4.9)
+        for _ in range(100):
+            governor.release(governor.acquire())
+        self.assertGreater(governor.limit, 8)
+
+    @patch('cloner.governor.SPIKE_MIN_LATENCY', 0)
+    def test_latency_spike(self):
+        """Test that slow response decreases the limit."""
+        governor = Governor(rate=None, concurrency=8)
+        governor.latency = 0.001
+        started = governor.acquire()
+        time.sleep(0.01)
+        governor.release(started)
+        self.assertEqual(governor.limit, 4)
+
+    def test_pause(self):
+        """Test that no request is sent during pause."""
+        governor = Governor(rate=None)
+        governor.pause(0.1)
+        start = time.time()
+        governor.release(governor.acquire())
+        self.assertGreaterEqual(time.time() - start, 0.09)
+
+    def test_parse_retry_after(self):
+        """Test that seconds and dates are accepted and limited."""
+        self.assertEqual(parse_retry_after('5'), 5)
+        self.assertEqual(parse_retry_after('100000'), 120)
+        self.assertIsNone(parse_retry_after('soon'))
+        self.assertIsNone(parse_retry_after(None))
+        date = time.strftime('%a, %d %b %Y %H:%M:%S GMT',
+                             time.gmtime(time.time() + 30))
+        self.assertAlmostEqual(parse_retry_after(date), 30, delta=2)
+
+    def test_is_idempotent(self):
+        """Test that only requests safe to send again are idempotent."""
+        def request(method, path, payload=None):
+            return requests.Request(method, 'http://jira' + path,
+                                    json=payload).prepare()
+        self.assertTrue(is_idempotent(request('GET', '/rest/api/2/issue/A')))
+        self.assertFalse(is_idempotent(request('POST', '/rest/api/2/issue')))
+        self.assertFalse(is_idempotent(request(
+            'GET', '/secure/MoveIssueLink.jspa?id=1&subTaskSequence=0')))
+        self.assertTrue(is_idempotent(request(
+            'PUT', '/rest/api/2/issue/A',
+            {'fields': {'summary': 'S'},
+             'update': {'labels': [{'set': ['a']}]}})))
+        self.assertFalse(is_idempotent(request(
+            'PUT', '/rest/api/2/issue/A',
+            {'update': {'customfield_11911': [{'add': {'value': '1.0'}}]}})))
+
+    def test_governor_per_server(self):
+        """Test that governor is shared by all URLs of a server and
+        configured limits apply to existing and new governors.
+        """
+        governor = get_governor('http://jira/rest/api/2/issue')
+        self.assertIs(governor, get_governor('http://jira/step-auth-gss'))
+        self.assertIsNot(governor, get_governor('http://other/'))
+        configure_governors(rate=None)
+        self.assertIsNone(governor.rate)
+        self.assertIsNone(get_governor('http://new/').rate)
+
+
+class TestGovernedSession(unittest.TestCase):
+    """Tests running against local stand-in JIRA server."""
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.jira = FakeJira(issues=[make_issue('RCMTEMPL-1')])
+        self.jira.start()
+        self.s = session.get_session(self.jira.url,
+                                     self.jira.url + '/step-auth-gss')
+        self.issue_url = self.jira.url + '/rest/api/2/issue'
+
+    def tearDown(self):
+        session.close_sessions()
+        self.jira.stop()
+
+    def test_throttled_read(self):
+        """Test that throttled request is sent again."""
+        self.jira.throttle(2)
+        r = self.s.get(self.issue_url + '/RCMTEMPL-1')
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(self.jira.count('GET', 'RCMTEMPL-1'), 3)
+
+    def test_throttled_write(self):
+        """Test that write refused with 429 is sent again and done once."""
+        self.jira.throttle(1)
+        r = self.s.post(self.issue_url,
+                        json={'fields': {'project': {'key': 'RCM'}}})
+        self.assertEqual(r.status_code, 201)
+        self.assertEqual(self.jira.created, ['RCM-1'])
+
+    def test_unavailable_write(self):
+        """Test that write refused with 503 without Retry-After is not sent
+        again, as it may have been processed.
+        """
+        self.jira.throttle(1, status=503, retry_after=None)
+        r = self.s.post(self.issue_url,
+                        json={'fields': {'project': {'key': 'RCM'}}})
+        self.assertEqual(r.status_code, 503)
+        self.assertEqual(self.jira.count('POST', '/issue$'), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,221 @@
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+
+from mock import patch
+
+from cloner import session
+from cloner.async_cloner import AsyncCloner
+from cloner.client import JiraClient
+from cloner.cloner import Cloner
+from cloner.journal import Journal
+from cloner.ticket import Ticket
+from fake_jira import FakeJira, make_issue
+
+
+class TestJournal(unittest.TestCase):
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'journal')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_replay(self):
+        """Test that recorded operations are loaded on resume."""
+        journal = Journal(self.path)
+        journal.record('create', template='T-1', clone='C-1')
+        journal.record('comment', template='T-1')
+        journal.record('link', clones=['C-1', 'C-2'])
+        journal.close()
+        with open(self.path, 'a') as f:
+            f.write('{"op": "create", "templ')
+        journal = Journal(self.path, resume=True)
+        self.assertEqual(journal.cloned, {'T-1': 'C-1'})
+        self.assertTrue(journal.is_done('comment', 'T-1'))
+        self.assertFalse(journal.is_done('remote_links', 'T-1'))
+        self.assertEqual(journal.linked, {frozenset(['C-1', 'C-2'])})
+        journal.close()
+
+    def test_torn_line_repaired(self):
+        """Test that records appended on resume are not glued to a line cut
+        off by the died run.
+        """
+        journal = Journal(self.path)
+        journal.record('create', template='T-1', clone='C-1')
+        journal.close()
+        with open(self.path, 'a') as f:
+            f.write('{"op": "create", "templ')
+        journal = Journal(self.path, resume=True)
+        journal.record('create', template='T-2', clone='C-2')
+        journal.close()
+        journal = Journal(self.path, resume=True)
+        self.assertEqual(journal.cloned, {'T-1': 'C-1', 'T-2': 'C-2'})
+        journal.close()
+        # complete record only lacking newline is kept
+        with open(self.path, 'a') as f:
+            f.write('{"op": "comment", "template": "T-1"}')
+        journal = Journal(self.path, resume=True)
+        journal.record('comment', template='T-2')
+        journal.close()
+        with open(self.path) as f:
+            self.assertEqual(len(f.readlines()), 4)
+        journal = Journal(self.path, resume=True)
+        self.assertTrue(journal.is_done('comment', 'T-1'))
+        self.assertTrue(journal.is_done('comment', 'T-2'))
+        journal.close()
+
+    def test_truncate(self):
+        """Test that journal is started again without resume."""
+        journal = Journal(self.path)
+        journal.record('create', template='T-1', clone='C-1')
+        journal.close()
+        journal = Journal(self.path)
+        self.assertEqual(journal.cloned, {})
+        journal.close()
+        self.assertEqual(os.path.getsize(self.path), 0)
+
+
+class TestResume(unittest.TestCase):
+    """Tests running against local stand-in JIRA server."""
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.jira = FakeJira(
+            issues=[
+                make_issue('RCMTEMPL-1', subtasks=['RCMTEMPL-2',
+                                                   'RCMTEMPL-3'],
+                           links=[('RCMTEMPL-4', 'Blocks', 'outwardIssue')]),
+                make_issue('RCMTEMPL-2', issuetype='Sub-task',
+                           parent='RCMTEMPL-1'),
+                make_issue('RCMTEMPL-3', issuetype='Sub-task',
+                           parent='RCMTEMPL-1'),
+                make_issue('RCMTEMPL-4'),
+            ],
+            remote_links={'RCMTEMPL-4': [{'object': {'url': 'http://doc'}}]})
+        self.jira.start()
+        self.patcher = patch('cloner.ticket.STAGE_URL', self.jira.url)
+        self.patcher.start()
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'journal')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        self.patcher.stop()
+        session.close_sessions()
+        self.jira.stop()
+
+    def interrupted_run(self):
+        """Clone tickets until comment of the third ticket is to be added,
+        then stop as if the run died.
+        """
+        original = Cloner._add_origin_comment
+        commented = []
+
+        def add_origin_comment(cloner, ticket):
+            if len(commented) == 2:
+                raise Crash()
+            original(cloner, ticket)
+            commented.append(ticket.ticket_id)
+
+        journal = Journal(self.path)
+        cloner = Cloner([Ticket(ticket_id='RCMTEMPL-1')], 'RCM',
+                        journal=journal)
+        with patch.object(Cloner, '_add_origin_comment', add_origin_comment):
+            self.assertRaises(Crash, cloner.clone_tickets)
+        journal.close()
+        self.assertEqual(len(self.jira.created), 3)
+        return cloner._cloned
+
+    def resume(self, cloner_class=Cloner, **kwargs):
+        """Resume the interrupted run with new cloner."""
+        journal = Journal(self.path, resume=True)
+        cloner = cloner_class([Ticket(ticket_id='RCMTEMPL-1')], 'RCM',
+                              journal=journal, **kwargs)
+        cloner.clone_tickets()
+        cloner.link_tickets()
+        journal.close()
+        return cloner._cloned
+
+    def assert_resumed(self, first, resumed):
+        """Check that every ticket was cloned and set up exactly once."""
+        self.assertEqual(len(self.jira.created), 4)
+        for template, clone in first.items():
+            self.assertEqual(resumed[template], clone)
+        for clone in resumed.values():
+            self.assertEqual(len(self.jira.comments[clone]), 1)
+        self.assertEqual(len(self.jira.remote_links[resumed['RCMTEMPL-4']]),
+                         1)
+        parent = self.jira.issues[resumed['RCMTEMPL-1']]
+        self.assertEqual([s['key'] for s in parent['fields']['subtasks']],
+                         [resumed['RCMTEMPL-2'], resumed['RCMTEMPL-3']])
+        self.assertEqual(len(self.jira.links), 1)
+
+    def test_resume(self):
+        """Test that resumed run continues only outstanding work."""
+        first = self.interrupted_run()
+        self.assert_resumed(first, self.resume())
+        # resuming finished run doesn't change anything
+        posts = self.jira.count('POST', '.')
+        self.resume()
+        self.assertEqual(self.jira.count('POST', '.'), posts)
+
+    def test_resume_concurrently(self):
+        """Test that concurrent cloning continues only outstanding work."""
+        first = self.interrupted_run()
+        self.assert_resumed(first, self.resume(workers=4))
+
+    def test_resume_bulk(self):
+        """Test that bulk cloning continues only outstanding work."""
+        first = self.interrupted_run()
+        self.assert_resumed(first, self.resume(bulk=True))
+
+    def test_resume_async(self):
+        """Test that asynchronous cloning continues only outstanding work."""
+        first = self.interrupted_run()
+        client = JiraClient(self.jira.url, max_in_flight=4)
+        try:
+            self.assert_resumed(first, self.resume(AsyncCloner,
+                                                   client=client))
+        finally:
+            client.close()
+
+    def assert_failed_comment_resumed(self, **kwargs):
+        """Check that failed comment is not journaled and is added by
+        resumed run.
+        """
+        self.jira.fail(1, status=400, method='POST', path='/comment$')
+        journal = Journal(self.path)
+        cloner = Cloner([Ticket(ticket_id='RCMTEMPL-1')], 'RCM',
+                        journal=journal, **kwargs)
+        cloner.clone_tickets()
+        journal.close()
+        self.assertEqual(len(cloner._failed), 1)
+        failed = list(cloner._failed)[0]
+        journal = Journal(self.path, resume=True)
+        self.assertFalse(journal.is_done('comment', failed))
+        journal.close()
+        self.assertNotIn(cloner._cloned[failed], self.jira.comments)
+        self.assert_resumed(cloner._cloned, self.resume(**kwargs))
+
+    def test_failed_comment(self):
+        """Test that failed comment is reported and done by resumed run."""
+        self.assert_failed_comment_resumed()
+
+    def test_failed_comment_concurrently(self):
+        """Test that failed comment task is reported and done by resumed
+        run.
+        """
+        self.assert_failed_comment_resumed(workers=4)
+
+
+class Crash(Exception):
+    """Exception simulating interrupted run."""
+
+
+if __name__ == '__main__':
+    unittest.main()
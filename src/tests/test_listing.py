@@ -0,0 +1,113 @@
+import csv
+import json
+import logging
+import unittest
+
+from StringIO import StringIO
+
+from mock import MagicMock, patch
+
+from cloner import session
+from cloner.jira_clone_template_rcm import search_tickets
+from cloner.listing import field_text, ticket_row, write_listing
+from fake_jira import FakeJira, make_issue
+
+ISSUE = {
+    'key': 'RCMTEMPL-1',
+    'fields': {
+        'summary': u'Summary \u2013 dash',
+        'customfield_11911': [{'value': '1.0'}, {'value': '2.0'}],
+        'labels': ['a', 'b'],
+        'status': {'name': 'Open'},
+    }
+}
+
+
+class TestListing(unittest.TestCase):
+
+    def test_ticket_row(self):
+        """Test that row has base columns and additional fields."""
+        row = ticket_row(ISSUE, fields=['status', 'summary'])
+        self.assertEqual(list(row), ['key', 'summary', 'pav', 'labels',
+                                     'status'])
+        self.assertEqual(row['pav'], ['1.0', '2.0'])
+        self.assertEqual(row['status'], {'name': 'Open'})
+
+    def test_field_text(self):
+        """Test that values are converted to plain text."""
+        self.assertEqual(field_text(None), '')
+        self.assertEqual(field_text([{'value': '1.0'}, {'name': 'x'}]),
+                         '1.0, x')
+        self.assertEqual(field_text({'id': 1}), '{"id": 1}')
+        self.assertEqual(field_text(3), '3')
+
+    def test_ndjson(self):
+        """Test that one JSON object is written per ticket."""
+        out = StringIO()
+        self.assertEqual(write_listing([ISSUE, ISSUE], out, 'ndjson',
+                                       fields=['status']), 2)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(json.loads(lines[0]),
+                         {'key': 'RCMTEMPL-1', 'summary': ISSUE['fields'][
+                             'summary'], 'pav': ['1.0', '2.0'],
+                          'labels': ['a', 'b'], 'status': {'name': 'Open'}})
+
+    def test_csv(self):
+        """Test that CSV has header and flattened values."""
+        out = StringIO()
+        write_listing([ISSUE], out, 'csv', fields=['status'])
+        rows = list(csv.reader(StringIO(out.getvalue())))
+        self.assertEqual(rows, [
+            ['key', 'summary', 'pav', 'labels', 'status'],
+            ['RCMTEMPL-1', ISSUE['fields']['summary'].encode('utf-8'),
+             '1.0, 2.0', 'a, b', 'Open']])
+        out = StringIO()
+        self.assertEqual(write_listing([], out, 'csv'), 0)
+        self.assertEqual(out.getvalue().strip(), 'key,summary,pav,labels')
+
+    def test_text(self):
+        """Test that text is logged."""
+        log = MagicMock()
+        write_listing([ISSUE], None, fields=['status'], log=log)
+        self.assertEqual([c[0][0] for c in log.info.call_args_list], [
+            u'Ticket: RCMTEMPL-1 - Summary \u2013 dash',
+            'PAV: 1.0, 2.0, Labels: a, b',
+            'status: Open'])
+
+
+class TestSearchTickets(unittest.TestCase):
+    """Tests running against local stand-in JIRA server."""
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.jira = FakeJira(issues=[
+            make_issue('RCMTEMPL-{0}'.format(i), pav=['1.0'])
+            for i in range(1, 31)])
+        self.jira.start()
+        self.patcher = patch('cloner.ticket.STAGE_URL', self.jira.url)
+        self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+        session.close_sessions()
+        self.jira.stop()
+
+    def test_search_tickets(self):
+        """Test that tickets are listed from search results only."""
+        out = StringIO()
+        log = MagicMock()
+        search_tickets(log, '1.0', None, fields=['status'],
+                       output_format='ndjson', out=out)
+        rows = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual(sorted(row['key'] for row in rows), sorted(
+            'RCMTEMPL-{0}'.format(i) for i in range(1, 31)))
+        self.assertEqual(rows[0]['status'], {'name': 'Open'})
+        self.assertNotIn('description', rows[0])
+        self.assertEqual(self.jira.count('GET', '/search'), 1)
+        self.assertEqual(self.jira.count('GET', '/issue/'), 0)
+        log.info.assert_called_with('Nr. of tickets found: 30')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import logging
+import unittest
+
+from mock import patch
+from ticketutil.ticket import TicketException
+
+from cloner import session
+from cloner.pav_update import append_pav_to_tickets
+from fake_jira import FakeJira, make_issue
+
+
+class TestPavUpdate(unittest.TestCase):
+    """Tests running against local stand-in JIRA server."""
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.jira = FakeJira(issues=[
+            make_issue('RCMTEMPL-{0}'.format(i), pav=['1.0'])
+            for i in range(1, 21)] + [
+            make_issue('RCMTEMPL-21', pav=['1.0', '2.0']),
+            make_issue('RCMTEMPL-22', pav=['3.0'])])
+        self.jira.start()
+        self.patcher = patch('cloner.ticket.STAGE_URL', self.jira.url)
+        self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+        session.close_sessions()
+        self.jira.stop()
+
+    def pavs(self, key):
+        return [v['value'] for v in
+                self.jira.issues[key]['fields']['customfield_11911']]
+
+    def test_append_pav(self):
+        """Test that PAV is appended without fetching content of tickets
+        and tickets that already have it are not updated.
+        """
+        failed = append_pav_to_tickets('1.0', '2.0')
+        self.assertEqual(failed, {})
+        for i in range(1, 22):
+            self.assertEqual(self.pavs('RCMTEMPL-{0}'.format(i)),
+                             ['1.0', '2.0'])
+        self.assertEqual(self.pavs('RCMTEMPL-22'), ['3.0'])
+        self.assertEqual(self.jira.count('PUT', '/issue/'), 20)
+        self.assertEqual(self.jira.count('GET', '/issue/'), 0)
+        # running again doesn't update anything
+        append_pav_to_tickets('1.0', '2.0')
+        self.assertEqual(self.jira.count('PUT', '/issue/'), 20)
+
+    def test_append_pav_failures(self):
+        """Test that failed tickets are reported and others updated."""
+        self.jira.fail(1, status=400, method='PUT')
+        failed = append_pav_to_tickets('1.0', '2.0', workers=1)
+        self.assertEqual(list(failed), ['RCMTEMPL-1'])
+        self.assertIn('Failed', failed['RCMTEMPL-1'])
+        self.assertEqual(self.jira.count('PUT', '/issue/'), 20)
+
+    def test_failed_search(self):
+        """Test that failed search is raised instead of being taken as no
+        matching tickets.
+        """
+        self.jira.fail(1, status=400, method='GET', path='/search$')
+        with self.assertRaises(TicketException):
+            append_pav_to_tickets('1.0', '2.0')
+        self.assertEqual(self.jira.count('PUT', '.'), 0)
+
+    def test_dry_run(self):
+        """Test that nothing is updated in dry run."""
+        append_pav_to_tickets('1.0', '2.0', dry_run=True)
+        self.assertEqual(self.jira.count('PUT', '.'), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,152 @@
+import json
+import logging
+import unittest
+
+from mock import patch
+from StringIO import StringIO
+
+from cloner import session
+from cloner.cloner import Cloner
+from cloner.jira_clone_template_rcm import clone_tickets
+from cloner.planner import Planner, estimate_seconds
+from cloner.ticket import Ticket
+from fake_jira import FakeJira, make_issue
+
+
+def operation(id, depends_on=(), requests=1, phase='clone', after=()):
+    return {'id': id, 'depends_on': list(depends_on), 'requests': requests,
+            'phase': phase, 'after': list(after)}
+
+
+class TestEstimate(unittest.TestCase):
+
+    def test_estimate_seconds(self):
+        """Test that dependencies, ordering, slots and phases are respected."""
+        operations = [operation(1), operation(2, [1]), operation(3, [1]),
+                      operation(4, [1], requests=2)]
+        self.assertEqual(estimate_seconds(operations, latency=1), 5)
+        self.assertEqual(estimate_seconds(operations, concurrency=4,
+                                          latency=1), 3)
+        operations.append(operation(5, phase='link'))
+        self.assertEqual(estimate_seconds(operations, concurrency=4,
+                                          latency=1), 4)
+        self.assertEqual(estimate_seconds(
+            [operation(1, requests=2), operation(2, after=[1])],
+            concurrency=2, latency=1), 3)
+        self.assertEqual(estimate_seconds([]), 0)
+
+
+class TestPlanner(unittest.TestCase):
+    """Tests running against local stand-in JIRA server."""
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.jira = FakeJira(issues=[
+            make_issue('RCMTEMPL-1', subtasks=['RCMTEMPL-2', 'RCMTEMPL-3'],
+                       links=[('RCMTEMPL-4', 'Blocks', 'outwardIssue')]),
+            make_issue('RCMTEMPL-2', issuetype='Sub-task',
+                       parent='RCMTEMPL-1'),
+            make_issue('RCMTEMPL-3', issuetype='Sub-task',
+                       parent='RCMTEMPL-1'),
+            make_issue('RCMTEMPL-4',
+                       links=[('RCMTEMPL-1', 'Blocks', 'inwardIssue')])],
+            remote_links={'RCMTEMPL-4': [{'object': {'url': 'http://doc',
+                                                     'title': 'Doc'}}]})
+        self.jira.start()
+        self.patcher = patch('cloner.ticket.STAGE_URL', self.jira.url)
+        self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+        session.close_sessions()
+        self.jira.stop()
+
+    def test_plan(self):
+        """Test that plan has all operations with unique placeholders and
+        counts requests of the prefetch.
+        """
+        cloner = Cloner([Ticket(ticket_id='RCMTEMPL-1')], 'RCM')
+        sent = len(self.jira.requests)
+        plan = Planner(cloner, concurrency=2).plan_tickets().to_dict()
+        self.assertEqual(self.jira.created, [])
+        operations = plan['operations']
+        creates = dict((op['template'], op) for op in operations
+                       if op['op'] == 'create')
+        self.assertEqual(len(set(op['clone'] for op in creates.values())), 4)
+        self.assertEqual(creates['RCMTEMPL-2']['parent'],
+                         creates['RCMTEMPL-1']['clone'])
+        self.assertEqual(creates['RCMTEMPL-3']['depends_on'],
+                         [creates['RCMTEMPL-1']['id']])
+        self.assertEqual(creates['RCMTEMPL-3']['after'],
+                         [creates['RCMTEMPL-2']['id']])
+        links = [op for op in operations if op['op'] == 'link']
+        self.assertEqual(len(links), 1)
+        self.assertEqual(links[0]['phase'], 'link')
+        self.assertEqual(sorted(links[0]['clones']),
+                         sorted([creates['RCMTEMPL-1']['clone'],
+                                 creates['RCMTEMPL-4']['clone']]))
+        requests = plan['requests']
+        self.assertEqual(requests['create'], 4)
+        self.assertEqual(requests['comment'], 4)
+        self.assertEqual(requests['remote link'], 1)
+        self.assertEqual(requests['remote link read'], 4)
+        self.assertEqual(requests['user'], 1)
+        self.assertEqual(sum(requests[op] for op in
+                             ('content', 'search', 'remote link read')),
+                         len(self.jira.requests) - sent)
+        self.assertEqual(plan['total_requests'], sum(requests.values()))
+        self.assertGreater(plan['estimated_seconds'], 0)
+
+    def test_plan_matches_run(self):
+        """Test that planned creating requests are those sent by the run."""
+        out = StringIO()
+        clone_tickets(['RCMTEMPL-1'], 'RCM', {}, plan=out)
+        plan = json.loads(out.getvalue())
+        self.assertEqual(self.jira.created, [])
+        # requested template and its references are fetched with searches
+        self.assertEqual(plan['requests']['search'], 2)
+        with patch('cloner.jira_clone_template_rcm.count_requests') as count:
+            clone_tickets(['RCMTEMPL-1'], 'RCM', {})
+        # requests are counted only for plan
+        count.assert_not_called()
+        self.assertEqual(plan['requests']['create'], len(self.jira.created))
+        self.assertEqual(plan['requests']['link'], len(self.jira.links))
+        self.assertEqual(plan['requests']['remote link'],
+                         self.jira.count('POST', r'/remotelink$'))
+        self.assertEqual(plan['requests']['comment'],
+                         self.jira.count('POST', r'/comment$'))
+        self.assertEqual(plan['requests']['user'],
+                         self.jira.count('GET', r'/rest/auth/1/session$'))
+
+    def test_plan_bulk(self):
+        """Test that tasks and subtasks are created in two waves."""
+        cloner = Cloner([Ticket(ticket_id='RCMTEMPL-1')], 'RCM', bulk=True)
+        operations = Planner(cloner).plan_tickets().operations
+        creates = [op for op in operations if op['op'] == 'bulk create']
+        self.assertEqual([op['templates'] for op in creates],
+                         [['RCMTEMPL-1', 'RCMTEMPL-4'],
+                          ['RCMTEMPL-2', 'RCMTEMPL-3']])
+        self.assertEqual(creates[1]['depends_on'], [creates[0]['id']])
+
+    def test_plan_subtask(self):
+        """Test that subtask is created and moved in existing parent."""
+        planner = Planner(Cloner([], 'RCM')).plan_subtask(
+            Ticket(ticket_id='RCMTEMPL-2'), 'RCM-1', position=0)
+        self.assertEqual([op['op'] for op in planner.operations],
+                         ['content', 'create', 'content', 'subtask move'])
+        self.assertEqual(planner.operations[1]['parent'], 'RCM-1')
+
+    def test_dry_run_placeholders(self):
+        """Test that dry run assigns unique IDs to clones."""
+        cloner = Cloner([Ticket(ticket_id='RCMTEMPL-1')], 'RCM',
+                        dry_run=True)
+        cloner.clone_tickets()
+        cloner.link_tickets()
+        self.assertEqual(len(set(cloner._cloned.values())), 4)
+        self.assertEqual(cloner._cloned['RCMTEMPL-1'], 'RCM-NEW-1')
+        self.assertEqual(self.jira.created, [])
+        self.assertEqual(self.jira.links, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import logging
+import unittest
+
+from mock import patch
+
+from cloner import session
+from cloner.cloner import Cloner
+from cloner.resolver import fetch_tickets, resolve_closure, referenced_ids
+from cloner.ticket import Ticket
+from fake_jira import FakeJira, make_issue
+
+
+class TestResolver(unittest.TestCase):
+    """Tests running against local stand-in JIRA server."""
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.jira = FakeJira(issues=[
+            make_issue('RCMTEMPL-1', subtasks=['RCMTEMPL-2', 'RCMTEMPL-3'],
+                       links=[('RCMTEMPL-4', 'Blocks', 'outwardIssue')]),
+            make_issue('RCMTEMPL-2', issuetype='Sub-task',
+                       parent='RCMTEMPL-1'),
+            make_issue('RCMTEMPL-3', issuetype='Sub-task',
+                       parent='RCMTEMPL-1'),
+            make_issue('RCMTEMPL-4',
+                       links=[('RCMTEMPL-5', 'Blocks', 'inwardIssue'),
+                              ('RCMTEMPL-1', 'Blocks', 'inwardIssue')]),
+            make_issue('RCMTEMPL-5', status='Deprecated',
+                       links=[('RCMTEMPL-6', 'Blocks', 'inwardIssue')]),
+            make_issue('RCMTEMPL-6'),
+        ])
+        self.jira.start()
+        self.patcher = patch('cloner.ticket.STAGE_URL', self.jira.url)
+        self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+        session.close_sessions()
+        self.jira.stop()
+
+    def test_resolve_closure(self):
+        """Test that templates are fetched level by level with searches."""
+        templates = resolve_closure([Ticket(ticket_id='RCMTEMPL-1')])
+        self.assertEqual(sorted(templates), ['RCMTEMPL-1', 'RCMTEMPL-2',
+                                             'RCMTEMPL-3', 'RCMTEMPL-4',
+                                             'RCMTEMPL-5'])
+        # one search per level, deprecated ticket is not followed
+        self.assertEqual(self.jira.count('GET', '/search'), 2)
+        self.assertEqual(self.jira.count('GET', '/issue/RCMTEMPL-[2-6]$'), 0)
+
+    def test_fetch_tickets_missing_key(self):
+        """Test that missing key doesn't prevent fetching the other ones."""
+        tickets = fetch_tickets(['RCMTEMPL-1', 'RCMTEMPL-2', 'RCMTEMPL-3',
+                                 'RCMTEMPL-4', 'RCMTEMPL-9'])
+        self.assertEqual(sorted(tickets), ['RCMTEMPL-1', 'RCMTEMPL-2',
+                                           'RCMTEMPL-3', 'RCMTEMPL-4'])
+        # failed search is split in halves until the missing key is found
+        self.assertEqual(self.jira.count('GET', '/search'), 7)
+        self.assertEqual(self.jira.count('GET', '/issue/RCMTEMPL-'), 0)
+
+    def test_referenced_ids(self):
+        """Test that parents, subtasks and links are referenced."""
+        self.assertEqual(referenced_ids(Ticket(ticket_id='RCMTEMPL-1')),
+                         ['RCMTEMPL-2', 'RCMTEMPL-3', 'RCMTEMPL-4'])
+        self.assertEqual(referenced_ids(Ticket(ticket_id='RCMTEMPL-2')),
+                         ['RCMTEMPL-1'])
+
+    def test_cloner_uses_resolved_templates(self):
+        """Test that Cloner doesn't fetch templates one by one."""
+        cloner = Cloner([Ticket(ticket_id='RCMTEMPL-4')], 'RCM',
+                        dry_run=True)
+        cloner.clone_tickets()
+        self.assertEqual(sorted(cloner._cloned), ['RCMTEMPL-1', 'RCMTEMPL-2',
+                                                  'RCMTEMPL-3', 'RCMTEMPL-4'])
+        # only the passed template is requested on its own
+        self.assertEqual(self.jira.count('GET', '/issue/RCMTEMPL-[1-6]$'), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
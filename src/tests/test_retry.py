@@ -0,0 +1,165 @@
+import copy
+import logging
+import unittest
+
+import requests
+
+from mock import patch
+
+from cloner import session
+from cloner.retry import RetryPolicy, configure_retries, error_detail, \
+    was_not_sent
+from cloner.ticket import Ticket
+from fake_jira import FakeJira, make_issue
+
+
+class TestRetryPolicy(unittest.TestCase):
+
+    def test_delay(self):
+        """Test that delay is random and grows up to the cap."""
+        policy = RetryPolicy(backoff=1, cap=5)
+        for attempt, limit in ((1, 1), (2, 2), (3, 4), (4, 5), (10, 5)):
+            for _ in range(20):
+                self.assertTrue(0 <= policy.delay(attempt) <= limit)
+        self.assertNotEqual(len(set(policy.delay(3) for _ in range(20))), 1)
+
+    def test_was_not_sent(self):
+        """Test that refused connection is recognized."""
+        try:
+            requests.get('http://127.0.0.1:1/')
+        except requests.ConnectionError as e:
+            self.assertTrue(was_not_sent(e))
+        self.assertFalse(was_not_sent(requests.ReadTimeout()))
+
+    def test_error_detail(self):
+        """Test that JIRA's error message is preferred."""
+        response = requests.Response()
+        response.status_code = 400
+        response._content = '{"errorMessages": [], "errors": {"f": "bad"}}'
+        self.assertEqual(error_detail(requests.HTTPError(response=response)),
+                         'bad')
+        self.assertEqual(error_detail(requests.ConnectionError('refused')),
+                         'refused')
+
+
+class TestRetries(unittest.TestCase):
+    """Tests running against local stand-in JIRA server."""
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.jira = FakeJira(
+            issues=[make_issue('RCMTEMPL-1'), make_issue('RCM-100'),
+                    make_issue('RCM-101')],
+            remote_links={'RCMTEMPL-1': [{'object': {'url': 'http://doc'}}]})
+        self.jira.start()
+        self.patcher = patch('cloner.ticket.STAGE_URL', self.jira.url)
+        self.patcher.start()
+        configure_retries(timeout=(1, 0.3), retries=2, backoff=0.01)
+
+    def tearDown(self):
+        configure_retries()
+        self.patcher.stop()
+        session.close_sessions()
+        self.jira.stop()
+
+    def test_read_retried(self):
+        """Test that reads are repeated after server errors and timeouts."""
+        ticket = Ticket(ticket_id='RCMTEMPL-1')
+        requested = self.jira.count('GET', '/issue/RCMTEMPL-1$')
+        self.jira.fail(1)
+        self.jira.delay(1, 1)
+        self.assertEqual(ticket._get_content()['key'], 'RCMTEMPL-1')
+        self.assertEqual(self.jira.count('GET', '/issue/RCMTEMPL-1$'),
+                         requested + 3)
+
+    def test_read_retries_exhausted(self):
+        """Test that failure is reported when all attempts fail."""
+        ticket = Ticket(ticket_id='RCMTEMPL-1')
+        self.jira.fail(3)
+        self.assertIsNone(ticket.remote_links)
+        self.assertEqual(self.jira.count('GET', '/remotelink'), 3)
+
+    def test_update_add_not_retried(self):
+        """Test that PUT adding a value is not sent again after failure."""
+        ticket = Ticket(ticket_id='RCM-100')
+        self.jira.fail(1, method='PUT')
+        self.assertEqual(ticket.add_pav('1.0').status, 'Failure')
+        self.assertEqual(self.jira.count('PUT', '/issue/RCM-100$'), 1)
+
+    def test_write_not_processed(self):
+        """Test that failed write is repeated if it didn't create ticket."""
+        ticket = Ticket(project='RCM')
+        self.jira.fail(1, method='POST')
+        ticket.create_from_json({'fields': {'project': {'key': 'RCM'},
+                                            'summary': 'Summary',
+                                            'description': 'Description',
+                                            'issuetype': {'name': 'Task'}}})
+        self.assertEqual(self.jira.created, ['RCM-1'])
+        self.assertEqual(ticket.ticket_id, 'RCM-1')
+
+    def test_write_response_lost(self):
+        """Test that ticket created by write with lost response is found
+        instead of creating duplicate.
+        """
+        ticket = Ticket(project='RCM')
+        self.jira.fail(1, processed=True, method='POST')
+        ticket.create_from_json({'fields': {'project': {'key': 'RCM'},
+                                            'summary': 'Summary',
+                                            'description': 'Description',
+                                            'issuetype': {'name': 'Task'}}})
+        self.assertEqual(self.jira.created, ['RCM-1'])
+        self.assertEqual(ticket.ticket_id, 'RCM-1')
+
+    def test_write_response_lost_other_pav(self):
+        """Test that recent ticket with the same summary but other PAV is not
+        taken as the one created by write with lost response.
+        """
+        payload = {'fields': {'project': {'key': 'RCM'},
+                              'summary': 'Summary',
+                              'description': 'Description',
+                              'issuetype': {'name': 'Task'},
+                              'customfield_11911': [{'value': '1.0'}]}}
+        Ticket(project='RCM').create_from_json(copy.deepcopy(payload))
+        payload['fields']['customfield_11911'] = [{'value': '2.0'}]
+        ticket = Ticket(project='RCM')
+        self.jira.fail(1, processed=True, method='POST')
+        ticket.create_from_json(payload)
+        self.assertEqual(self.jira.created, ['RCM-1', 'RCM-2'])
+        self.assertEqual(ticket.ticket_id, 'RCM-2')
+
+    def test_write_timed_out(self):
+        """Test that comment added by timed out request is not added
+        again.
+        """
+        ticket = Ticket(ticket_id='RCM-100')
+        self.jira.delay(1, 0.5, method='POST')
+        result = ticket.add_comment('This issue was cloned from RCMTEMPL-1')
+        self.assertEqual(result.status, 'Success')
+        self.assertEqual(len(self.jira.comments['RCM-100']), 1)
+
+    def test_links_response_lost(self):
+        """Test that links created by requests with lost response are not
+        created again.
+        """
+        ticket = Ticket(ticket_id='RCM-100')
+        self.jira.fail(1, processed=True, method='POST')
+        self.assertIsNone(ticket.create_link(('RCM-101', 'Blocks',
+                                              'outwardIssue')))
+        self.assertEqual(len(self.jira.links), 1)
+        self.jira.fail(1, processed=True, method='POST')
+        self.assertIsNone(ticket.create_remote_link(
+            Ticket(ticket_id='RCMTEMPL-1').remote_links))
+        self.assertEqual(len(self.jira.remote_links['RCM-100']), 1)
+
+    def test_write_failure(self):
+        """Test that write failure is reported with JIRA's message."""
+        ticket = Ticket(ticket_id='RCM-100')
+        self.jira.fail(3, method='POST')
+        result = ticket.add_comment('Comment')
+        self.assertEqual(result.status, 'Failure')
+        self.assertIn('Failed', result.error_message)
+        self.assertNotIn('RCM-100', self.jira.comments)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import logging
+import threading
+import time
+import unittest
+
+from cloner.scheduler import Scheduler
+
+
+class TestScheduler(unittest.TestCase):
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.done = []
+        self.lock = threading.Lock()
+
+    def task(self, name, delay=0, fail=False):
+        def run():
+            time.sleep(delay)
+            if fail:
+                raise ValueError(name)
+            with self.lock:
+                self.done.append(name)
+        return run
+
+    def test_dependencies_are_respected(self):
+        """Test that task runs only after its dependencies finished."""
+        scheduler = Scheduler(workers=4)
+        scheduler.add('parent', self.task('parent', delay=0.05))
+        scheduler.add('child-1', self.task('child-1'), ['parent'])
+        scheduler.add('child-2', self.task('child-2'), ['parent', 'child-1'])
+        scheduler.add('other', self.task('other'))
+        self.assertTrue(scheduler.run())
+        self.assertLess(self.done.index('parent'), self.done.index('child-1'))
+        self.assertLess(self.done.index('child-1'),
+                        self.done.index('child-2'))
+        self.assertEqual(len(self.done), 4)
+
+    def test_tasks_run_concurrently(self):
+        """Test that independent tasks run at the same time."""
+        scheduler = Scheduler(workers=5)
+        for i in range(5):
+            scheduler.add(i, self.task(i, delay=0.1))
+        start = time.time()
+        scheduler.run()
+        self.assertLess(time.time() - start, 0.4)
+
+    def test_dependents_of_failed_task_are_skipped(self):
+        """Test that tasks depending on failed task are not run."""
+        scheduler = Scheduler(workers=2)
+        scheduler.add('parent', self.task('parent', fail=True))
+        scheduler.add('child', self.task('child'), ['parent'])
+        scheduler.add('grandchild', self.task('grandchild'), ['child'])
+        scheduler.add('other', self.task('other'))
+        self.assertFalse(scheduler.run())
+        self.assertEqual(self.done, ['other'])
+        self.assertIn('parent', scheduler.failed)
+        self.assertEqual(sorted(scheduler.skipped), ['child', 'grandchild'])
+
+    def test_ordered_tasks_run_after_failed_task(self):
+        """Test that task ordered after failed or skipped task is run."""
+        scheduler = Scheduler(workers=2)
+        scheduler.add('parent', self.task('parent', delay=0.05, fail=True))
+        scheduler.add('child', self.task('child'), ['parent'])
+        scheduler.add('first', self.task('first', delay=0.05, fail=True))
+        scheduler.add('second', self.task('second'), after=['first'])
+        scheduler.add('third', self.task('third'), after=['child'])
+        self.assertFalse(scheduler.run())
+        self.assertEqual(sorted(self.done), ['second', 'third'])
+        self.assertEqual(sorted(scheduler.failed), ['first', 'parent'])
+        self.assertEqual(scheduler.skipped, ['child'])
+
+    def test_unknown_dependencies_are_ignored(self):
+        """Test that dependency on task that was not added is ignored."""
+        scheduler = Scheduler()
+        scheduler.add('task', self.task('task'), ['unknown'])
+        self.assertTrue(scheduler.run())
+        self.assertEqual(self.done, ['task'])
+
+    def test_duplicate_task(self):
+        """Test that task can't be added twice."""
+        scheduler = Scheduler()
+        scheduler.add('task', self.task('task'))
+        with self.assertRaises(ValueError):
+            scheduler.add('task', self.task('task'))
+
+
+if __name__ == '__main__':
+    unittest.main()
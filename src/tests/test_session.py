@@ -0,0 +1,52 @@
+import logging
+import unittest
+
+from mock import MagicMock, patch
+
+from cloner import session
+
+
+class TestSessionPool(unittest.TestCase):
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.patcher = patch('cloner.session._create_session')
+        self.mock_create = self.patcher.start()
+        self.mock_create.side_effect = lambda auth_url, auth: MagicMock()
+
+    def tearDown(self):
+        session.close_sessions()
+        self.patcher.stop()
+
+    def test_session_is_shared_per_server(self):
+        """Test that session is created only once for one server."""
+        s1 = session.get_session('url', 'url/auth')
+        s2 = session.get_session('url', 'url/auth')
+        self.assertIs(s1, s2)
+        self.mock_create.assert_called_once_with('url/auth', 'kerberos')
+
+    def test_session_per_server_and_auth(self):
+        """Test that different servers and credentials get own sessions."""
+        s1 = session.get_session('url', 'url/auth')
+        s2 = session.get_session('other', 'other/auth')
+        s3 = session.get_session('url', 'url', auth=('user', 'pass'))
+        self.assertIsNot(s1, s2)
+        self.assertIsNot(s1, s3)
+
+    def test_failed_authentication_is_not_cached(self):
+        """Test that failed authentication is retried next time."""
+        self.mock_create.side_effect = [None, MagicMock()]
+        self.assertIsNone(session.get_session('url', 'url/auth'))
+        self.assertIsNotNone(session.get_session('url', 'url/auth'))
+
+    def test_close_sessions(self):
+        """Test that closing sessions closes them and forgets projects."""
+        s = session.get_session('url', 'url/auth')
+        session.set_project_verified('url', 'RCMTEMPL')
+        session.close_sessions()
+        s.close.assert_called_once_with()
+        self.assertFalse(session.is_project_verified('url', 'RCMTEMPL'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+import json
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+
+import requests
+from mock import patch
+from StringIO import StringIO
+
+from cloner import session
+from cloner.jira_clone_template_rcm import \
+    search_and_clone_specific_tickets, search_tickets
+from cloner.snapshot import TemplateSnapshot, write_snapshot
+from cloner.ticket import Ticket, set_template_cache
+from cloner.utils import open_snapshot, prepare_inject
+from fake_jira import FakeJira, make_issue
+
+
+class TestSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        task = make_issue('RCMTEMPL-1', summary='<PAV> task',
+                          subtasks=['RCMTEMPL-2', 'RCMTEMPL-3'], pav=['1.0'])
+        task['fields']['customfield_12700'] = [{'value': 'rhel'}]
+        issues = [task,
+                  make_issue('RCMTEMPL-2', issuetype='Sub-task',
+                             parent='RCMTEMPL-1', pav=['1.0']),
+                  make_issue('RCMTEMPL-3', issuetype='Sub-task',
+                             parent='RCMTEMPL-1', pav=['1.0']),
+                  make_issue('RCMTEMPL-10', pav=['2.0'])]
+        self.remote_link = {'object': {'url': 'http://doc', 'title': 'Doc'}}
+        self.jira = FakeJira(issues=issues,
+                             remote_links={'RCMTEMPL-1': [self.remote_link]})
+        self.jira.start()
+        self.patcher = patch('cloner.ticket.STAGE_URL', self.jira.url)
+        self.patcher.start()
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'snapshot', 'templates')
+
+    def tearDown(self):
+        set_template_cache(None)
+        shutil.rmtree(self.directory)
+        self.patcher.stop()
+        session.close_sessions()
+        self.jira.stop()
+
+    def test_write_read(self):
+        """Test that snapshot is written with one search and read by key."""
+        self.assertEqual(write_snapshot(self.path), 4)
+        self.assertEqual(self.jira.count('GET', r'/search$'), 1)
+        self.assertEqual(self.jira.count('GET', r'/RCMTEMPL-\d+$'), 0)
+        self.assertEqual(self.jira.count('GET', r'/remotelink$'), 4)
+        snapshot = TemplateSnapshot(self.path)
+        self.assertEqual(len(snapshot), 4)
+        self.assertEqual(snapshot.get(self.jira.url, 'RCMTEMPL-1'),
+                         self.jira.issues['RCMTEMPL-1'])
+        self.assertEqual(snapshot.get_remote_links(self.jira.url,
+                                                   'RCMTEMPL-1'),
+                         [self.remote_link])
+        self.assertEqual(snapshot.get_remote_links(self.jira.url,
+                                                   'RCMTEMPL-2'), [])
+        self.assertIsNone(snapshot.get('other-url', 'RCMTEMPL-1'))
+        self.assertIsNone(snapshot.get(self.jira.url, 'RCMTEMPL-4'))
+        snapshot.close()
+
+    def test_search(self):
+        """Test that templates are searched by PAV and keywords."""
+        write_snapshot(self.path)
+        snapshot = TemplateSnapshot(self.path)
+        self.assertEqual(snapshot.search(),
+                         ['RCMTEMPL-1', 'RCMTEMPL-2', 'RCMTEMPL-3',
+                          'RCMTEMPL-10'])
+        self.assertEqual(snapshot.search(pav='1.0'),
+                         ['RCMTEMPL-1', 'RCMTEMPL-2', 'RCMTEMPL-3'])
+        self.assertEqual(snapshot.search(without_pav='1.0'), ['RCMTEMPL-10'])
+        self.assertEqual(snapshot.search(pav='1.0', keywords=['rhel']),
+                         ['RCMTEMPL-1'])
+        self.assertEqual(snapshot.search(pav='1.0', keywords=['rhel'],
+                                         subtask_keywords=False),
+                         ['RCMTEMPL-1', 'RCMTEMPL-2', 'RCMTEMPL-3'])
+        self.assertEqual(snapshot.search(keywords=['other'],
+                                         subtask_keywords=False),
+                         ['RCMTEMPL-2', 'RCMTEMPL-3'])
+        snapshot.close()
+
+    def test_invalid_file(self):
+        """Test that other files are refused."""
+        os.makedirs(os.path.dirname(self.path))
+        with open(self.path, 'w') as f:
+            f.write('SQLite format 3\0' * 4)
+        self.assertRaises(ValueError, TemplateSnapshot, self.path)
+
+    @patch('cloner.ticket._get_kerberos_principal')
+    def test_offline(self, mock_principal):
+        """Test that dry run and search don't send any request nor look up
+        Kerberos principal.
+        """
+        write_snapshot(self.path)
+        session.close_sessions()
+        sent = len(self.jira.requests)
+        open_snapshot(self.path, offline=True)
+        mock_principal.reset_mock()
+        search_and_clone_specific_tickets(
+            '1.0', None, 'RCM', prepare_inject({'PAV': '3.0'}), dry_run=True)
+        out = StringIO()
+        self.assertEqual(search_tickets(logging.getLogger(), '1.0', ['rhel'],
+                                        output_format='ndjson', out=out), 1)
+        row = json.loads(out.getvalue())
+        self.assertEqual(row['key'], 'RCMTEMPL-1')
+        self.assertEqual(row['summary'], '<PAV> task')
+        self.assertEqual(len(self.jira.requests), sent)
+        mock_principal.assert_not_called()
+        ticket = Ticket(ticket_id='RCM-1')
+        self.assertRaises(requests.ConnectionError, lambda: ticket.summary)
+
+    def test_clone_from_snapshot(self):
+        """Test that cloning reads templates only from snapshot."""
+        write_snapshot(self.path)
+        self.jira.requests[:] = []
+        open_snapshot(self.path)
+        search_and_clone_specific_tickets(
+            '1.0', None, 'RCM', prepare_inject({'PAV': '3.0'}))
+        self.assertEqual(len(self.jira.created), 3)
+        self.assertEqual(self.jira.count('GET', r'/search$'), 0)
+        self.assertEqual(self.jira.count('GET', r'/RCMTEMPL-\d+$'), 0)
+        self.assertEqual(self.jira.count('GET', r'/remotelink$'), 0)
+        self.assertEqual(self.jira.count('POST', r'/remotelink$'), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+import json
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+
+from mock import MagicMock, patch
+
+from cloner import session
+from cloner.stats import RequestStats, classify, disable_stats, \
+    enable_stats, percentile, report_stats
+from cloner.ticket import Ticket
+from fake_jira import FakeJira, make_issue
+
+
+class TestStats(unittest.TestCase):
+
+    def test_classify(self):
+        """Test that requests are assigned to operations."""
+        issue = 'http://jira/rest/api/2/issue'
+        self.assertEqual(classify('GET', issue + '/RCM-1?fields=status'),
+                         'content')
+        self.assertEqual(classify('PUT', issue + '/RCM-1'), 'update')
+        self.assertEqual(classify('POST', issue), 'create')
+        self.assertEqual(classify('POST', issue + '/bulk'), 'bulk create')
+        self.assertEqual(classify('POST', issue + '/RCM-1/remotelink'),
+                         'remote link')
+        self.assertEqual(classify('POST', issue + '/RCM-1/comment'),
+                         'comment')
+        self.assertEqual(classify('POST', issue + 'Link'), 'link')
+        self.assertEqual(classify('GET', 'http://jira/rest/api/2/search?'
+                                         'jql=x'), 'search')
+        self.assertEqual(classify('GET', 'http://jira/secure/'
+                                         'MoveIssueLink.jspa?id=1'),
+                         'subtask move')
+        self.assertEqual(classify('GET', 'http://jira/step-auth-gss'),
+                         'other')
+
+    def test_percentile(self):
+        """Test nearest rank percentiles."""
+        samples = list(range(1, 101))
+        self.assertEqual(percentile(samples, 50), 50)
+        self.assertEqual(percentile(samples, 99), 99)
+        self.assertEqual(percentile([7], 95), 7)
+        self.assertIsNone(percentile([], 50))
+
+    def test_summary(self):
+        """Test that summary is ordered by total time."""
+        stats = RequestStats()
+        for latency in (0.1, 0.2, 0.3):
+            stats.record('content', latency, received=100)
+        stats.record('create', 1.0, sent=50, failed=True)
+        summary = stats.summary()
+        self.assertEqual(list(summary), ['create', 'content'])
+        self.assertEqual(summary['content']['count'], 3)
+        self.assertEqual(summary['content']['received'], 300)
+        self.assertEqual(summary['content']['p50'], 0.2)
+        self.assertEqual(summary['content']['p99'], 0.3)
+        self.assertEqual(summary['create']['errors'], 1)
+        table = stats.format_table()
+        self.assertEqual(len(table), 3)
+        self.assertTrue(table[0].startswith('operation'))
+        self.assertTrue(table[1].startswith('create '))
+
+
+class TestStatsWithJira(unittest.TestCase):
+    """Tests running against local stand-in JIRA server."""
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.jira = FakeJira(issues=[make_issue('RCMTEMPL-1')])
+        self.jira.start()
+        self.patcher = patch('cloner.ticket.STAGE_URL', self.jira.url)
+        self.patcher.start()
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        disable_stats()
+        shutil.rmtree(self.directory)
+        self.patcher.stop()
+        session.close_sessions()
+        self.jira.stop()
+
+    def test_requests_recorded(self):
+        """Test that every attempt is recorded under its operation."""
+        stats = enable_stats()
+        ticket = Ticket(ticket_id='RCMTEMPL-1')
+        self.jira.fail(1)
+        self.assertEqual(ticket.summary, 'Summary')
+        ticket.add_comment('Comment')
+        summary = stats.summary()
+        self.assertEqual(summary['content']['count'], 2)
+        self.assertEqual(summary['content']['errors'], 1)
+        self.assertGreater(summary['content']['received'], 100)
+        self.assertEqual(summary['comment']['count'], 1)
+        self.assertGreater(summary['comment']['sent'], 0)
+
+        log = MagicMock()
+        path = os.path.join(self.directory, 'stats.json')
+        report_stats(log, path=path)
+        self.assertEqual(log.info.call_count, len(summary) + 2)
+        with open(path) as f:
+            self.assertEqual(json.load(f)['content']['count'], 2)
+
+    def test_disabled(self):
+        """Test that nothing is recorded unless enabled."""
+        Ticket(ticket_id='RCMTEMPL-1').summary
+        self.assertIsNone(enable_stats().summary().get('content'))
+
+
+if __name__ == '__main__':
+    unittest.main()
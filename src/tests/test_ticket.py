@@ -1,11 +1,16 @@
+import copy
 import json
 import logging
+import re
 import requests
 import unittest
 
 from mock import MagicMock, patch
+from ticketutil.ticket import TicketException
 
-from cloner.ticket import Ticket
+from cloner import session, ticket
+from cloner.ticket import Ticket, register_substitution
+from fake_jira import FakeJira, make_issue
 
 
 def open_fake_task_content():
@@ -118,6 +123,38 @@ class FakeSession(object):
                                 subtask=self.subtask)
 
 
+class FakePagedSearchSession(FakeSession):
+    """Mock Requests session returning search results in pages."""
+
+    def __init__(self, total, page_size, failing_start=None):
+        super(FakePagedSearchSession, self).__init__()
+        self.total = total
+        self.page_size = page_size
+        self.failing_start = failing_start
+        self.urls = []
+
+    def get(self, url):
+        self.urls.append(url)
+        response = MagicMock()
+        if '/rest/api/2/search' not in url:
+            return response
+        start_at = int(re.search(r'startAt=(\d+)', url).group(1))
+        if start_at == self.failing_start:
+            response.status_code = 500
+            response.raise_for_status.side_effect = requests.HTTPError(
+                '500 Server Error', response=response)
+            return response
+        end = min(start_at + self.page_size, self.total)
+        response.json.return_value = {
+            'startAt': start_at,
+            'maxResults': self.page_size,
+            'total': self.total,
+            'issues': [{'key': 'ISSUE-{0}'.format(i)}
+                       for i in range(start_at, end)]
+        }
+        return response
+
+
 class TestTaskTicket(unittest.TestCase):
     """Test methods and properties of Task ticket."""
 
@@ -314,6 +351,45 @@ class TestTicketSearch(unittest.TestCase):
         t = Ticket()
         self.assertEqual(['ISSUE-1', 'ISSUE-2'], t.search('valid'))
 
+    @patch('cloner.ticket.Ticket._create_requests_session')
+    def test_search_issues(self, mock_session):
+        """Test that search_issues returns content of found issues."""
+        mock_session.return_value = FakeSession(search=True)
+        t = Ticket()
+        self.assertEqual(FAKE_SEARCH_CONTENT['issues'],
+                         t.search_issues('valid'))
+
+    @patch('cloner.ticket.Ticket._create_requests_session')
+    def test_search_follows_pages(self, mock_session):
+        """Test that search returns results from all pages."""
+        session = FakePagedSearchSession(total=1234, page_size=500)
+        mock_session.return_value = session
+        t = Ticket()
+        expected = ['ISSUE-{0}'.format(i) for i in range(1234)]
+        self.assertEqual(expected, t.search('valid'))
+        search_urls = [url for url in session.urls if 'search' in url]
+        self.assertEqual(len(search_urls), 3)
+
+    @patch('cloner.ticket.Ticket._create_requests_session')
+    def test_iter_search_with_capped_page_size(self, mock_session):
+        """Test that iter_search follows page size returned by server."""
+        mock_session.return_value = FakePagedSearchSession(total=250,
+                                                           page_size=100)
+        t = Ticket()
+        issues = list(t.iter_search('valid', page_size=1000))
+        self.assertEqual([i['key'] for i in issues],
+                         ['ISSUE-{0}'.format(i) for i in range(250)])
+
+    @patch('cloner.ticket.Ticket._create_requests_session')
+    def test_iter_search_with_failed_page(self, mock_session):
+        """Test that iter_search raises when a middle page fails."""
+        mock_session.return_value = FakePagedSearchSession(
+            total=300, page_size=100, failing_start=100)
+        t = Ticket()
+        issues = t.iter_search('valid', page_size=100)
+        with self.assertRaises(TicketException):
+            list(issues)
+
     @patch('cloner.ticket.Ticket._create_requests_session')
     @patch('cloner.ticket.Ticket._verify_project')
     def test_search_with_invalid_query(self, mock_verify, mock_session):
@@ -325,6 +401,93 @@ class TestTicketSearch(unittest.TestCase):
         self.assertEqual('Failure', result.status)
 
 
+class TestTicketFromContent(unittest.TestCase):
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+
+    @patch('cloner.ticket.Ticket._create_requests_session')
+    def test_from_content(self, mock_session):
+        """Test that ticket created from content doesn't request it again."""
+        mock_session.return_value = MagicMock(spec=requests.Session)
+        content = open_fake_task_content()
+        t = Ticket.from_content(content, custom_substitutions={'A': 'B'})
+        self.assertEqual(t.ticket_id, 'RCMTEMPL-1690')
+        self.assertEqual(t.content, content)
+        self.assertEqual(t.custom_substitutions, {'A': 'B'})
+        for args, _ in t.s.get.call_args_list:
+            self.assertNotIn('/issue/', args[0])
+
+
+class TestSubstitution(unittest.TestCase):
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.patcher = patch('cloner.ticket.Ticket._create_requests_session')
+        self.patcher.start()
+        content = {'key': 'RCMTEMPL-1', 'fields': {
+            'summary': '<PAV> summary', 'description': None,
+            'customfield_11911': [{'value': 'PAV-1'}]}}
+        self.t = Ticket.from_content(content,
+                                     custom_substitutions={
+                                         'CUSTOM_TEXT': r'<PAV> \1'})
+
+    def tearDown(self):
+        self.patcher.stop()
+
+    def test_single_pass(self):
+        """Test that substituted values are not substituted again."""
+        self.assertEqual(
+            self.t.get_substituted_string('<CUSTOM_TEXT>/<PAV>/<KEYWORD>'),
+            r'<PAV> \1/PAV-1/<KEYWORD>')
+
+    def test_values_memoized(self):
+        """Test that value of variable is computed once per content."""
+        callback = MagicMock(return_value='X')
+        with patch.dict(ticket.SUPPORTED_VAR_SUBSTITUTIONS,
+                        {r'<PAV>': callback}):
+            self.t.get_substituted_string('<PAV> <PAV>')
+            self.t.substitute_fields()
+            self.assertEqual(callback.call_count, 1)
+            self.t.content = copy.deepcopy(self.t.content)
+            self.t.get_substituted_string('<PAV>')
+            self.assertEqual(callback.call_count, 2)
+
+    def test_register_substitution(self):
+        """Test that registered variables are substituted."""
+        with patch.dict(ticket.SUPPORTED_VAR_SUBSTITUTIONS):
+            register_substitution('KEY', lambda t: t.ticket_id)
+            self.assertEqual(self.t.get_substituted_string('<KEY>:<PAV>'),
+                             'RCMTEMPL-1:PAV-1')
+        self.assertEqual(self.t.get_substituted_string('<KEY>'), '<KEY>')
+
+    def test_prepare_clone_compiled_once(self):
+        """Test that template is cleaned once and cloned for different
+        PAVs.
+        """
+        self.t.content['fields']['updated'] = '2018-01-01T00:00:00.000+0000'
+        new = Ticket(project='RCM')
+        new._user = 'anon'
+        with patch.object(Ticket, 'remove_unwanted_fields',
+                          autospec=True) as mock_remove:
+            new.prepare_clone(self.t, inject={
+                'customfield_11911': [{'value': 'PAV-2'}]})
+            self.assertEqual(new.content['fields']['summary'],
+                             'PAV-2 summary')
+            new.prepare_clone(self.t, inject={
+                'customfield_11911': [{'value': 'PAV-3'}]})
+            self.assertEqual(new.content['fields']['summary'],
+                             'PAV-3 summary')
+        mock_remove.assert_called_once()
+        self.assertEqual(self.t.summary, '<PAV> summary')
+
+    def test_empty_field(self):
+        """Test that missing fields are left as they are."""
+        self.t.substitute_fields()
+        self.assertEqual(self.t.summary, 'PAV-1 summary')
+        self.assertIsNone(self.t.description)
+
+
 class TestTicketRemoteLinks(unittest.TestCase):
 
     def setUp(self):
@@ -347,6 +510,36 @@ class TestTicketRemoteLinks(unittest.TestCase):
         t = Ticket()
         self.assertIsNone(t.remote_links)
 
+    @patch('cloner.ticket.Ticket._create_requests_session')
+    def test_remote_links_requested_once(self, mock_session):
+        """Test that remote links are requested only once."""
+        mock_session.return_value = FakeSession(remote_links=True)
+        t = Ticket()
+        with patch.object(t, '_get_remote_links',
+                          return_value=FAKE_REMOTE_LINKS) as mock_get:
+            t.remote_links
+            t.remote_links
+        mock_get.assert_called_once()
+
+    # MagicMock session is not thread-safe, links are created serially
+    @patch('cloner.ticket.map_concurrently',
+           side_effect=lambda func, items, **kwargs: map(func, items))
+    @patch('cloner.ticket.Ticket._create_requests_session')
+    def test_create_remote_link_keeps_input(self, mock_session, mock_map):
+        """Test that links are created without 'id' and 'self' and passed
+        links are not modified.
+        """
+        mock_session.return_value = MagicMock()
+        t = Ticket()
+        t.ticket_id = 'ID'
+        links = copy.deepcopy(FAKE_REMOTE_LINKS)
+        self.assertIsNone(t.create_remote_link(links))
+        self.assertEqual(links, FAKE_REMOTE_LINKS)
+        self.assertEqual(t.s.post.call_count, len(links))
+        for args, kwargs in t.s.post.call_args_list:
+            self.assertNotIn('id', kwargs['json'])
+            self.assertNotIn('self', kwargs['json'])
+
 
 class TestCallsToSession(unittest.TestCase):
     """Tests for methods that do calls to ticket.s but don't care about
@@ -364,6 +557,9 @@ class TestCallsToSession(unittest.TestCase):
         # need to reset get() because it was called during Ticket.__init__
         self.t.s.get.reset_mock()
 
+    def tearDown(self):
+        self.patcher.stop()
+
     def test_add_pav(self):
         """Test that method calls right method."""
         self.t.add_pav("spam-1.0")
@@ -372,6 +568,43 @@ class TestCallsToSession(unittest.TestCase):
             json={'update': {'customfield_11911':
                             [{'add': {'value': 'spam-1.0'}}]}})
 
+    def test_create_bulk(self):
+        """Test that bulk create maps created tickets and errors back to
+        payloads.
+        """
+        response = MagicMock(status_code=400)
+        response.json.return_value = {
+            'issues': [{'key': 'RCM-1'}, {'key': 'RCM-3'}],
+            'errors': [{'failedElementNumber': 1,
+                        'elementErrors': {'errorMessages': [],
+                                          'errors': {'summary': 'required'}}}]
+        }
+        self.t.s.post.return_value = response
+        results = self.t.create_bulk([{'fields': {'a': 1}},
+                                      {'fields': {}},
+                                      {'fields': {'a': 3}}])
+        self.t.s.post.assert_called_once_with(
+            '{0}/bulk'.format(self.t.rest_url),
+            json={'issueUpdates': [{'fields': {'a': 1}}, {'fields': {}},
+                                   {'fields': {'a': 3}}]})
+        self.assertEqual(results[0], 'RCM-1')
+        self.assertEqual(results[1].status, 'Failure')
+        self.assertEqual(results[1].error_message,
+                         'Error creating ticket - required')
+        self.assertEqual(results[2], 'RCM-3')
+
+    @patch('cloner.ticket.BULK_CREATE_SIZE', 2)
+    def test_create_bulk_in_batches(self):
+        """Test that payloads are sent in batches."""
+        response = MagicMock(status_code=201)
+        response.json.side_effect = [
+            {'issues': [{'key': 'RCM-1'}, {'key': 'RCM-2'}], 'errors': []},
+            {'issues': [{'key': 'RCM-3'}], 'errors': []}]
+        self.t.s.post.return_value = response
+        results = self.t.create_bulk([{}, {}, {}])
+        self.assertEqual(self.t.s.post.call_count, 2)
+        self.assertEqual(results, ['RCM-1', 'RCM-2', 'RCM-3'])
+
     def test_change_subtask_position_with_subtask_ticket(self):
         """Test that subtask positions are not changed if called with subtask.
         """
@@ -446,5 +679,61 @@ class TestCallsToSession(unittest.TestCase):
                 self.t.verify_position(-1)
             _raw_input.assert_called()
 
+
+class TestLazyContent(unittest.TestCase):
+    """Tests running against local stand-in JIRA server."""
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.jira = FakeJira(issues=[make_issue('RCMTEMPL-1')])
+        self.jira.start()
+        self.patcher = patch('cloner.ticket.STAGE_URL', self.jira.url)
+        self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+        session.close_sessions()
+        self.jira.stop()
+
+    def test_content_requested_on_access(self):
+        """Test that content is requested once when it is first needed."""
+        t = Ticket(ticket_id='RCMTEMPL-1')
+        self.assertEqual(self.jira.count('GET', '/issue/'), 0)
+        self.assertEqual(t.summary, 'Summary')
+        self.assertEqual(t.status, 'Open')
+        self.assertEqual(self.jira.count('GET', '/issue/RCMTEMPL-1$'), 1)
+
+    def test_fields_projection(self):
+        """Test that only requested fields are loaded, missing fields are
+        requested when needed and whole content can be loaded later.
+        """
+        t = Ticket(ticket_id='RCMTEMPL-1', fields=['status'])
+        self.assertEqual(t.status, 'Open')
+        self.assertEqual(list(t.content['fields']), ['status'])
+        self.assertEqual(t.summary, 'Summary')
+        self.assertEqual(sorted(t.content['fields']), ['status', 'summary'])
+        self.assertEqual(t.status, 'Open')
+        self.assertEqual(self.jira.count('GET', '/issue/RCMTEMPL-1$'), 2)
+        t.load_content()
+        self.assertIn('issuelinks', t.content['fields'])
+        self.assertEqual(t.links, [])
+        self.assertEqual(self.jira.count('GET', '/issue/RCMTEMPL-1$'), 3)
+
+    def test_clone_projected_template(self):
+        """Test that template with some fields loaded is cloned whole."""
+        template = Ticket(ticket_id='RCMTEMPL-1', fields=['status'])
+        self.assertEqual(template.status, 'Open')
+        Ticket(project='RCM').clone(template)
+        self.assertEqual(self.jira.created, ['RCM-1'])
+        self.assertEqual(self.jira.issues['RCM-1']['fields']['description'],
+                         'Description of RCMTEMPL-1')
+
+    def test_invalid_ticket(self):
+        """Test that missing ticket is reported when content is needed."""
+        t = Ticket(ticket_id='RCMTEMPL-99')
+        with self.assertRaises(TicketException):
+            t.content
+
+
 if __name__ == '__main__':
     unittest.main()
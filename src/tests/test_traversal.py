@@ -0,0 +1,126 @@
+import logging
+import unittest
+
+from mock import patch
+
+from cloner.cloner import Cloner
+from cloner.traversal import Traversal
+
+
+class FakeTemplate(object):
+    """Template with only attributes used by traversal."""
+
+    def __init__(self, ticket_id, parent_id=None, subtask_ids=(), links=(),
+                 status='Open'):
+        self.ticket_id = ticket_id
+        self.parent_id = parent_id
+        self.subtask_ids = list(subtask_ids)
+        self.links = list(links)
+        self.status = status
+
+
+def make_templates(*templates):
+    return dict((t.ticket_id, t) for t in templates)
+
+
+class TestTraversal(unittest.TestCase):
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.templates = make_templates(
+            FakeTemplate('T-1', subtask_ids=['T-2', 'T-3'],
+                         links=[('T-4', 'Blocks', 'outwardIssue'),
+                                ('T-5', 'Blocks', 'inwardIssue')]),
+            FakeTemplate('T-2', parent_id='T-1'),
+            FakeTemplate('T-3', parent_id='T-1'),
+            FakeTemplate('T-4', subtask_ids=['T-6'],
+                         links=[('T-1', 'Blocks', 'inwardIssue')]),
+            FakeTemplate('T-5', status='Deprecated'),
+            FakeTemplate('T-6', parent_id='T-4'),
+        )
+
+    def test_order(self):
+        """Test that tickets are visited depth-first, subtasks before links,
+        and links are recorded after linked ticket is visited.
+        """
+        traversal = Traversal([self.templates['T-1']], self.templates.get)
+        visited = [(t.ticket_id, parent) for t, parent in traversal]
+        self.assertEqual(visited, [('T-1', None), ('T-2', 'T-1'),
+                                   ('T-3', 'T-1'), ('T-4', None),
+                                   ('T-6', 'T-4')])
+        self.assertEqual(traversal.links, [
+            ('T-4', 'T-1', 'Blocks', 'inwardIssue'),
+            ('T-1', 'T-4', 'Blocks', 'outwardIssue'),
+            ('T-1', 'T-5', 'Blocks', 'inwardIssue')])
+
+    def test_subtask_visits_parent_first(self):
+        """Test that subtask is reached through its parent."""
+        traversal = Traversal([self.templates['T-3']], self.templates.get)
+        visited = [t.ticket_id for t, parent in traversal]
+        self.assertEqual(visited[:3], ['T-1', 'T-2', 'T-3'])
+
+    def test_matched(self):
+        """Test that not matched tickets are not even fetched."""
+        fetched = []
+
+        def get_template(ticket_id):
+            fetched.append(ticket_id)
+            return self.templates[ticket_id]
+        traversal = Traversal([self.templates['T-1']], get_template,
+                              matched={'T-1', 'T-3'})
+        visited = [t.ticket_id for t, parent in traversal]
+        self.assertEqual(visited, ['T-1', 'T-3'])
+        self.assertEqual(fetched, ['T-3'])
+
+    def test_frontier(self):
+        """Test that frontier contains tickets waiting to be visited."""
+        traversal = Traversal([self.templates['T-1']], self.templates.get)
+        iterator = iter(traversal)
+        next(iterator)
+        self.assertEqual(traversal.frontier, ['T-2', 'T-3', 'T-4', 'T-5'])
+        next(iterator)
+        next(iterator)
+        self.assertEqual(traversal.frontier, ['T-4', 'T-5'])
+
+    def test_deep_links(self):
+        """Test that long chain of links doesn't hit recursion limit."""
+        templates = make_templates(*[
+            FakeTemplate('T-{0}'.format(i),
+                         links=[('T-{0}'.format(i + 1), 'Blocks',
+                                 'outwardIssue')])
+            for i in range(5000)])
+        templates['T-5000'] = FakeTemplate('T-5000')
+        traversal = Traversal([templates['T-0']], templates.get)
+        self.assertEqual(len(list(traversal)), 5001)
+        self.assertEqual(len(traversal.links), 5000)
+
+
+class TestClonerTraversal(unittest.TestCase):
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+
+    def test_fetch_frontier(self):
+        """Test that missing templates are fetched together with the rest of
+        the frontier.
+        """
+        templates = make_templates(
+            FakeTemplate('T-1', subtask_ids=['T-2', 'T-3']),
+            FakeTemplate('T-2', parent_id='T-1'),
+            FakeTemplate('T-3', parent_id='T-1'))
+        cloner = Cloner([templates['T-1']], 'RCM')
+        cloner._resolved = True
+        fetches = []
+
+        def fetch_tickets(ticket_ids, **kwargs):
+            fetches.append(ticket_ids)
+            return dict((i, templates[i]) for i in ticket_ids)
+        with patch('cloner.cloner.fetch_tickets', fetch_tickets):
+            collected = cloner.collect_tickets()
+        self.assertEqual([t.ticket_id for t, parent in collected],
+                         ['T-1', 'T-2', 'T-3'])
+        self.assertEqual(fetches, [['T-2', 'T-3']])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,7 +2,7 @@ import unittest
 from mock import patch, MagicMock
 
 from cloner.utils import prepare_inject, get_ticket_IDs, \
-    get_ticket_IDs_specific
+    get_ticket_IDs_specific, get_tickets_specific
 
 
 class TestUtils(unittest.TestCase):
@@ -46,6 +46,23 @@ class TestUtils(unittest.TestCase):
             '((issuetype="Sub-task") or (issuetype!="Sub-task" and '
             '"Keyword"="spam" and "Keyword"="eggs"))')
 
+    @patch('cloner.ticket.Ticket.search_issues')
+    @patch('cloner.ticket.Ticket._create_requests_session')
+    def test_get_tickets_specific(self, mock_session, mock_search):
+        """Test that get_tickets_specific() creates tickets from search
+        results.
+        """
+        mock_session.return_value = MagicMock()
+        mock_search.return_value = [{'key': 'RCMTEMPL-1', 'fields': {}},
+                                    {'key': 'RCMTEMPL-2', 'fields': {}}]
+        tickets = get_tickets_specific('spam-1.0')
+        mock_search.assert_called_with('project=RCMTEMPL and '
+                                       '"Product Affects Version"="spam-1.0"')
+        self.assertEqual([t.ticket_id for t in tickets],
+                         ['RCMTEMPL-1', 'RCMTEMPL-2'])
+        self.assertEqual(tickets[0].content, {'key': 'RCMTEMPL-1',
+                                              'fields': {}})
+
     @patch('cloner.ticket.Ticket.search')
     @patch('cloner.ticket.Ticket._create_requests_session')
     def test_get_tickets_query_formatting(self, mock_session, mock_search):
@@ -0,0 +1,63 @@
+import threading
+import unittest
+
+from cloner.workers import imap_concurrently, map_concurrently, \
+    map_streaming
+
+
+class TestWorkers(unittest.TestCase):
+
+    def test_map_concurrently_keeps_order(self):
+        """Test that results are returned in order of items."""
+        self.assertEqual(map_concurrently(lambda x: x * 2, range(20)),
+                         [x * 2 for x in range(20)])
+
+    def test_imap_concurrently_unordered(self):
+        """Test that all results are yielded when order is not required."""
+        results = imap_concurrently(lambda x: x * 2, range(20),
+                                    ordered=False)
+        self.assertEqual(sorted(results), [x * 2 for x in range(20)])
+
+    def test_imap_concurrently_single_worker(self):
+        """Test that work is done in calling thread with one worker."""
+        self.assertEqual(list(imap_concurrently(str, [1, 2], workers=1)),
+                         ['1', '2'])
+
+    def test_exception_is_reraised(self):
+        """Test that exception raised in worker is raised to consumer."""
+        def fail(x):
+            raise ValueError(x)
+        with self.assertRaises(ValueError):
+            map_concurrently(fail, [1, 2, 3])
+
+    def test_map_streaming_starts_before_last_item(self):
+        """Test that work on items starts before all of them are produced."""
+        started = threading.Event()
+
+        def items():
+            yield 1
+            # next item is produced only once work on the first one started
+            self.assertTrue(started.wait(5))
+            yield 2
+
+        def double(x):
+            started.set()
+            return x * 2
+        self.assertEqual(map_streaming(double, items()), [(1, 2), (2, 4)])
+
+    def test_map_streaming_items_fail(self):
+        """Test that exception of items is re-raised once started work is
+        finished.
+        """
+        done = []
+
+        def items():
+            yield 1
+            raise ValueError()
+        with self.assertRaises(ValueError):
+            map_streaming(done.append, items())
+        self.assertEqual(done, [1])
+
+
+if __name__ == '__main__':
+    unittest.main()